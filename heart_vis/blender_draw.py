@@ -1,12 +1,16 @@
 #blender_draw.py
 import bpy
-import bmesh
 from bpy.app.handlers import persistent # For the driver expression script
 
 import numpy as np
+import time
 
 from heart_vis.config import *
-from heart_vis.data_processing import make_montage, get_subvolume,sample_field_vals
+from heart_vis.data_processing import make_montage, get_subvolume,sample_field_vals, scale_cube_dims
+from heart_vis.pyramid import level_factor
+from heart_vis.tracing import compute_streamlines, voxel_valid, gather
+from heart_vis.simplify import simplify_streamlines
+from heart_vis.glyph_layout import glyph_fraction, glyph_grid_steps, sample_mask
 from heart_vis.convenience_funcs import *
 
 '''
@@ -39,15 +43,10 @@ def stream2curve(coords, collection_label, cmap_val=None):
     polyline.points.add(len(coords[:,0])-1)
     polyline.use_endpoint_u = True
 
-    for i in range(len(coords[:,0])):
-
-        x = (coords[i][0])# * xy_scale
-        y = (coords[i][1])# * xy_scale
-        z = (coords[i][2])# * z_scale
-
-        if(x + y + z > 0):
-
-            polyline.points[i].co = (x, y, z, 1)
+    # Set all the control points at once: x, y, z, weight
+    co = np.ones((len(coords[:,0]), 4), dtype=np.float32)
+    co[:, :3] = coords
+    polyline.points.foreach_set('co', co.ravel())
 
     # create Object
     curveOB = bpy.data.objects.new('myCurve', curveData)
@@ -70,6 +69,92 @@ def stream2curve(coords, collection_label, cmap_val=None):
 
     return curveOB
 
+def cmap_material(pass_index, base='streamtube'):
+
+    '''
+    Copy of the base material for one colormap value, so that the splines of one
+    curve object can have different colors: the copy has the value as its
+    pass_index, and its shader reads the Material Index of the Object Info node
+    where the base material reads the Object Index.
+
+    Input:
+        pass_index: int; colormap value (0-255 color range, as the object pass_index)
+        base: str; name of the material to copy
+
+    Returns:
+        material
+    '''
+
+    name = base + '_' + str(pass_index)
+    mat = bpy.data.materials.get(name)
+
+    if mat is None:
+        mat = bpy.data.materials.get(base).copy()
+        mat.name = name
+        mat.pass_index = pass_index
+
+        if mat.node_tree is not None:
+            for link in list(mat.node_tree.links):
+                if link.from_node.type == 'OBJECT_INFO' and link.from_socket.name == 'Object Index':
+                    mat.node_tree.links.new(link.from_node.outputs['Material Index'], link.to_socket)
+
+    return mat
+
+def streams2curves(streams, inds, collection_label, batch=CURVE_BATCH):
+
+    '''
+    Draw many streamlines as the splines of a few curve objects.
+
+    The control points of each spline are set at once with foreach_set, and the
+    colormap value of each streamline is its spline's material index, into a
+    material per value (see cmap_material()) instead of the object pass_index.
+
+    Input:
+        streams: Streamlines (see tracing.py)
+        inds: array; indices of the streamlines to draw (with at least 2 points)
+        collection_label: str; collection to link the curve objects to
+        batch: int; maximum number of streamlines per curve object
+
+    Returns:
+        list of curve objects
+    '''
+
+    objects = []
+
+    for b0 in range(0, len(inds), batch):
+
+        batch_inds = inds[b0:b0 + batch]
+
+        curveData = bpy.data.curves.new('streamlines', type='CURVE')
+        curveData.dimensions = '3D'
+        curveData.resolution_u = 2
+        curveData.bevel_depth = TUBE_BEVEL
+
+        # One material slot per colormap value of the batch
+        pass_inds = (streams.cmap_vals[batch_inds] * 255).astype(int) # Express in 0-255 color range.
+        values = np.unique(pass_inds)
+        for value in values:
+            curveData.materials.append(cmap_material(int(value)))
+        slots = np.searchsorted(values, pass_inds)
+
+        for ind, slot in zip(batch_inds, slots):
+
+            coords = streams.line(ind)
+            co = np.ones((len(coords), 4), dtype=np.float32) # x, y, z, weight
+            co[:, :3] = coords
+
+            polyline = curveData.splines.new(type='NURBS')
+            polyline.points.add(len(coords) - 1)
+            polyline.points.foreach_set('co', co.ravel())
+            polyline.use_endpoint_u = True
+            polyline.material_index = int(slot)
+
+        curveOB = bpy.data.objects.new('streamlines', curveData)
+        bpy.data.collections[collection_label].objects.link(curveOB)
+        objects.append(curveOB)
+
+    return objects
+
 def animate_curve(t0, t1,persistent=False):
 
     '''
@@ -154,8 +239,14 @@ def drawVerts(data,label = 'Vers',incr=1):
 
     '''
     Load point clouds into a non-mesh cloud of vertices.
+
+    The vertices are set at once (foreach_set) from a contiguous float32 array
+    of every incr-th point of data.
     '''
 
+    # NOTE the inversion OR LACK
+    coords = np.ascontiguousarray(np.asarray(data)[::incr, :3], dtype=np.float32)
+
     mesh = bpy.data.meshes.new("Mesh")  # add a new mesh
     obj = bpy.data.objects.new(label, mesh)  # add a new object using the mesh
 
@@ -163,39 +254,206 @@ def drawVerts(data,label = 'Vers',incr=1):
     bpy.context.view_layer.objects.active = obj
     obj.select_set(True)
 
-    mesh = bpy.context.object.data
-    bm = bmesh.new()
+    mesh.vertices.add(len(coords))
+    mesh.vertices.foreach_set('co', coords.ravel())
+    mesh.update()
+
+    return obj
 
-    for i in range(0,len(data[:,0]),incr):
 
-        # NOTE the inversion OR LACK
+def draw_mask(mask,n_points=MASK_POINTS):
 
-        x = (data[i][0])# - x_offset) / xy_scale
-        y = (data[i][1])# - y_offset) / xy_scale
-        z = (data[i][2])# - z_offset) / z_scale
+    '''
+    Represent the volume of the input mask as a point cloud of sample vertices
+    from within the mask (n_points of them, see glyph_layout.sample_mask()).
+    '''
 
-        bm.verts.new([x, y, z])  # add a new vert
+    assert mask.ndim == 3, 'Error, perhaps not properly rotated array?'
 
-    # make the bmesh the object's mesh
-    bm.to_mesh(mesh)
-    bm.free()  # always do this when finished
+    mask_inds = sample_mask(mask, n_points)
+    print('Mask point cloud: ', len(mask_inds), ' points')
 
+    return drawVerts(mask_inds, label='Mask')
 
-def draw_mask(mask,incr=100):
+
+def instancer_material(base, attribute='pass_index'):
 
     '''
-    Represent the volume of the input mask as a point cloud of sample vertices
-    from within the mask.
+    Copy of the base material for instanced objects: its shader reads the
+    instancer's attribute (an Attribute node of type Instancer) where the base
+    material reads the Object Index of the Object Info node, since the instances
+    of a point cloud share the pass_index of their object.
+
+    Input:
+        base: str; name of the material to copy
+        attribute: str; name of the point attribute holding the colormap value
+
+    Returns:
+        material
+    '''
+
+    name = base + '_instanced'
+    mat = bpy.data.materials.get(name)
+
+    if mat is None:
+        mat = bpy.data.materials.get(base).copy()
+        mat.name = name
+
+        if mat.node_tree is not None:
+            for link in list(mat.node_tree.links):
+                if link.from_node.type == 'OBJECT_INFO' and link.from_socket.name == 'Object Index':
+                    attr = mat.node_tree.nodes.new('ShaderNodeAttribute')
+                    attr.attribute_type = 'INSTANCER'
+                    attr.attribute_name = attribute
+                    attr.location = link.from_node.location
+                    mat.node_tree.links.new(attr.outputs['Fac'], link.to_socket)
+
+    return mat
+
+def glyph_point_cloud(positions, rotations, pass_inds, collection, name='glyph_points'):
+
+    '''
+    Create a mesh object with a vertex per glyph, filled in bulk, carrying the
+    glyph rotation (Euler XYZ, 'rotation') and colormap value ('pass_index')
+    as point attributes.
+
+    Input:
+        positions: (n,3) array; glyph locations
+        rotations: (n,3) array; glyph rotations (Euler XYZ, radians)
+        pass_inds: (n,) array; colormap values (0-255 color range)
+        collection: collection to link the object to
+
+    Returns:
+        object
+    '''
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set('co', np.asarray(positions, dtype=np.float32).ravel())
+
+    rot = mesh.attributes.new('rotation', 'FLOAT_VECTOR', 'POINT')
+    rot.data.foreach_set('vector', np.asarray(rotations, dtype=np.float32).ravel())
+
+    cmap = mesh.attributes.new('pass_index', 'FLOAT', 'POINT')
+    cmap.data.foreach_set('value', np.asarray(pass_inds, dtype=np.float32))
+
+    mesh.update()
+
+    points_obj = bpy.data.objects.new(name, mesh)
+    collection.objects.link(points_obj)
+
+    return points_obj
+
+def instance_glyphs(points_obj, glyph_obj, ctrl=None):
+
+    '''
+    Instance glyph_obj on the vertices of points_obj with a geometry nodes
+    modifier (Blender 3.0+), rotated by their 'rotation' attribute. The point
+    attributes are passed on to the instances (see instancer_material()).
+
+    Input:
+        points_obj: object from glyph_point_cloud()
+        glyph_obj: object to instance
+        ctrl: (optional) object whose scale is the scale of every glyph, as the
+            scale drivers of the copied glyphs.
+    '''
+
+    group = bpy.data.node_groups.new('glyph_instances', 'GeometryNodeTree')
+
+    if hasattr(group, 'interface'): # Blender 4.0+
+        group.interface.new_socket('Geometry', in_out='INPUT', socket_type='NodeSocketGeometry')
+        group.interface.new_socket('Geometry', in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    else:
+        group.inputs.new('NodeSocketGeometry', 'Geometry')
+        group.outputs.new('NodeSocketGeometry', 'Geometry')
+
+    nodes = group.nodes
+    links = group.links
+
+    group_in = nodes.new('NodeGroupInput')
+    group_out = nodes.new('NodeGroupOutput')
+    instance = nodes.new('GeometryNodeInstanceOnPoints')
+
+    glyph = nodes.new('GeometryNodeObjectInfo')
+    glyph.inputs['Object'].default_value = glyph_obj
+
+    rotation = nodes.new('GeometryNodeInputNamedAttribute')
+    rotation.data_type = 'FLOAT_VECTOR'
+    rotation.inputs['Name'].default_value = 'rotation'
+    rotation_out = [out for out in rotation.outputs if out.enabled][0] # (One output per data type before 4.0)
+
+    links.new(group_in.outputs[0], instance.inputs['Points'])
+    links.new(glyph.outputs['Geometry'], instance.inputs['Instance'])
+    links.new(rotation_out, instance.inputs['Rotation'])
+
+    if ctrl is not None:
+        scale = nodes.new('GeometryNodeObjectInfo')
+        scale.inputs['Object'].default_value = ctrl
+        links.new(scale.outputs['Scale'], instance.inputs['Scale'])
+
+    links.new(instance.outputs['Instances'], group_out.inputs[0])
+
+    mod = points_obj.modifiers.new('glyphs', 'NODES')
+    mod.node_group = group
+
+def scale_drivers(obj, ctrl):
+
+    '''
+    Drive the X, Y, Z scale of obj by the scale of ctrl. Copies of obj keep
+    the drivers, so they are only set up once on a glyph template.
+
+    (Scaling a mesh shared by the copies with driven shape keys needs only three
+    drivers, but every copy then re-evaluates the mesh, which measured twice as
+    slow on a ctrl scale change as the three drivers per copy.)
+
+    Input:
+        obj: object that the glyphs are copies of
+        ctrl: object (empty) whose X, Y, Z scale is the scale of the glyphs
+    '''
+
+    for t, val in enumerate(['X', 'Y', 'Z']):
+
+        driv = obj.driver_add("scale", t).driver
+        driv.type = 'SCRIPTED'
+
+        dist = driv.variables.new()
+        dist.name = "var"
+        dist.type = 'TRANSFORMS'
+
+        dist.targets[0].id = ctrl
+        dist.targets[0].transform_type = 'SCALE_'+ val
+        driv.expression = "var"
+
+def time_scale_updates(ctrl, n_updates=10):
+
     '''
+    Measure the average time to update the scene after a change of the ctrl
+    scale, which re-evaluates the glyph scales (called after drawing the glyphs
+    if MEASURE_FRAME_TIME). Frame changes don't re-evaluate the scale drivers.
+
+    Returns:
+        float; milliseconds per update
+    '''
+
+    layer = bpy.context.view_layer
+    scale = tuple(ctrl.scale)
+    layer.update()
 
-    inds = np.where(mask > 0)
-    mask_inds = np.transpose(np.asarray(inds))
-    assert mask_inds.shape[1] == 3, 'Error, perhaps not properly rotated array?'
+    t_start = time.time()
+    for i in range(n_updates):
+        f = 1.1 if i % 2 == 0 else 1
+        ctrl.scale = tuple(v * f for v in scale)
+        layer.update()
+    dt = (time.time() - t_start) / n_updates * 1000
 
-    drawVerts(mask_inds, label='Mask', incr=incr)
+    ctrl.scale = scale
+    layer.update()
+    print('Glyph scale update: %.1f ms (average of %d updates, %d objects in the scene)'
+          % (dt, n_updates, len(bpy.context.scene.objects)))
 
+    return dt
 
-def dense_glyph_volume(field, meshcube, mask, dims, driver=True, downsample=False, label=''):
+def dense_glyph_volume(field, meshcube, mask, dims, driver=True, downsample=False, label='', level=0, cont=None):
 
     '''
     Draw Glyphs for every value from a volume.
@@ -204,6 +462,12 @@ def dense_glyph_volume(field, meshcube, mask, dims, driver=True, downsample=Fals
         meshcube: tuple (xx,yy,zz) of the index psitions for each voxel of the subvolume
                 with respect to the original field array.
         driver: Boolean, whether or not to apply a driver to the scale
+        level: int; pyramid level of field and mask (see pyramid.py). Glyph positions
+                stay in full resolution coordinates.
+        cont: (optional) ContinuationMask of field and mask, replacing the mask
+                and FILT_VECT checks.
+    With GLYPH_INSTANCING, the glyphs are instances of the cylinder on a single
+    point cloud object (see instance_glyphs()) instead of a copy of it each.
     Q: Does it make sense to use the meshcube regerring to original field values?
 
     '''
@@ -216,10 +480,21 @@ def dense_glyph_volume(field, meshcube, mask, dims, driver=True, downsample=Fals
     yy = meshcube[1]
     zz = meshcube[2]
 
+    f = level_factor(level)
+
     # Calculate appropriate gkyph scaling based on downsampling.
     n_voxels = (window_x * window_y * depth)
     print('input volume n_voxels:', n_voxels)
-    ds_fact = n_voxels / N_GLYPHS
+
+    # When downsampling, the N_GLYPHS budget counts only the points in the mask,
+    # the grid is denser by the inverse of their fraction
+    n_grid = N_GLYPHS
+    if(downsample):
+        frac = glyph_fraction(field, mask, dims, f, cont)
+        n_grid = N_GLYPHS / max(frac, N_GLYPHS / n_voxels)
+        print('Fraction of the cube in the mask: ', round(frac, 3), ', grid points: ', int(n_grid))
+
+    ds_fact = n_voxels / n_grid
     GLYPH_DIM_BASE = 0.05 #Works well for native resolution
     glyph_dim = GLYPH_DIM_BASE * ds_fact / 20
 
@@ -234,7 +509,7 @@ def dense_glyph_volume(field, meshcube, mask, dims, driver=True, downsample=Fals
 
     #obj = bpy.context.selected_objects[0] # Object to be the glyph, must be selected
     obj = bpy.data.objects["Cylinder"]
-    mat = bpy.data.materials.get('Glyph')
+    mat = instancer_material('Glyph') if GLYPH_INSTANCING else bpy.data.materials.get('Glyph')
     obj.data.materials.append(mat)
 
     parent_coll = bpy.context.selected_objects[0].users_collection[0]
@@ -242,131 +517,78 @@ def dense_glyph_volume(field, meshcube, mask, dims, driver=True, downsample=Fals
     parent_coll.children.link(coll)
 
 
-    xarr = xx.ravel()
-    yarr = yy.ravel()
-    zarr = zz.ravel()
-
-    # Downsample by skipping values when > 10K glyphs would be made.
-    if(downsample):
-
-        # Calculate starting number of voxels from dimensions
-
-        if n_voxels > N_GLYPHS:
-
-            print('n_voxels > N_GLYPHS, downsampling to < ', N_GLYPHS)
-
-            x_z_ratio = window_x / depth
-            x_y_ratio = window_x / window_y
-            x_steps = int(window_x)
-            # y_steps = window_y
-            y_steps = int(round(x_steps / x_y_ratio))
-            z_steps = int(round(x_steps / x_z_ratio))
-
-            print('x_y_ratio:',x_y_ratio)
-            print('x_z_ratio:',x_z_ratio)
-            print('x_steps:',x_steps)
-            print('y_steps:', y_steps)
-            print('z_steps:',z_steps)
-
-
-            assert abs(window_y - y_steps) < 1, 'y_step error'
-            assert abs(depth - z_steps) < 1, 'z_step error'
-
-
-            # progressively shrink until within appropriate size to draw
-            while n_voxels > N_GLYPHS:
-
-                x_steps = x_steps - 1
-                # y_steps = y_steps - 1
-                y_steps = int(round(x_steps / x_y_ratio))
-                z_steps = int(round(x_steps / x_z_ratio))
-                n_voxels = x_steps * y_steps * z_steps
-
-            print('Post downsampling: ')
-            print('x_steps:', x_steps)
-            print('y_steps:', y_steps)
-            print('z_steps:', z_steps)
-
-            # Create a new range of values with this number of intervals.
-            xs = np.linspace(xpos - window_x / 2,
-                             xpos + window_x / 2,
-                             x_steps)
-            ys = np.linspace(ypos - window_y / 2,
-                             ypos + window_y / 2,
-                             y_steps)
-            zs = np.linspace(zpos - depth / 2,
-                             zpos + depth / 2,
-                             z_steps)
+    # The scale of the entire collection of glyphs is controlled by the empty:
+    # instances read it in their node group, copies are made from a template
+    # with scale drivers, so the Cylinder at the origin keeps its scale.
+    if(driver and not GLYPH_INSTANCING):
+        glyph = obj.copy()
+        scale_drivers(glyph, ctrl)
+    else:
+        glyph = obj
 
-            xx_, yy_, zz_ = np.meshgrid(xs,ys,zs)
+    # Downsample to a grid of n_grid points when the cube has more voxels
+    if(downsample and n_voxels > n_grid):
 
-            # fill the arrays with the raveled values of the new meshgrid.
-            xarr = xx_.ravel()
-            yarr = yy_.ravel()
-            zarr = zz_.ravel()
+        x_steps, y_steps, z_steps = glyph_grid_steps(window_x, window_y, depth, n_grid)
 
-            assert len(xarr) == n_voxels, 'Meshgrid not giving expected results'
+        print('n_voxels > glyph grid, downsampling to ', x_steps, ' x ', y_steps, ' x ', z_steps)
 
-    for i in range(0,len(xarr)):
+        # Create a new range of values with this number of intervals.
+        xs = np.linspace(xpos - window_x / 2,
+                         xpos + window_x / 2,
+                         x_steps)
+        ys = np.linspace(ypos - window_y / 2,
+                         ypos + window_y / 2,
+                         y_steps)
+        zs = np.linspace(zpos - depth / 2,
+                         zpos + depth / 2,
+                         z_steps)
 
-        x = xarr[i]
-        y = yarr[i]
-        z = zarr[i]
+        xx, yy, zz = np.meshgrid(xs,ys,zs)
 
-        '''
-        We don't want to use rounded ints for the object location (above),
-        but need rounded values as indices to the field values below.
-        '''
-        # Round and int for indexing the field.
-        xr = int(round(xarr[i]))
-        yr = int(round(yarr[i]))
-        zr = int(round(zarr[i]))
+    # Glyph locations, not rounded
+    points = np.stack([np.ravel(xx), np.ravel(yy), np.ravel(zz)], axis=1)
 
-        if(mask[xr,yr,zr] > 0):
+    # Round and int for indexing the field (at the pyramid level).
+    inds = np.round(points).astype(np.int64) // f
 
-            # Calculate the rotation
-            vect = field[xr,yr,zr,:] # updated to transposed array
-            mat = rotation_matrix_from_vectors(vect, DEF_VECT)
-            eul = rot2eul(mat)
+    # Draw the glyphs in the mask and without FILT_VECT (a single lookup with cont)
+    draw = voxel_valid(field, mask, inds, FILT_VECT, cont)
 
-            if not np.array_equal(vect, FILT_VECT): # Filter specific vector.
+    positions = points[draw]
+    vects = gather(field, inds[draw]).astype(np.float64).reshape(-1, 3) # updated to transposed array
 
-                # Set location based on stack index.
-                new_obj = obj.copy()
-                new_obj.animation_data_clear()
-                coll.objects.link(new_obj)
-                new_obj.location = (x,y,z)  #define arrows positions (here they are centered on the world origin)
+    # Calculate the rotations of all the glyphs at once
+    rotations = rot2euls(rotation_matrices_from_vectors(vects, DEF_VECT))
+    rotations[:, 2] += np.pi
 
-                # print(field[xr,yr,zr,:])
+    # Colormap values, expressed in 0-255 color range.
+    pass_inds = (np.arccos(np.abs(vects[:, 2])) * 255).astype(int)
 
-                # Rotate the copied object
-                new_obj.rotation_euler[0] = eul[0]
-                new_obj.rotation_euler[1] = eul[1]
-                new_obj.rotation_euler[2] = eul[2] + np.pi
+    if(GLYPH_INSTANCING):
+        points_obj = glyph_point_cloud(positions, rotations, pass_inds, coll, name=FILE + '_GlyphPoints_' + label)
+        instance_glyphs(points_obj, obj, ctrl if driver else None)
+        print('Instanced ', len(positions), ' glyphs')
 
-                # Assign pass_index to apply a colormap.
-                mapped_val = np.arccos(abs(field[xr,yr,zr, 2]))
-                new_obj.pass_index = mapped_val * 255 # Express in 0-255 color range.
+    else:
+        for position, eul, pass_ind in zip(positions, rotations, pass_inds):
 
-                # Apply a driver to the X,Y,Z scale of the glyph so that the scale
-                # of the entire collection of glyphs can be controlled by the empty.
-                if(driver):
-                    for t, val in enumerate(['X', 'Y', 'Z']):
+            # Set location based on stack index.
+            new_obj = glyph.copy()
+            coll.objects.link(new_obj)
+            new_obj.location = position  #define arrows positions (here they are centered on the world origin)
 
-                        driv = new_obj.driver_add("scale", t).driver
-                        driv.type = 'SCRIPTED'
-                        driv.use_self = True
-
-                        dist = driv.variables.new()
-                        dist.name = "var"
-                        dist.type = 'TRANSFORMS'
+            # Rotate the copied object
+            new_obj.rotation_euler = eul
 
-                        dist.targets[0].id = ctrl
-                        dist.targets[0].transform_type = 'SCALE_'+ val
-                        driv.expression = "var"
+            # Assign pass_index to apply a colormap.
+            new_obj.pass_index = int(pass_ind)
 
     print('Finished drawing dense cube of glyphs')
 
+    if(driver and MEASURE_FRAME_TIME):
+        time_scale_updates(ctrl)
+
 
 
 def draw_streamlines(streamlines,collection_label='stream'):
@@ -395,19 +617,15 @@ def draw_streamlines(streamlines,collection_label='stream'):
 
 
 
-def stream_curves(field,mask,positions, sign, n_points=STREAM_LENGTH, window=None, angle_thresh=ANGLE_THRESH, label=''):
+def stream_curves(streams, sign, label=''):
 
     '''
-    Function to calculate streamline positions using custom algorithm
+    Draw the streamlines traced in one direction as curves.
 
     Input:
-        field: [m,n,p,3] array with x,y,z vector components
-        mask
-        positions: [n,3] array containing positions(= field indexes) of
-                    starting point for each of the N_STREAMLINES streamlines
-        sign: +-1, multiplier for the field vector to choose direction streamline is drawn.
-        n_points: Number of points to draw along the streamline in either direction
-        window: int. Number of voxels to average across in x,y,z. (smoothing)
+        streams: Streamlines (see tracing.py), in full resolution coordinates
+        sign: +-1, the direction of the streamlines to draw
+        label: str; suffix of the collection names
     '''
 
     # Create the collections to hold them.
@@ -422,140 +640,29 @@ def stream_curves(field,mask,positions, sign, n_points=STREAM_LENGTH, window=Non
     bpy.context.active_object.name = 'streamline_ctl'
     ctrl = bpy.data.objects['streamline_ctl']     #the control object
 
-    cmap_vals = []
-
-    for n in range(N_STREAMLINES):
-
-        x = (positions[n,0])
-        y = (positions[n,1])
-        z = (positions[n,2])
-
-        # Colormap value for each streamline
-        #cmap_val = abs(field[x,y,z, 2]) # Map the z axis (already 0 - 1) - updated to transposed array
-        cmap_val = np.arccos(abs(field[x,y,z, 2])) # Map the z axis (already 0 - 1) - updated to transposed array
-        cmap_vals.append(cmap_val)
-        coord_list = []
-        coord_list.append([x, y, z]) # Makes sure the first point is there
-
-        for i in range(n_points):
+    inds = np.flatnonzero(streams.signs == sign)
 
-            # Check whether positions are within bounds.
-            condx = (x >= 0) and (x < field.shape[0])
-            condy = (y >= 0) and (y < field.shape[1])
-            condz = (z >= 0) and (z < field.shape[2])
+    if not ANIMATE:
 
+        # Static curves: many streamlines per curve object
+        drawn = inds[streams.lengths()[inds] > 1]
+        curves = streams2curves(streams, drawn, persistent_label)
+        print('Drew ', len(drawn), ' streamlines as ', len(curves), ' curve objects, skipped ',
+              len(inds) - len(drawn), ' from: ', persistent_label)
 
-            if(condx and condy and condz):
-
-                # Get the component values at that position in the vector field
-                dx = field[int(np.floor(x)), int(np.floor(y)), int(np.floor(z)),0]
-                dy = field[int(np.floor(x)), int(np.floor(y)), int(np.floor(z)),1]
-                dz = field[int(np.floor(x)), int(np.floor(y)), int(np.floor(z)),2]
-
-            else:
-                # print('Sample out of bounds (n, i): ',n, i, ' breaking loop')
-                break
-
-            if(i > 1): # You may only calculate the angle if there are enough points.
-
-                # Calculate angle between segments.
-                x1 = coord_list[-2][0]
-                y1 = coord_list[-2][1]
-                z1 = coord_list[-2][2]
-
-                x2 = coord_list[-1][0]
-                y2 = coord_list[-1][1]
-                z2 = coord_list[-1][2]
-
-                # Calculate both potential locations for the next point,
-
-                xii= x + dx
-                yii = y + dy
-                zii = z + dz
-
-                xiii= x - dx
-                yiii = y - dy
-                ziii = z - dz
-
-                #and choose the one making the smallest angle
-                x1 = coord_list[-2][0]
-                y1 = coord_list[-2][1]
-                z1 = coord_list[-2][2]
-
-                x2 = coord_list[-1][0]
-                y2 = coord_list[-1][1]
-                z2 = coord_list[-1][2]
-
-                angle_pos = calc_angle((x1,y1,z1),(x2,y2,z2),(xii,yii,zii))
-                angle_neg = calc_angle((x1,y1,z1),(x2,y2,z2),(xiii,yiii,ziii))
-
-                if(abs(angle_neg) > abs(angle_pos)):
-                    xi = xii
-                    yi = yii
-                    zi = zii
-                    seg_angle = angle_pos
-                else:
-                    xi = xiii
-                    yi = yiii
-                    zi = ziii
-                    seg_angle = angle_neg
-
-                cond_angle = abs(seg_angle) < angle_thresh
-
-            else: # For the first two points, can't calculate angle, so bypass by defaulting cond_angle to true.
-
-                cond_angle = True
-                # Default xi,yi,zi
-                xi = x + dx * sign
-                yi = y + dy * sign
-                zi = z + dz * sign
-
-
-            # Check whether positions are within bounds.
-            condxi = (xi >= 0) and (xi < field.shape[0])
-            condyi = (yi >= 0) and (yi < field.shape[1])
-            condzi = (zi >= 0) and (zi < field.shape[2])
-
-            if(condxi and condyi and condzi):
-
-                cond_mask = mask[int(xi),int(yi),int(zi)] > 0
-
-                # Check that the vector value doesn't match the one we're filtering.
-                # Needs to be inside the condition to avoid out of bounds errors
-                vect = field[int(xi),int(yi),int(zi),:]
-
-                if not np.array_equal(vect, FILT_VECT): # Filter specific vector.
-                    # print(vect, FILT_VECT)
-                    cond_filt = True
-                else:
-                    cond_filt = False
-
-            else:
-                cond_mask = False
-                cond_filt = False
-
-            if(cond_mask and cond_angle and cond_filt):#and cond_mask):
-
-                coord_list.append([xi, yi, zi]) # Add new point
-
-                # Update positions
-                x = xi
-                y = yi
-                z = zi
-
-            else:
-
-                break
+    else:
 
-        coords = np.asarray(coord_list)
+        # Animated curves: an object per streamline, for the bevel keyframes
+        for n, ind in enumerate(inds):
 
-        if(coords.shape[0] > 1):
+            cmap_val = streams.cmap_vals[ind]
+            coords = streams.line(ind)
 
-            # Persistent streamlines
-            stream2curve(coords, persistent_label,cmap_val)
+            if(coords.shape[0] > 1):
 
+                # Persistent streamlines
+                stream2curve(coords, persistent_label,cmap_val)
 
-            if(ANIMATE):
 
                 # Sample from a beta distribution (so all curves don't start at once)
                 curve_anim_duration = 600
@@ -572,10 +679,11 @@ def stream_curves(field,mask,positions, sign, n_points=STREAM_LENGTH, window=Non
                 stream2curve(coords, tip_label,cmap_val)
                 animate_curve(t0,t1, persistent=False)
 
-        else:
-            print('Skipping n = ', n, ' from:  ', persistent_label)
+            else:
+                print('Skipping n = ', n, ' from:  ', persistent_label)
 
-    print('cmap_vals', np.min(cmap_vals), np.max(cmap_vals))
+    if len(inds):
+        print('cmap_vals', np.min(streams.cmap_vals[inds]), np.max(streams.cmap_vals[inds]))
 
 def create_collection(label, parent=None):
     '''
@@ -598,7 +706,7 @@ def create_collection(label, parent=None):
         bpy.context.scene.collection.children.link(collection)
 
 
-def bi_streamlining(field,mask, orig=None, label=''):
+def bi_streamlining(field,mask, orig=None, label='', level=0, tissue=None, streams=None, cont=None):
 
     '''
     Bi-directional streamline (streamtube) generating function
@@ -608,6 +716,16 @@ def bi_streamlining(field,mask, orig=None, label=''):
                 dimension is the x,y,z component
         orig: (xx,yy,zz) tuple (meshcube) Origin of the streamlines, defaults to a random sample of the entire field,
             But otherwise a sub-volume can be provided.
+        level: int; pyramid level of field and mask (see pyramid.py), only for
+            the entire field (orig is None).
+        tissue: (optional) TissueIndex of field to draw the seeds from (see
+            load_tissue_index()), otherwise it is computed from the field.
+        streams: (optional) Streamlines already traced (e.g. by headless_trace.py),
+            drawn instead of tracing them here.
+        cont: (optional) ContinuationMask of field and mask (see load_continuation_mask()),
+            so each tracing step does a single lookup.
+    The curves are drawn from the streamlines simplified to within SIMPLIFY_TOL
+    voxels (see simplify.py), the seeds are drawn as traced.
     TO DO: Draw glyphs at each position along the streamline
             - required modification of draw_glyphs() to accept predetermined
              glyph positions
@@ -615,40 +733,27 @@ def bi_streamlining(field,mask, orig=None, label=''):
 
     print('Drawing streamlines.')
 
-    if orig is None: # If no subvolume os provided, use the whole one.
-
-        orig = field
+    if streams is None:
+        streams = compute_streamlines(field, mask, orig, level=level, tissue=tissue, cont=cont)
 
-        # Standard way of visualizing start positions
-        field_inds = sample_field_vals(field)
-        pos = field_inds[np.random.choice(field_inds.shape[0], N_STREAMLINES, replace=False), :]
-
-    else:
+    drawVerts(streams.seeds[streams.signs == 1], label='streamline_start_positions') # Useful to see where the streamlines originate
 
-        xx = orig[0]
-        yy = orig[1]
-        zz = orig[2]
-
-        xarr = xx.ravel()
-        yarr = yy.ravel()
-        zarr = zz.ravel()
-
-        cube_coords = np.transpose(np.vstack([xarr,yarr,zarr]))
-        pos = cube_coords[np.random.choice(cube_coords.shape[0], N_STREAMLINES, replace=False), :]
-
-    drawVerts(pos, label='streamline_start_positions') # Useful to see where the streamlines originate
+    streams = simplify_streamlines(streams, SIMPLIFY_TOL)
 
     # Bidirectional streamlines:
     # for each origin point, they are drawin in + (1) and - (1) direction
-    stream_curves(field,mask,pos, 1, label=label)
-    stream_curves(field,mask,pos, -1, label=label)
+    stream_curves(streams, 1, label=label)
+    stream_curves(streams, -1, label=label)
 
-    print('Finished drawing ', N_STREAMLINES, ' bidirectional streamlines.')
+    print('Finished drawing ', np.sum(streams.signs == 1), ' bidirectional streamlines.')
 
-def make_volumetric_cube(volume, dimensions, isfield=False):
+def make_volumetric_cube(volume, dimensions, isfield=False, level=0):
 
     '''
     Make a cube and position it at the same position as the subvolume with respect to the entire dataset.
+
+    With level > 0, volume is a level of the downsampled pyramid (see pyramid.py):
+    the montage is made from the coarse voxels, the cube keeps its full size.
     '''
 
     xpos,ypos,zpos,window_x, window_y,depth = dimensions
@@ -657,7 +762,8 @@ def make_volumetric_cube(volume, dimensions, isfield=False):
     print("dimensions: ",str(dimensions))
 
 
-    sub_vol, cube = get_subvolume(volume, dimensions, isfield=isfield)
+    montage_dims = scale_cube_dims(dimensions, level_factor(level))
+    sub_vol, cube = get_subvolume(volume, montage_dims, isfield=isfield)
     print('sub_vol: ' ,np.shape(sub_vol))
 
     if isfield:
@@ -665,14 +771,14 @@ def make_volumetric_cube(volume, dimensions, isfield=False):
         label='_field'
         min_max = (-1,1)
 
-    make_montage(sub_vol,dimensions, label=label, min_max=min_max)
+    make_montage(sub_vol,montage_dims, label=label, min_max=min_max)
 
     x_len = window_x
     y_len = window_y
     z_len = depth
 
     # Load the recently created montage
-    new_img = bpy.data.images.load(filepath=LOAD_PATH + '/montages/'+FILE+str(dimensions)+label+'.tif')
+    new_img = bpy.data.images.load(filepath=LOAD_PATH + '/montages/'+FILE+str(montage_dims)+label+'.tif')
 
     # Create, place and stretch the volumetric cube
     bpy.ops.mesh.primitive_cube_add(location=(xpos-0.5, ypos-0.5, zpos-0.5))
@@ -701,7 +807,7 @@ def make_volumetric_cube(volume, dimensions, isfield=False):
 
     # Value node specifies how many slices in the subvolume.
     val_node = nodes.get("Value")
-    val_node.outputs[0].default_value = depth
+    val_node.outputs[0].default_value = montage_dims[5]
 
     nodes["Texture Coordinate"].object = obj# bpy.data.objects["texture control"]
 
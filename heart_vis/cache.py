@@ -0,0 +1,228 @@
+#cache.py
+import numpy as np
+import os
+import json
+import time
+import shutil
+import hashlib
+
+from heart_vis.config import *
+
+'''
+Content-addressed cache for preprocessed arrays.
+
+Each cache entry is a file (or folder) in LOAD_PATH named
+    <name>.<key><ext>
+where the key is a hash of the size and modification time of the source files,
+the parameters used to create the entry, and CACHE_VERSION. A manifest
+    <name>.<key><ext>.json
+is stored next to each entry, recording the sources, parameters, dtype and shape,
+so entries can be checked, listed and pruned.
+'''
+
+CACHE_VERSION = 1 # Increment to invalidate all entries when the preprocessing changes
+
+
+def source_stat(path):
+
+    '''
+    Identity of a source file: its path, size and modification time.
+    '''
+
+    st = os.stat(path)
+
+    return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def cache_key(source_files, params):
+
+    '''
+    Calculate the key of a cache entry.
+
+    Input:
+        source_files: list of str; paths of the files the entry is created from
+        params: dict; JSON-serializable parameters used to create the entry
+
+    Returns:
+        key: str; 16 hexadecimal characters
+    '''
+
+    h = hashlib.sha1()
+    h.update(str(CACHE_VERSION).encode())
+
+    for path in source_files:
+        st = source_stat(path)
+        h.update((str(st['size']) + ':' + str(st['mtime_ns'])).encode())
+
+    h.update(json.dumps(params, sort_keys=True).encode())
+
+    return h.hexdigest()[:16]
+
+
+def cache_entry_path(name, key, ext='.npy', load_path=LOAD_PATH):
+
+    return os.path.join(load_path, name + '.' + key + ext)
+
+
+def write_manifest(entry_path, name, key, source_files, params):
+
+    '''
+    Write the manifest of a newly created cache entry.
+    '''
+
+    manifest = {'name': name,
+                'key': key,
+                'entry': os.path.basename(entry_path),
+                'sources': [source_stat(path) for path in source_files],
+                'params': params,
+                'version': CACHE_VERSION,
+                'created': time.time()}
+
+    if entry_path.endswith('.npy'):
+        arr = np.load(entry_path, mmap_mode='r')
+        manifest['dtype'] = arr.dtype.str
+        manifest['shape'] = list(arr.shape)
+
+    with open(entry_path + '.json', 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    return manifest
+
+
+def read_manifest(entry_path):
+
+    manifest_file = entry_path + '.json'
+
+    if not os.path.isfile(manifest_file):
+        return None
+
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def is_fresh(entry_path, key):
+
+    '''
+    Check that a cache entry exists, that its manifest matches the key and, for
+    .npy entries, that the stored dtype and shape match the manifest.
+    '''
+
+    if not os.path.exists(entry_path):
+        return False
+
+    manifest = read_manifest(entry_path)
+
+    if manifest is None or manifest['key'] != key:
+        return False
+
+    if 'dtype' in manifest:
+        try:
+            arr = np.load(entry_path, mmap_mode='r')
+        except (ValueError, OSError):
+            return False
+
+        if arr.dtype.str != manifest['dtype'] or list(arr.shape) != manifest['shape']:
+            print('Cache entry does not match its manifest: ', entry_path)
+            return False
+
+    return True
+
+
+def list_cache_entries(load_path=LOAD_PATH, name=None):
+
+    '''
+    List the cache entries in load_path, newest first.
+
+    Each manifest is returned with two extra fields:
+        stale: True if a source file changed or is missing
+        nbytes: size of the entry on disk
+
+    Input:
+        name: (optional) str; only list entries with this name
+    '''
+
+    entries = []
+
+    for manifest_file in sorted(os.listdir(load_path)):
+
+        if not manifest_file.endswith('.json'):
+            continue
+
+        entry_path = os.path.join(load_path, manifest_file[:-len('.json')])
+        manifest = read_manifest(entry_path)
+
+        if not isinstance(manifest, dict) or 'key' not in manifest or 'sources' not in manifest:
+            continue # Not a cache manifest
+
+        if name is not None and manifest['name'] != name:
+            continue
+
+        try:
+            key = cache_key([s['path'] for s in manifest['sources']], manifest['params'])
+            manifest['stale'] = (key != manifest['key'])
+        except OSError:
+            manifest['stale'] = True
+
+        manifest['nbytes'] = entry_size(entry_path)
+        manifest['path'] = entry_path
+        entries.append(manifest)
+
+    entries.sort(key=lambda m: m['created'], reverse=True)
+
+    return entries
+
+
+def entry_size(entry_path):
+
+    if os.path.isdir(entry_path):
+        return sum(os.path.getsize(os.path.join(root, f))
+                   for root, dirs, files in os.walk(entry_path) for f in files)
+
+    return os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+
+
+def prune_cache(load_path=LOAD_PATH, keep_latest=1, dry_run=False):
+
+    '''
+    Delete stale cache entries, and all but the newest keep_latest entries of
+    each name and parameters.
+
+    Entries with the same name but different parameters (e.g. the continuation
+    masks of each pyramid level, or streamlines traced with different settings)
+    are different data, so they are only removed when their sources are stale.
+
+    Input:
+        load_path: str; folder containing the cache
+        keep_latest: int; number of fresh entries to keep for each name and parameters
+        dry_run: Boolean; if True, only print what would be deleted
+
+    Returns:
+        removed: list of str; paths of the removed entries
+    '''
+
+    removed = []
+    kept = {}
+
+    for manifest in list_cache_entries(load_path):
+
+        group = (manifest['name'], json.dumps(manifest['params'], sort_keys=True))
+        n_kept = kept.get(group, 0)
+
+        if not manifest['stale'] and n_kept < keep_latest:
+            kept[group] = n_kept + 1
+            continue
+
+        entry_path = manifest['path']
+        print(('Would remove: ' if dry_run else 'Removing: '), entry_path,
+              ' (stale)' if manifest['stale'] else ' (old)', manifest['nbytes'] / 1e6, 'MB')
+
+        if not dry_run:
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            elif os.path.exists(entry_path):
+                os.remove(entry_path)
+            os.remove(entry_path + '.json')
+
+        removed.append(entry_path)
+
+    return removed
@@ -0,0 +1,288 @@
+#chunk_store.py
+import numpy as np
+import os
+import json
+import zlib
+from collections import OrderedDict
+
+from heart_vis.config import *
+
+'''
+Chunked on-disk storage for the volume, mask and field arrays.
+
+An array is split into fixed-size chunks along its first three (x,y,z) axes,
+any remaining axes (the field components) are kept whole within each chunk.
+A store is a folder containing:
+    data.bin: the (optionally compressed) chunks, concatenated in C order of the chunk grid
+    index.json: shape, dtype, chunk shape, compression, and the byte offset and
+        length of each chunk in data.bin
+
+Reading a window of the array only decodes the chunks that overlap it.
+'''
+
+def write_chunked(array, path, chunk_shape=CHUNK_SHAPE, compression=CHUNK_COMPRESSION):
+
+    '''
+    Write an array (or memory map / view of one) to a chunked store.
+
+    The array is read one chunk at a time, so it doesn't need to fit in memory.
+
+    Input:
+        array: [m,n,p] or [m,n,p,q] array
+        path: str; folder of the store, created if needed
+        chunk_shape: tuple; (cx,cy,cz) size of the chunks
+        compression: None or 'zlib'
+
+    Returns:
+        index: dict; the contents of index.json
+    '''
+
+    assert compression in (None, 'zlib'), 'Unknown compression: ' + str(compression)
+    assert np.ndim(array) >= 3, 'Chunked store expects at least 3 dimensions'
+
+    os.makedirs(path, exist_ok=True)
+
+    shape = tuple(int(s) for s in np.shape(array))
+    chunk_shape = tuple(int(c) for c in chunk_shape)
+    grid = [int(np.ceil(shape[d] / chunk_shape[d])) for d in range(3)]
+
+    offsets = []
+    nbytes = []
+    offset = 0
+
+    with open(os.path.join(path, 'data.bin'), 'wb') as f:
+
+        for ci in range(grid[0]):
+            for cj in range(grid[1]):
+                for ck in range(grid[2]):
+
+                    lo, hi = chunk_bounds((ci, cj, ck), chunk_shape, shape)
+                    chunk = np.ascontiguousarray(array[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]])
+                    buf = chunk.tobytes()
+
+                    if(compression == 'zlib'):
+                        buf = zlib.compress(buf, 1) # Fast compression level
+
+                    f.write(buf)
+                    offsets.append(offset)
+                    nbytes.append(len(buf))
+                    offset += len(buf)
+
+    index = {'shape': list(shape),
+             'dtype': np.dtype(array.dtype).str,
+             'chunks': list(chunk_shape),
+             'compression': compression,
+             'offsets': offsets,
+             'nbytes': nbytes}
+
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump(index, f)
+
+    print('Wrote chunked store: ', path, ', shape: ', shape, ', grid: ', grid,
+          ', ', offset / 1e6, ' MB')
+
+    return index
+
+
+def chunk_bounds(chunk_ind, chunk_shape, shape):
+
+    '''
+    Get the lower and upper (exclusive) voxel bounds of the chunk at chunk_ind.
+    '''
+
+    lo = [chunk_ind[d] * chunk_shape[d] for d in range(3)]
+    hi = [min(lo[d] + chunk_shape[d], shape[d]) for d in range(3)]
+
+    return lo, hi
+
+
+class ChunkedVolume:
+
+    '''
+    Read-only, array-like access to a chunked store.
+
+    Indexing with integers and slices returns a numpy array, and only reads the
+    chunks that overlap the requested window. Recently used chunks are kept in a
+    small cache, so repeated single-voxel lookups (glyphs, streamlines) don't
+    decode the same chunk each time.
+
+    Input:
+        path: str; folder of the store written by write_chunked()
+        max_cached_chunks: int; number of decoded chunks to keep in memory
+    '''
+
+    def __init__(self, path, max_cached_chunks=64):
+
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+
+        self.path = path
+        self.shape = tuple(index['shape'])
+        self.dtype = np.dtype(index['dtype'])
+        self.ndim = len(self.shape)
+        self.chunk_shape = tuple(index['chunks'])
+        self.compression = index['compression']
+        self.offsets = index['offsets']
+        self.nbytes = index['nbytes']
+        self.grid = [int(np.ceil(self.shape[d] / self.chunk_shape[d])) for d in range(3)]
+
+        self.data = np.memmap(os.path.join(path, 'data.bin'), dtype=np.uint8, mode='r')
+
+        self.max_cached_chunks = max_cached_chunks
+        self.cache = OrderedDict()
+
+    def __len__(self):
+
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+
+        # Explicit conversion reads the whole array.
+        arr = self[(slice(None),) * 3]
+
+        return arr if dtype is None else arr.astype(dtype)
+
+    def read_chunk(self, chunk_ind):
+
+        '''
+        Decode a single chunk, using the cache when possible.
+        '''
+
+        if chunk_ind in self.cache:
+            self.cache.move_to_end(chunk_ind)
+            return self.cache[chunk_ind]
+
+        lo, hi = chunk_bounds(chunk_ind, self.chunk_shape, self.shape)
+        n = (chunk_ind[0] * self.grid[1] + chunk_ind[1]) * self.grid[2] + chunk_ind[2]
+        buf = self.data[self.offsets[n]:self.offsets[n] + self.nbytes[n]].tobytes()
+
+        if(self.compression == 'zlib'):
+            buf = zlib.decompress(buf)
+
+        chunk_dims = tuple(hi[d] - lo[d] for d in range(3)) + self.shape[3:]
+        chunk = np.frombuffer(buf, dtype=self.dtype).reshape(chunk_dims)
+
+        self.cache[chunk_ind] = chunk
+        if len(self.cache) > self.max_cached_chunks:
+            self.cache.popitem(last=False)
+
+        return chunk
+
+    def read_window(self, lo, hi):
+
+        '''
+        Read the window [lo, hi) of the first three axes, as a new array.
+
+        Input:
+            lo, hi: (x,y,z) lower and upper (exclusive) voxel bounds
+
+        Returns:
+            window: [hi-lo] + trailing axes array
+        '''
+
+        out = np.zeros(tuple(max(hi[d] - lo[d], 0) for d in range(3)) + self.shape[3:], dtype=self.dtype)
+
+        if min(out.shape[:3]) == 0:
+            return out
+
+        c_lo = [lo[d] // self.chunk_shape[d] for d in range(3)]
+        c_hi = [(hi[d] - 1) // self.chunk_shape[d] + 1 for d in range(3)]
+
+        for ci in range(c_lo[0], c_hi[0]):
+            for cj in range(c_lo[1], c_hi[1]):
+                for ck in range(c_lo[2], c_hi[2]):
+
+                    chunk = self.read_chunk((ci, cj, ck))
+                    ch_lo, ch_hi = chunk_bounds((ci, cj, ck), self.chunk_shape, self.shape)
+
+                    # Overlap of the chunk and the window, in volume coordinates
+                    o_lo = [max(lo[d], ch_lo[d]) for d in range(3)]
+                    o_hi = [min(hi[d], ch_hi[d]) for d in range(3)]
+
+                    out[o_lo[0] - lo[0]:o_hi[0] - lo[0],
+                        o_lo[1] - lo[1]:o_hi[1] - lo[1],
+                        o_lo[2] - lo[2]:o_hi[2] - lo[2]] = \
+                        chunk[o_lo[0] - ch_lo[0]:o_hi[0] - ch_lo[0],
+                              o_lo[1] - ch_lo[1]:o_hi[1] - ch_lo[1],
+                              o_lo[2] - ch_lo[2]:o_hi[2] - ch_lo[2]]
+
+        return out
+
+    def gather(self, xs, ys, zs):
+
+        '''
+        Read the voxels at integer index arrays xs, ys, zs (as array[xs,ys,zs]),
+        decoding each chunk they fall in once.
+        '''
+
+        xs, ys, zs = np.broadcast_arrays(*[np.asarray(i, dtype=np.int64) for i in (xs, ys, zs)])
+        inds = np.stack([xs.ravel(), ys.ravel(), zs.ravel()], axis=1)
+        inds = np.where(inds < 0, inds + np.asarray(self.shape[:3]), inds)
+
+        if np.any(inds >= np.asarray(self.shape[:3])) or np.any(inds < 0):
+            raise IndexError('index out of bounds for ChunkedVolume of shape ' + str(self.shape))
+
+        out = np.empty((len(inds),) + self.shape[3:], dtype=self.dtype)
+        chunk_inds = inds // np.asarray(self.chunk_shape)
+        chunk_ids = (chunk_inds[:, 0] * self.grid[1] + chunk_inds[:, 1]) * self.grid[2] + chunk_inds[:, 2]
+
+        for chunk_id in np.unique(chunk_ids):
+            sel = np.flatnonzero(chunk_ids == chunk_id)
+            chunk_ind = tuple(int(c) for c in chunk_inds[sel[0]])
+            local = inds[sel] - chunk_ind * np.asarray(self.chunk_shape)
+            out[sel] = self.read_chunk(chunk_ind)[local[:, 0], local[:, 1], local[:, 2]]
+
+        return out.reshape(xs.shape + self.shape[3:])
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        assert not any(k is Ellipsis for k in key), 'Ellipsis indexing not supported by ChunkedVolume'
+
+        key = key + (slice(None),) * (self.ndim - len(key))
+        spatial = key[:3]
+
+        if any(isinstance(k, np.ndarray) for k in spatial):
+
+            # Integers are broadcast with the index arrays, as in numpy
+            if not all(isinstance(k, (np.ndarray, int, np.integer)) for k in spatial):
+                raise IndexError('ChunkedVolume index arrays can only be combined with integers, not slices')
+            if any(isinstance(k, np.ndarray) for k in key[3:]):
+                raise IndexError('ChunkedVolume component index must be an integer or slice with index arrays')
+
+            return self.gather(*spatial)[(Ellipsis,) + key[3:]]
+
+        lo = []
+        hi = []
+        local_key = []
+
+        for d, k in enumerate(spatial):
+
+            if isinstance(k, slice):
+                start, stop, step = k.indices(self.shape[d])
+
+                if step > 0:
+                    lo.append(start)
+                    hi.append(max(stop, start))
+                    local_key.append(slice(0, max(stop - start, 0), step))
+                else:
+                    # Read the covering range and apply the negative step locally
+                    lo.append(stop + 1)
+                    hi.append(max(start + 1, stop + 1))
+                    local_key.append(slice(start - stop - 1, None, step))
+
+            else:
+                k = int(k)
+                if k < 0:
+                    k += self.shape[d]
+                if not (0 <= k < self.shape[d]):
+                    raise IndexError('index ' + str(k) + ' is out of bounds for axis ' + str(d))
+                lo.append(k)
+                hi.append(k + 1)
+                local_key.append(0)
+
+        window = self.read_window(lo, hi)
+
+        return window[tuple(local_key) + key[3:]]
@@ -262,6 +262,29 @@ BLEND_FILEPATH = os.path.join(SAVE_PATH,BLEND_FILENAME)
 
 # Field
 SMOOTH_FIELD = True # Is the input data using a smoothed vector field
+MMAP_CACHE = True # Open the preprocessed .npy volume, mask and field as read-only memory maps
+CHUNKED_CACHE = False # Load standardized volume, mask and field from chunked stores (see chunk_store.py)
+CHUNK_SHAPE = (64, 64, 64) # x,y,z size of each chunk in the chunked stores
+CHUNK_COMPRESSION = 'zlib' # Per-chunk compression of the chunked stores, 'zlib' or None
+TIF_WORKERS = 1 # Number of processes decoding tif pages, 1 decodes them serially
+FIELD_ENCODING = None # Compact field encoding, None (full precision), 'int8', 'int16', 'oct8' or 'oct16'
+PYRAMID_MAX_LEVEL = 3 # Coarsest level of the downsampled pyramid (level L is downsampled 2**L times)
+PYRAMID_LEVEL = 0 # Level for full-field streamlines and volumetric cubes, 0 is full resolution
+SEED = 0 # Random seed for the streamline seed positions, so runs reuse the cached streamlines (None for a different sample each run, not cached)
+INTEGRATOR = 'euler' # Streamline integrator: 'euler' (unit steps, nearest voxel), 'rk2' or 'rk4' (adaptive steps, interpolated field)
+STEP_TOL = 0.05 # Maximum error per step of the adaptive integrators (voxels)
+STEP_MIN = 0.25 # Shortest step of the adaptive integrators (voxels)
+STEP_MAX = 4 # Longest step of the adaptive integrators (voxels)
+STREAM_SPACING = None # Distance between evenly spaced streamlines (voxels), None for independently seeded streamlines
+TRACE_WORKERS = 1 # Number of processes tracing streamlines, 1 traces them in this process
+TRACE_CHUNK = 256 # Number of seeds per task of the tracing processes
+TRACED_STREAMLINES = False # Draw the streamlines saved by headless_trace.py instead of tracing them in Blender
+SIMPLIFY_TOL = 0.25 # Maximum deviation (voxels) of the drawn streamline curves from the traced points, None to draw every point
+CURVE_BATCH = 1000 # Number of streamlines per curve object when not animating, 1 for an object per streamline
+GLYPH_LEVEL = 0 # Level sampled by the glyphs, 'auto' picks the coarsest level with at least N_GLYPHS voxels in the cube
+GLYPH_INSTANCING = True # Draw the glyphs as geometry nodes instances on one point cloud (Blender 3.0+), False for a copied object per glyph
+MEASURE_FRAME_TIME = False # Print the average update time of the glyphs after a change of the glyph control scale
+MASK_POINTS = 100000 # Number of points drawn by draw_mask() to represent the mask
 
 INIT_BLEND = True # Bool to determine whether to initialize the scene (template)
 ANIMATE = False # Whether or not to animate the streamlines
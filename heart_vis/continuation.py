@@ -0,0 +1,110 @@
+#continuation.py
+import numpy as np
+import os
+
+from heart_vis.config import *
+
+'''
+Continuation mask: the voxels a streamline can continue into.
+
+A voxel can be continued into if it is in the mask and its field vector is not
+the filtered vector (FILT_VECT). The mask is stored as a bitmask packed along z,
+with a one-voxel border of zeros around the volume, so a point just outside the
+volume falls on the border and a single lookup replaces the bounds, mask and
+FILT_VECT checks of the tracer.
+'''
+
+def build_continuation_mask(field, mask, filt_vect=FILT_VECT, path=None, slab=16):
+
+    '''
+    Compute the continuation mask of a field and mask, slab x-slices at a time.
+
+    Input:
+        field: [m,n,p,3] array (or array-like field)
+        mask: [m,n,p] array
+        filt_vect: field vector that can't be continued into (None to disable)
+        path: (optional) str; folder to save bits.npy into
+
+    Returns:
+        ContinuationMask
+    '''
+
+    shape = tuple(field.shape[:3])
+    padded = (shape[0] + 2, shape[1] + 2, shape[2] + 2)
+    packed_shape = padded[:2] + (int(np.ceil(padded[2] / 8)),)
+
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+        bits = np.lib.format.open_memmap(os.path.join(path, 'bits.npy'), mode='w+',
+                                         dtype=np.uint8, shape=packed_shape)
+    else:
+        bits = np.empty(packed_shape, dtype=np.uint8)
+
+    bits[0] = 0
+    bits[-1] = 0
+    n_cont = 0
+
+    for x0 in range(0, shape[0], slab):
+
+        cont = np.asarray(mask[x0:x0 + slab]) > 0
+        if filt_vect is not None:
+            cont &= ~np.all(np.asarray(field[x0:x0 + slab]) == np.asarray(filt_vect), axis=3)
+
+        n_cont += int(np.sum(cont))
+        cont = np.pad(cont, ((0, 0), (1, 1), (1, 1)))
+        bits[x0 + 1:x0 + 1 + len(cont)] = np.packbits(cont, axis=-1)
+
+    print('Continuation mask: ', n_cont, ' of ', int(np.prod(shape)), ' voxels')
+
+    if path is not None:
+        bits.flush()
+        del bits
+        return ContinuationMask(path)
+
+    return ContinuationMask(bits=bits)
+
+
+class ContinuationMask:
+
+    '''
+    Packed continuation mask with a one-voxel border.
+
+    Input:
+        path: (optional) str; folder written by build_continuation_mask(), the
+            bitmask is memory mapped.
+        bits: in-memory bitmask, if no path is given.
+    '''
+
+    def __init__(self, path=None, bits=None):
+
+        if path is not None:
+            bits = np.load(os.path.join(path, 'bits.npy'), mmap_mode='r')
+
+        self.path = path
+        self.bits = bits
+
+        # Largest padded index of each axis, larger indices are clipped to the border
+        self.padded = np.array([bits.shape[0], bits.shape[1], bits.shape[2] * 8]) - 1
+
+    def contains(self, inds):
+
+        '''
+        Check whether (n,3) integer voxel indices can be continued into,
+        indices outside the volume can't.
+        '''
+
+        inds = np.clip(np.asarray(inds, dtype=np.int64) + 1, 0, self.padded)
+        byte = self.bits[inds[:, 0], inds[:, 1], inds[:, 2] >> 3]
+
+        return ((byte >> (7 - (inds[:, 2] & 7))) & 1).astype(bool)
+
+    def lookup(self, points):
+
+        '''
+        Check whether the voxels containing (n,3) points can be continued into.
+        '''
+
+        with np.errstate(invalid='ignore'): # nan points land on the border
+            inds = np.floor(points).astype(np.int64)
+
+        return self.contains(inds)
@@ -1,7 +1,6 @@
 #convenience_funcs.py
 import numpy as np
 import math
-import bpy
 
 from heart_vis.config import *
 
@@ -11,6 +10,8 @@ def get_scale(ctrlName, obj, maxScale, minScale, distRange):
     Function to calculate the intended scale in the driver expression, using getDistance
     '''
 
+    import bpy # Only available in Blender, the other functions are used without it
+
     ctrl = bpy.data.objects[ctrlName]
     dist = get_distance(ctrl, obj)
     power = ctrl.scale[0]
@@ -45,14 +46,100 @@ def rotation_matrix_from_vectors(vec1, vec2):
         mat: A transform matrix (3x3) which when applied to vec1, aligns it with vec2.
     '''
 
-    a, b = (vec1 / np.linalg.norm(vec1)).reshape(3), (vec2 / np.linalg.norm(vec2)).reshape(3)
+    return rotation_matrices_from_vectors(np.reshape(vec1, (1, 3)), vec2)[0]
+
+def unit_rows(vects):
+
+    '''
+    Normalize the rows of an (N,3) array, zero rows stay zero.
+    '''
+
+    vects = np.asarray(vects, dtype=np.float64).reshape(-1, 3)
+    norm = np.linalg.norm(vects, axis=1, keepdims=True)
+
+    return vects / np.where(norm > 0, norm, 1)
+
+def perpendicular_unit(vects):
+
+    '''
+    Unit vectors perpendicular to the (N,3) unit vectors, for the half turns of
+    antiparallel vectors: the cross product with the axis least aligned with each.
+    '''
+
+    axes = np.eye(3)[np.argmin(np.abs(vects), axis=1)]
+
+    return unit_rows(np.cross(vects, axes))
+
+def rotation_matrices_from_vectors(vecs, vec2):
+
+    '''
+    Find the rotation matrices that align each of N vectors to vec2, as
+    rotation_matrix_from_vectors().
+
+    Parallel vectors give the identity, antiparallel vectors a half turn about
+    an axis perpendicular to them, and zero vectors the identity.
+
+    Input:
+        vecs: (N,3) array; "source" vectors
+        vec2: A 3d "destination" vector
+
+    Returns:
+        mats: (N,3,3) array of rotation matrices
+    '''
+
+    a = unit_rows(vecs)
+    b = unit_rows(vec2)[0]
+
     v = np.cross(a, b)
-    c = np.dot(a, b)
-    s = np.linalg.norm(v)
-    kmat = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
-    rotation_matrix = np.eye(3) + kmat + kmat.dot(kmat) * ((1 - c) / (s ** 2))
+    c = a @ b
+    s2 = np.sum(v * v, axis=1)
+
+    # Rodrigues' formula: I + K + K^2 (1 - c) / s^2, with K the cross product matrix of v
+    kmat = np.zeros((len(a), 3, 3))
+    kmat[:, 0, 1], kmat[:, 0, 2] = -v[:, 2], v[:, 1]
+    kmat[:, 1, 0], kmat[:, 1, 2] = v[:, 2], -v[:, 0]
+    kmat[:, 2, 0], kmat[:, 2, 1] = -v[:, 1], v[:, 0]
 
-    return rotation_matrix
+    # (1 - c) / s^2 = 1 / (1 + c), which stays finite for nearly parallel vectors
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(c > 0, 1 / (1 + c), (1 - c) / s2)
+        mats = np.eye(3) + kmat + (kmat @ kmat) * factor[:, None, None]
+
+    # Parallel (and zero) vectors: no rotation. Antiparallel: half turn, 2 u u^T - I
+    degenerate = (s2 == 0) | ~np.isfinite(factor)
+    if np.any(degenerate):
+        anti = degenerate & (c < 0)
+        mats[degenerate & ~anti] = np.eye(3)
+        u = perpendicular_unit(a[anti])
+        mats[anti] = 2 * u[:, :, None] * u[:, None, :] - np.eye(3)
+
+    return mats
+
+def rotation_quaternions_from_vectors(vecs, vec2):
+
+    '''
+    Find the rotations that align each of N vectors to vec2 as unit quaternions
+    (w, x, y, z), the same rotations as rotation_matrices_from_vectors().
+
+    Returns:
+        quats: (N,4) array
+    '''
+
+    a = unit_rows(vecs)
+    b = unit_rows(vec2)[0]
+
+    # Half-angle form: (1 + c, a x b), normalized
+    quats = np.concatenate([1 + (a @ b)[:, None], np.cross(a, b)], axis=1)
+    norm = np.linalg.norm(quats, axis=1)
+
+    # Antiparallel vectors: half turn about a perpendicular axis. Zero vectors: identity
+    anti = (norm < 1e-12) & np.any(a != 0, axis=1)
+    zero = ~np.any(a != 0, axis=1)
+    quats[anti] = np.concatenate([np.zeros((np.sum(anti), 1)), perpendicular_unit(a[anti])], axis=1)
+    quats[zero] = [1, 0, 0, 0]
+    norm = np.linalg.norm(quats, axis=1, keepdims=True)
+
+    return quats / norm
 
 def rot2eul(R):
 
@@ -66,11 +153,39 @@ def rot2eul(R):
         (alpha, beta, gamma): as a numpy array
     '''
 
-    beta = -np.arcsin(R[2,0])
-    alpha = np.arctan2(R[2,1]/np.cos(beta),R[2,2]/np.cos(beta))
-    gamma = np.arctan2(R[1,0]/np.cos(beta),R[0,0]/np.cos(beta))
+    return rot2euls(np.reshape(R, (1, 3, 3)))[0]
+
+def rot2euls(R):
+
+    '''
+    Convert (N,3,3) rotation matrices to euler rotations in x,y,z components,
+    as rot2eul().
+
+    At gimbal lock (beta = +-90 degrees) only alpha - gamma or alpha + gamma is
+    defined, gamma is then set to 0.
+
+    Input:
+        R: (N,3,3) array of rotation matrices
+
+    Returns:
+        (N,3) array of (alpha, beta, gamma)
+    '''
+
+    R = np.asarray(R, dtype=np.float64)
+
+    beta = -np.arcsin(np.clip(R[:, 2, 0], -1, 1))
+
+    # cos(beta) >= 0, so it doesn't change the arctan2 quadrant
+    alpha = np.arctan2(R[:, 2, 1], R[:, 2, 2])
+    gamma = np.arctan2(R[:, 1, 0], R[:, 0, 0])
+
+    lock = np.abs(R[:, 2, 0]) > 1 - 1e-9
+    if np.any(lock):
+        sign = -np.sign(R[lock, 2, 0])
+        alpha[lock] = np.arctan2(sign * R[lock, 0, 1], sign * R[lock, 0, 2])
+        gamma[lock] = 0
 
-    return np.array((alpha, beta, gamma))
+    return np.stack([alpha, beta, gamma], axis=1)
 
 def calc_angle(point1,point2,point3):
 
@@ -0,0 +1,109 @@
+#glyph_layout.py
+import numpy as np
+
+from heart_vis.config import *
+from heart_vis.tracing import voxel_valid
+
+'''
+Glyph and point layouts for drawing, computed with numpy only (without bpy).
+'''
+
+def glyph_fraction(field, mask, dims, f=1, cont=None, n_samples=65536):
+
+    '''
+    Estimate the fraction of the cube's points where glyphs are drawn (in the
+    mask and not FILT_VECT) from a random sample of them.
+
+    Input:
+        field, mask, cont: arrays of the pyramid level with factor f, as dense_glyph_volume()
+        dims: tuple (x, y, z, window_x, window_y, depth) of the cube, full resolution
+
+    Returns:
+        float
+    '''
+
+    xpos, ypos, zpos, window_x, window_y, depth = dims
+
+    rng = np.random.default_rng(0) # The same estimate (and glyph grid) every run
+    lo = np.array([xpos - window_x / 2, ypos - window_y / 2, zpos - depth / 2])
+    points = lo + rng.random((n_samples, 3)) * np.array([window_x, window_y, depth])
+    inds = np.round(points).astype(np.int64) // f
+
+    return float(np.mean(voxel_valid(field, mask, inds, FILT_VECT, cont)))
+
+
+def glyph_grid_steps(window_x, window_y, depth, n_points):
+
+    '''
+    Number of grid steps along x, y and z for at most n_points glyphs with the
+    aspect ratio of the cube: the largest x_steps (up to window_x) for which
+    x_steps * y_steps * z_steps <= n_points, with y_steps and z_steps the
+    rounded x_steps scaled by the window ratios.
+
+    The cube root of n_points times the ratios gives x_steps up to the rounding
+    of y_steps and z_steps, which a few single steps correct.
+    '''
+
+    x_y_ratio = window_x / window_y
+    x_z_ratio = window_x / depth
+
+    def grid_size(x_steps):
+        return x_steps * int(round(x_steps / x_y_ratio)) * int(round(x_steps / x_z_ratio))
+
+    x_steps = min(int(window_x), int(np.cbrt(n_points * x_y_ratio * x_z_ratio)))
+
+    while x_steps < int(window_x) and grid_size(x_steps + 1) <= n_points:
+        x_steps += 1
+    while x_steps > 1 and grid_size(x_steps) > n_points:
+        x_steps -= 1
+
+    return x_steps, int(round(x_steps / x_y_ratio)), int(round(x_steps / x_z_ratio))
+
+
+def sample_mask(mask, n_points=MASK_POINTS, rng=None, slab=16):
+
+    '''
+    Draw n_points voxels uniformly at random from within the mask, without
+    listing all of its voxels.
+
+    The number of mask voxels of each slab of x-slices is counted first, the
+    points are split between the slabs as a sample without replacement would
+    (multivariate hypergeometric), and each slab is then sampled on its own, so
+    only one slab's indices exist at a time.
+
+    Input:
+        mask: [m,n,p] array (or array-like)
+        n_points: int; number of points (all the mask voxels if fewer)
+        rng: None, int seed or numpy Generator
+
+    Returns:
+        (n,3) int array of voxel indices, in x order
+    '''
+
+    rng = np.random.default_rng(rng)
+    starts = range(0, mask.shape[0], slab)
+    counts = np.array([np.count_nonzero(np.asarray(mask[x0:x0 + slab]) > 0) for x0 in starts])
+    total = int(np.sum(counts))
+
+    if total <= n_points:
+        per_slab = counts
+    else:
+        # Number of points from each slab, at most its count
+        per_slab = rng.multivariate_hypergeometric(counts, n_points)
+
+    samples = []
+
+    for x0, n in zip(starts, per_slab):
+
+        if n == 0:
+            continue
+
+        inds = np.flatnonzero(np.asarray(mask[x0:x0 + slab]) > 0)
+        inds = np.sort(rng.choice(inds, n, replace=False))
+        samples.append(np.stack(np.unravel_index(inds, (min(slab, mask.shape[0] - x0),) + tuple(mask.shape[1:3])), axis=1)
+                       + np.array([x0, 0, 0]))
+
+    if len(samples) == 0:
+        return np.zeros((0, 3), dtype=np.int64)
+
+    return np.concatenate(samples)
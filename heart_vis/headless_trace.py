@@ -0,0 +1,53 @@
+#headless_trace.py
+
+'''
+Trace the streamlines without Blender, e.g. on a compute node.
+
+Run with a Python installation that has the dependencies of load_data.py
+(Blender is not needed). The streamlines are saved to LOAD_PATH, and drawn by
+main.py in Blender if TRACED_STREAMLINES is True.
+'''
+
+from heart_vis.config import *
+from heart_vis.load_data import *
+from heart_vis.orientation import standardize_arrays
+from heart_vis.subvolume import get_subvolume
+from heart_vis.tracing import compute_streamlines, streamline_path
+
+
+def main():
+
+    # Load data
+    if(CHUNKED_CACHE): # Standardized arrays, read from disk one chunk at a time
+        volume, mask, field = load_chunked_arrays(IMAGE_DEPTH)
+
+    else:
+        volume = load_tif(IMAGE_DEPTH)
+        mask = load_tif(IMAGE_DEPTH, mask=True)
+        field = load_field_data()
+
+        # Standardize arrays
+        volume, mask, field = standardize_arrays(volume, mask, field)
+
+    if(FIELD_ENCODING is not None): # Quantized field, decoded as it is sampled
+        field = load_compact_field(field)
+
+    if(FULL_STREAMLINES): # Streamlining in entire field (not subvolume)
+
+        pyr_volume, pyr_mask, pyr_field = load_pyramid_level(PYRAMID_LEVEL, volume, mask, field)
+        tissue = load_tissue_index(pyr_field, level=PYRAMID_LEVEL)
+        cont = load_continuation_mask(pyr_field, pyr_mask, level=PYRAMID_LEVEL)
+        streams = compute_streamlines(pyr_field, pyr_mask, level=PYRAMID_LEVEL, tissue=tissue, cont=cont)
+        streams.save(streamline_path(FILE+'_all_'+SUPP_DESC))
+
+    if(SUBVOL_STREAMLINES): # Create streamlines originating in the subvolume
+
+        cube_dims = (x,y,z,window_x, window_y, depth)
+        subfield, cube = get_subvolume(field,cube_dims)
+        streams = compute_streamlines(field, mask, cube, cont=load_continuation_mask(field, mask))
+        streams.save(streamline_path(str(cube_dims)+SUPP_DESC))
+
+
+if __name__ == '__main__':
+
+    main()
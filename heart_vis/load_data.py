@@ -1,97 +1,309 @@
 # load_data.py
 from heart_vis.config import *
+from heart_vis.orientation import standardize_arrays
+from heart_vis.chunk_store import write_chunked, ChunkedVolume
+from heart_vis.cache import *
+from heart_vis.field_codec import encode_field, QuantizedField
+from heart_vis.pyramid import *
+from heart_vis.seeding import build_tissue_index, TissueIndex, region_bounds
+from heart_vis.continuation import build_continuation_mask, ContinuationMask
+from heart_vis.tracing import Streamlines, compute_streamlines, draw_seeds, bi_trace, extend_streamlines
+from heart_vis.tif_decode import decode_tif_pages, decode_tif_pages_to_file, stacked_slices, EOF
 
 # Standard Python imports
 import os
+import time
+import tempfile
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 # Non-standard python imports (may need to be installed in Blender's Python)
 from PIL import Image # For importing a tiff
-import vtk
-from vtk.util import numpy_support
 
-def load_tif(image_depth, mask=False, method='PIL'):
+def load_tif(image_depth, mask=False, method='PIL', mmap=MMAP_CACHE):
 
     '''
     Used for loading a tif file and processing it, saving into a numpy array
     for faster loading.
 
+    The numpy file is a cache entry keyed on the tif file and the loading
+    parameters (see cache.py), so it is rebuilt when any of them change.
+
     parameters:
         image_depth: Z-dimension of image stack. Number of slices in tif.
         mask: Boolean; if true, input volume expected to be binary
         method: Str: Tif loading method, 'PIL' or 'VTK'
+        mmap: Boolean; if true, the preprocessed numpy stack is opened as a read-only
+            memory map, so only the voxels that are accessed are read from disk.
     '''
 
-    npy_file =  FILE+'_imstack.npy'
-    tif_file = FILE+'.tif'
-
-    if(mask):
-
-        npy_file =  FILE+'_mask.npy'#'_mask_erode3x.npy'#
-        tif_file = FILE+'mask.tif'#'mask_erode3x.tif'#
+    npy_path, key, tif_path, params = tif_cache_entry(image_depth, mask, method)
 
     imstack = []
 
     # Start by trying to load the preprocessed stack as a numpy file
-    if os.path.isfile(LOAD_PATH + npy_file):
+    if (key is None and os.path.isfile(npy_path)) or is_fresh(npy_path, key):
 
-        imstack = np.load(LOAD_PATH + npy_file)
-        print("Loaded numpy volume: ", npy_file)
+        imstack = np.load(npy_path, mmap_mode='r' if mmap else None)
+        print("Loaded numpy volume: ", npy_path)
         print("Numpy volume shape: ", np.shape(imstack))
 
     else:
 
-        print('Did not find numpy file: ',LOAD_PATH + npy_file, ', loading TIF instead.')
+        print('Did not find valid numpy file: ',npy_path, ', loading TIF instead.')
 
         if(method == 'PIL'):
-            # Create an array to hold values from multiple images of the stack (imstack)
-            img = Image.open(RAW_PATH+tif_file)
-            img.seek(0) # Get first page of multi-page tiff
-            print('PIL loaded slice range: ', np.nanmin(img), np.nanmax(img))
-            imstack = np.asarray(img) # Start the cumulative array of slices.
-            print('Numpy array created from slice, range: ', np.nanmin(img), np.nanmax(img))
-            print('Loaded first page of tif as numpy array with shape: ',np.shape(imstack))
-
-            image_width = np.shape(imstack[0]) # pixels
-            image_height = np.shape(imstack[1]) # pixels
-
-            for i in range(0,image_depth):
-                try:
-                    img.seek(i)
-                    this_array = np.asarray(img)
-                    imstack = np.dstack((imstack,this_array))
-
-                except EOFError:
-                    # Not enough frames in img
-                    break
-                except MemoryError:
-                    # Not enough memory to do more concatenating images
-                    print('Memory error at slice: ' + str(i) +', imstack shape: '+ str(np.shape(imstack)))
-                    image_depth = np.shape(imstack)[2]
-                    break
-                except ValueError:# Catches the case where a slice doesn't have the correct dimentions
-                    i = i + 1
-                    print("Slice skipped: " + str(i))
-
+            # Stream the pages straight into the numpy file that caches the stack
+            imstack = read_tif_stack(tif_path, image_depth, out_file=npy_path)
 
         elif(method=='VTK'):
 
-            vtkimg = read_tiff_vtk(tif_file, RAW_PATH)
+            vtkimg = read_tiff_vtk(os.path.basename(tif_path), RAW_PATH)
             imstack = vtk_image_to_numpy_array(vtkimg)
 
-        # Save index positions to file
-        np.save(LOAD_PATH + npy_file, imstack)
-        print("Saved volume as numpy array: ", LOAD_PATH + npy_file)
+            # Save index positions to file, renamed into place once complete
+            with open(npy_path + '.partial', 'wb') as f:
+                np.save(f, imstack)
+            os.replace(npy_path + '.partial', npy_path)
+            print("Saved volume as numpy array: ", npy_path)
+
+        del imstack # Close the memory map before the manifest reads it
+        write_manifest(npy_path, params['name'], key, [tif_path], params)
+        imstack = np.load(npy_path, mmap_mode='r' if mmap else None)
 
     assert np.shape(imstack)[0] > 0, 'No stack loaded'
 
     print('Original volume shape: ', np.shape(imstack))
     imstack = np.transpose(imstack, (1,0,2))
     print('Transposed volume shape: ',np.shape(imstack))
-    print('Tif value range (imstack) : ', np.nanmin(imstack), np.nanmax(imstack))
+
+    if not mmap: # Would read the entire memory mapped volume
+        print('Tif value range (imstack) : ', np.nanmin(imstack), np.nanmax(imstack))
 
     return imstack
 
 
+def tif_cache_entry(image_depth, mask=False, method='PIL'):
+
+    '''
+    Find the cache entry for a tif stack.
+
+    If the tif is available, the entry is keyed on the tif size and modification
+    time and the loading parameters. Otherwise the newest cached entry is used
+    (or the un-keyed FILE+'_imstack.npy' from before the cache was keyed), and
+    key is None.
+
+    Returns:
+        npy_path: str; path of the cached numpy file
+        key: str or None
+        tif_path: str; path of the source tif
+        params: dict; loading parameters included in the key
+    '''
+
+    name = FILE+'_imstack'
+    tif_file = FILE+'.tif'
+
+    if(mask):
+
+        name = FILE+'_mask'#'_mask_erode3x'#
+        tif_file = FILE+'mask.tif'#'mask_erode3x.tif'#
+
+    tif_path = RAW_PATH + tif_file
+    params = {'name': name, 'method': method, 'image_depth': int(image_depth), 'mask': bool(mask)}
+
+    if os.path.isfile(tif_path):
+
+        key = cache_key([tif_path], params)
+
+        return cache_entry_path(name, key, load_path=LOAD_PATH), key, tif_path, params
+
+    entries = [m for m in list_cache_entries(LOAD_PATH, name) if m['params'] == params]
+
+    if len(entries) > 0:
+        npy_path = entries[0]['path']
+    else:
+        npy_path = LOAD_PATH + name + '.npy'
+
+    print('WARNING: source tif not found, cannot check cache entry is up to date: ', tif_path)
+
+    return npy_path, None, tif_path, params
+
+
+
+def read_tif_stack(tif_path, image_depth, out_file=None, n_workers=TIF_WORKERS):
+
+    '''
+    Read a multi-page tif into a single preallocated (height, width, depth) array.
+
+    The page count and page shape are read first, so the output is allocated once
+    and filled slice by slice, rather than being concatenated page by page.
+    Pages with a different shape to the first page, or whose data can't be
+    decoded, are skipped, and reading stops at the end of the file (also a
+    truncated one) or after image_depth pages. The stack only has the slices
+    that were read.
+
+    The stack is stored in Fortran order, so that each slice [:,:,i] is contiguous
+    and a page is written in a single pass (also when writing to disk).
+
+    With n_workers > 1 the pages are decoded in a pool of worker processes, each
+    writing its pages directly into the memory mapped output file (a temporary
+    file if out_file is not given), so decoded pages are never sent back to this
+    process. Inside Blender, multiprocessing.set_executable() must point to the
+    bundled Python interpreter for the workers to start.
+
+    parameters:
+        tif_path: Str; full path to the multi-page tif
+        image_depth: Maximum number of slices to read from the tif
+        out_file: (optional) Str; path of a .npy file to write the stack into
+            as a memory map, instead of holding it in RAM. It is only created
+            once the stack is complete.
+        n_workers: int; number of processes decoding pages
+
+    Returns:
+        imstack: (height, width, depth) array or memmap
+    '''
+
+    img = Image.open(tif_path)
+    img.seek(0) # Get first page of multi-page tiff
+    page_shape = (img.size[1], img.size[0])
+    page_mode = img.mode
+    page_dtype = np.asarray(img).dtype
+    print('Loaded first page of tif with shape: ', page_shape, ', mode: ', page_mode)
+
+    # Find the pages that can be stacked, without decoding them
+    try:
+        n_pages = getattr(img, 'n_frames', image_depth)
+    except (OSError, TypeError, ValueError):
+        n_pages = image_depth # A page header is unreadable, found below
+
+    pages = []
+    for i in range(0, min(n_pages, image_depth)):
+        try:
+            img.seek(i)
+        except EOFError:
+            # Not enough frames in img
+            break
+        except (OSError, TypeError, ValueError):
+            # Page header is unreadable (truncated file), stop as at the end of the file
+            print("Unreadable page header, stopped reading at slice: " + str(i))
+            break
+
+        if((img.size[1], img.size[0]) != page_shape or img.mode != page_mode):
+            # The slice doesn't have the correct dimensions
+            print("Slice skipped: " + str(i))
+            continue
+
+        pages.append(i)
+
+    stack_shape = page_shape + (len(pages),)
+    print('Allocating stack of shape: ', stack_shape, ', dtype: ', page_dtype)
+
+    slots = list(enumerate(pages)) # (slice in stack, page in tif)
+    slice_mb = np.prod(page_shape) * np.dtype(page_dtype).itemsize / 1e6
+    t_start = time.time()
+
+    # The stack is written to a partial file, renamed to out_file once it is
+    # complete, so an interrupted load never leaves an out_file behind
+    work_file = None if out_file is None else out_file + '.partial'
+    timings = []
+
+    if(n_workers > 1):
+
+        if work_file is None:
+            work_file = os.path.join(tempfile.mkdtemp(), 'imstack.npy')
+
+        imstack = np.lib.format.open_memmap(work_file, mode='w+', dtype=page_dtype,
+                                            shape=stack_shape, fortran_order=True)
+        imstack.flush()
+        del imstack
+
+        # Small batches of neighbouring pages, handed out as workers become free
+        batch = max(1, int(np.ceil(len(slots) / (n_workers * 4))))
+        batches = [slots[b:b + batch] for b in range(0, len(slots), batch)]
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = pool.map(decode_tif_pages_to_file, [tif_path] * len(batches),
+                               [work_file] * len(batches), batches)
+
+            for batch_timings in results:
+                print_slice_timings(batch_timings, len(pages), slice_mb)
+                timings += batch_timings
+
+        imstack = np.load(work_file, mmap_mode='r+')
+
+    else:
+
+        if work_file is not None:
+            imstack = np.lib.format.open_memmap(work_file, mode='w+', dtype=page_dtype,
+                                                shape=stack_shape, fortran_order=True)
+        else:
+            imstack = np.empty(stack_shape, dtype=page_dtype, order='F')
+
+        timings = decode_tif_pages(img, imstack, slots)
+        print_slice_timings(timings, len(pages), slice_mb)
+
+    keep = stacked_slices(timings, len(slots))
+
+    dt = max(time.time() - t_start, 1e-9)
+    print('Read ', len(keep), ' slices in %.2f s, %.1f MB/s' % (dt, slice_mb * len(keep) / dt))
+
+    if len(keep) < len(slots):
+        print('Stacking ', len(keep), ' of ', len(slots), ' slices (end of file or unreadable pages)')
+
+    if out_file is None:
+
+        if work_file is not None: # Decoded by the workers into a temporary file
+            stack = np.array(imstack[:, :, keep], order='F')
+            del imstack
+            os.remove(work_file)
+            os.rmdir(os.path.dirname(work_file))
+            imstack = stack
+
+        elif len(keep) < len(slots):
+            imstack = np.asfortranarray(imstack[:, :, keep])
+
+        return imstack
+
+    if len(keep) < len(slots):
+
+        # Copy the decoded slices to a stack of the right depth, slice by slice
+        compact_file = out_file + '.compact'
+        stack = np.lib.format.open_memmap(compact_file, mode='w+', dtype=page_dtype,
+                                          shape=page_shape + (len(keep),), fortran_order=True)
+        for j, k in enumerate(keep):
+            stack[:, :, j] = imstack[:, :, k]
+        stack.flush()
+        del stack
+        del imstack
+        os.remove(work_file)
+        work_file = compact_file
+
+    else:
+        imstack.flush()
+        del imstack
+
+    os.replace(work_file, out_file)
+    print("Saved volume as numpy array: ", out_file)
+
+    return np.load(out_file, mmap_mode='r+')
+
+
+def print_slice_timings(timings, n_slices, slice_mb):
+
+    for k, i, dt in timings:
+
+        if dt == EOF:
+            print("End of file before slice, stopped reading: " + str(i))
+            continue
+
+        if dt is None:
+            print("Slice could not be decoded, skipped: " + str(i))
+            continue
+
+        dt = max(dt, 1e-9)
+        print('Slice ', i, ' (', k + 1, '/', n_slices, '): ',
+              '%.1f ms, %.1f MB/s' % (dt * 1000, slice_mb / dt))
+
 
 def load_tiff_inds():
 
@@ -109,7 +321,15 @@ def load_tiff_inds():
     return tif_inds
 
 
-def load_field_data():
+def load_field_data(mmap=MMAP_CACHE):
+
+    '''
+    Load the preprocessed orientation field, transposed to (x, y, z, component).
+
+    parameters:
+        mmap: Boolean; if true, the field is opened as a read-only memory map and
+            the transposed field is a view of it.
+    '''
 
     field_name = '_field.npy'
 
@@ -117,7 +337,7 @@ def load_field_data():
     if(SMOOTH_FIELD):
         field_name = '_field_smooth.npy'
 
-    field = np.load(LOAD_PATH + FILE + field_name)
+    field = np.load(LOAD_PATH + FILE + field_name, mmap_mode='r' if mmap else None)
 
     print('Loaded field, original shape: ', np.shape(field))
 
@@ -127,8 +347,326 @@ def load_field_data():
     return field
 
 
+def load_chunked_arrays(image_depth=IMAGE_DEPTH):
+
+    '''
+    Load the standardized volume, mask and field from chunked stores, building
+    the stores from the preprocessed numpy files when they are missing or out of date.
+
+    The stores contain the arrays after standardize_arrays() (cropped, and
+    rotated if ROTATE), so they can be indexed directly with scene coordinates.
+    They are cache entries keyed on the numpy files they are built from.
+
+    parameters:
+        image_depth: Z-dimension of image stack, used if the tif needs to be loaded.
+
+    Returns:
+        volume, mask, field: ChunkedVolume readers
+    '''
+
+    names = ['_imstack', '_mask', '_field_smooth' if SMOOTH_FIELD else '_field']
+    source_files = standardized_sources(image_depth)
+
+    # Memory mapped, so only (re)builds the numpy files if needed
+    volume = load_tif(image_depth, mmap=True)
+    mask = load_tif(image_depth, mask=True, mmap=True)
+    field = load_field_data(mmap=True)
+
+    params = {'rotate': ROTATE, 'chunks': list(CHUNK_SHAPE), 'compression': CHUNK_COMPRESSION}
+    key = cache_key(source_files, params)
+    store_paths = [cache_entry_path(FILE + name + '_std', key, '.chunks', LOAD_PATH) for name in names]
+
+    if not all(is_fresh(path, key) for path in store_paths):
+
+        print('Building chunked stores for: ', FILE)
+        arrays = standardize_arrays(volume, mask, field)
+
+        for array, name, path in zip(arrays, names, store_paths):
+            write_chunked(array, path)
+            write_manifest(path, FILE + name + '_std', key, source_files, params)
+
+    volume, mask, field = [ChunkedVolume(path) for path in store_paths]
+    print('Opened chunked stores, shapes: ', volume.shape, mask.shape, field.shape)
+
+    return volume, mask, field
+
+
+def standardized_sources(image_depth=IMAGE_DEPTH):
+
+    '''
+    Paths of the numpy files that the standardized volume, mask and field are
+    created from, to key cache entries derived from them.
+    '''
+
+    field_name = '_field_smooth' if SMOOTH_FIELD else '_field'
+
+    return [tif_cache_entry(image_depth)[0],
+            tif_cache_entry(image_depth, mask=True)[0],
+            LOAD_PATH + FILE + field_name + '.npy']
+
+
+def load_compact_field(field, encoding=FIELD_ENCODING, image_depth=IMAGE_DEPTH):
+
+    '''
+    Get the standardized field in a compact quantized encoding (see field_codec.py),
+    converting it the first time.
+
+    parameters:
+        field: the standardized [m,n,p,3] field, only read if it needs converting.
+        encoding: Str; 'int8', 'int16', 'oct8' or 'oct16'
+
+    Returns:
+        field: QuantizedField, decoding vectors as they are indexed.
+    '''
+
+    source_files = standardized_sources(image_depth)
+    params = {'rotate': ROTATE, 'encoding': encoding}
+    name = FILE + '_field_' + encoding
+    key = cache_key(source_files, params)
+    path = cache_entry_path(name, key, '.field', LOAD_PATH)
+
+    if not is_fresh(path, key):
+        encode_field(field, path, encoding)
+        write_manifest(path, name, key, source_files, params)
+
+    field = QuantizedField(path)
+    print('Opened ', encoding, ' encoded field, shape: ', field.shape)
+
+    return field
+
+
+def load_pyramid_level(level, volume, mask, field, image_depth=IMAGE_DEPTH):
+
+    '''
+    Get the volume, mask and field at a level of the downsampled pyramid
+    (see pyramid.py), building the levels next to the numpy cache the first time.
+
+    parameters:
+        level: int; 0 is full resolution, level L is downsampled 2**L times
+        volume, mask, field: the standardized full resolution arrays, only read
+            if the pyramid needs to be built.
+
+    Returns:
+        volume, mask, field: memory mapped arrays at that level
+    '''
+
+    if(level == 0):
+        return volume, mask, field
+
+    assert 0 < level <= PYRAMID_MAX_LEVEL, 'Pyramid level out of range: ' + str(level)
+
+    source_files = standardized_sources(image_depth)
+    funcs = [downsample_volume, downsample_mask, downsample_field]
+    names = [FILE + name + '_L' for name in ['_imstack', '_mask', '_field']]
+
+    arrays = [volume, mask, field]
+
+    for this_level in range(1, level + 1):
+
+        # The field may be the decoded FIELD_ENCODING, so the levels depend on it
+        params = {'rotate': ROTATE, 'encoding': FIELD_ENCODING, 'level': this_level,
+                  'factor': level_factor(this_level)}
+        key = cache_key(source_files, params)
+        paths = [cache_entry_path(name + str(this_level), key, '.npy', LOAD_PATH) for name in names]
+
+        if not all(is_fresh(path, key) for path in paths):
+
+            print('Building pyramid level ', this_level, ' for: ', FILE)
+
+            for array, func, name, path in zip(arrays, funcs, names, paths):
+                out = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype,
+                                                shape=coarse_shape(array.shape))
+                downsample(array, func, out)
+                out.flush()
+                del out
+                write_manifest(path, name + str(this_level), key, source_files, params)
+
+        arrays = [np.load(path, mmap_mode='r') for path in paths]
+
+    print('Loaded pyramid level ', level, ', shapes: ', [np.shape(a) for a in arrays])
+
+    return arrays
+
+
+def load_tissue_index(field, level=0, image_depth=IMAGE_DEPTH):
+
+    '''
+    Get the packed index of the tissue voxels of the standardized field (see
+    seeding.py), computing it the first time it is needed.
+
+    parameters:
+        field: the standardized field (at the pyramid level), only read if the
+            index needs to be computed.
+        level: int; pyramid level of field
+
+    Returns:
+        TissueIndex, with the bitmask memory mapped
+    '''
+
+    source_files = standardized_sources(image_depth)
+    params = {'rotate': ROTATE, 'level': level, 'encoding': FIELD_ENCODING}
+    name = FILE + '_tissue'
+    key = cache_key(source_files, params)
+    path = cache_entry_path(name, key, '.tissue', LOAD_PATH)
+
+    if not is_fresh(path, key):
+        print('Building tissue index for: ', FILE)
+        build_tissue_index(field, path)
+        write_manifest(path, name, key, source_files, params)
+
+    return TissueIndex(path)
+
+
+def load_continuation_mask(field, mask, level=0, image_depth=IMAGE_DEPTH):
+
+    '''
+    Get the packed continuation mask (in the mask and not FILT_VECT, see
+    continuation.py) of the standardized field and mask, computing it the
+    first time it is needed.
+
+    parameters:
+        field, mask: the standardized field and mask (at the pyramid level),
+            only read if the continuation mask needs to be computed.
+        level: int; pyramid level of field and mask
+
+    Returns:
+        ContinuationMask, with the bitmask memory mapped
+    '''
+
+    source_files = standardized_sources(image_depth)
+    params = {'rotate': ROTATE, 'level': level, 'encoding': FIELD_ENCODING,
+              'filt_vect': None if FILT_VECT is None else list(FILT_VECT)}
+    name = FILE + '_continuation'
+    key = cache_key(source_files, params)
+    path = cache_entry_path(name, key, '.cont', LOAD_PATH)
+
+    if not is_fresh(path, key):
+        print('Building continuation mask for: ', FILE)
+        build_continuation_mask(field, mask, FILT_VECT, path)
+        write_manifest(path, name, key, source_files, params)
+
+    return ContinuationMask(path)
+
+
+def load_streamlines(field, mask, orig=None, level=0, tissue=None, cont=None, image_depth=IMAGE_DEPTH):
+
+    '''
+    Get the bidirectional streamlines for bi_streamlining(), tracing them the
+    first time and loading them from the cache afterwards.
+
+    The cache key covers the field and mask (sources, rotation, pyramid level and
+    encoding), the seeds and the tracing parameters (ANGLE_THRESH, STREAM_LENGTH,
+    FILT_VECT, the integrator and spacing). Seeds are drawn with SEED and hashed,
+    so with the default (fixed) SEED every run draws the same seeds and loads or
+    extends its streamlines. With SEED = None every run has new seeds, so the
+    streamlines are traced and not cached (the cache would otherwise gain an
+    entry every run).
+
+    If only STREAM_LENGTH or ANGLE_THRESH was raised since the seeds were traced,
+    the cached streamlines that stopped at the old limit are extended instead
+    (see find_extendable_streamlines()). Evenly spaced streamlines are traced
+    again, since extending them would change the spacing of the others.
+
+    parameters:
+        field, mask, orig, level, tissue, cont: as tracing.compute_streamlines()
+
+    Returns:
+        Streamlines
+    '''
+
+    source_files = standardized_sources(image_depth)
+    params = {'rotate': ROTATE, 'level': level, 'encoding': FIELD_ENCODING, 'signs': [1, -1],
+              'angle_thresh': ANGLE_THRESH, 'stream_length': STREAM_LENGTH,
+              'filt_vect': None if FILT_VECT is None else list(FILT_VECT),
+              'integrator': INTEGRATOR}
+
+    if(INTEGRATOR != 'euler'):
+        params['steps'] = [STEP_TOL, STEP_MIN, STEP_MAX]
+
+    if(SEED is None): # New seeds every run, so the streamlines would never be loaded again
+        return compute_streamlines(field, mask, orig, level=level, tissue=tissue, n_seeds=N_STREAMLINES,
+                                   rng=None, cont=cont, spacing=STREAM_SPACING)
+
+    if(STREAM_SPACING is None):
+        pos = draw_seeds(field, mask, N_STREAMLINES, orig=orig, tissue=tissue, rng=SEED)
+        params['seeds'] = hashlib.sha1(np.ascontiguousarray(pos, dtype=np.int64).tobytes()).hexdigest()
+
+    else:
+        lo, hi = region_bounds(field.shape, orig)
+        params['spacing'] = [STREAM_SPACING, SEED, N_STREAMLINES, lo.tolist(), hi.tolist()]
+
+    name = FILE + '_streamlines'
+    key = cache_key(source_files, params)
+    path = cache_entry_path(name, key, '.npz', LOAD_PATH)
+
+    if is_fresh(path, key):
+        print('Loading cached streamlines: ', path)
+        return Streamlines(path)
+
+    base = find_extendable_streamlines(name, params, LOAD_PATH) if STREAM_SPACING is None else None
+
+    if base is not None:
+        streams = extend_streamlines(field, mask, base, level=level, n_points=STREAM_LENGTH,
+                                     angle_thresh=ANGLE_THRESH, cont=cont, integrator=INTEGRATOR)
+    elif(STREAM_SPACING is None):
+        streams = bi_trace(field, mask, pos, level=level, n_points=STREAM_LENGTH, angle_thresh=ANGLE_THRESH,
+                           cont=cont, integrator=INTEGRATOR)
+    else:
+        streams = compute_streamlines(field, mask, orig, level=level, tissue=tissue, rng=SEED, cont=cont,
+                                      spacing=STREAM_SPACING)
+
+    streams.save(path)
+    write_manifest(path, name, key, source_files, params)
+
+    return streams
+
+
+def find_extendable_streamlines(name, params, load_path=LOAD_PATH):
+
+    '''
+    Find the cached streamlines that differ from params only by a smaller (or
+    equal) stream_length and angle_thresh, and can be extended to params.
+
+    Returns:
+        Streamlines with the largest stream_length, or None
+    '''
+
+    limits = ('stream_length', 'angle_thresh')
+    best = None
+
+    for manifest in list_cache_entries(load_path, name):
+
+        old = manifest['params']
+
+        if manifest['stale'] or set(old) != set(params) or not os.path.exists(manifest['path']):
+            continue
+
+        if any(old[k] != params[k] for k in params if k not in limits):
+            continue
+
+        if any(old[k] > params[k] for k in limits):
+            continue
+
+        if best is None or [old[k] for k in limits] > [best['params'][k] for k in limits]:
+            best = manifest
+
+    if best is None:
+        return None
+
+    streams = Streamlines(best['path'])
+
+    if streams.stops is None:
+        return None
+
+    print('Extending cached streamlines: ', best['path'])
+
+    return streams
+
+
 def read_tiff_vtk(filename, folder='./', spacing=(1, 1, 1)):
 
+    import vtk # Only needed for the vtk reader (method='vtk' in load_tif)
+
     vtkDataReader = vtk.vtkTIFFReader()
     print('WARNING: using vtk tiff reader, may be issues depending onn vtk version.')
     vtkDataReader.SetFileName(os.path.join(folder, filename))
@@ -147,6 +685,8 @@ def read_tiff_vtk(filename, folder='./', spacing=(1, 1, 1)):
     return image
 
 def vtk_image_to_numpy_array(vtk_image):
+    from vtk.util import numpy_support
+
     dims = vtk_image.GetDimensions()
     scalar_data = vtk_image.GetPointData().GetScalars()
     numpy_image = numpy_support.vtk_to_numpy(scalar_data)
@@ -19,6 +19,7 @@ from heart_vis.load_data import *
 from heart_vis.convenience_funcs import *
 from heart_vis.data_processing import *
 from heart_vis.blender_draw import *
+from heart_vis.tracing import Streamlines, streamline_path
 
 # Other useful Python imports
 import os
@@ -27,32 +28,61 @@ import time
 def main():
 
     # Load data
-    volume = load_tif(IMAGE_DEPTH)
-    mask = load_tif(IMAGE_DEPTH, mask=True)
-    field = load_field_data()
+    if(CHUNKED_CACHE): # Standardized arrays, read from disk one chunk at a time
+        volume, mask, field = load_chunked_arrays(IMAGE_DEPTH)
 
-    # Standardize arrays
-    volume, mask, field = standardize_arrays(volume, mask, field)
+    else:
+        volume = load_tif(IMAGE_DEPTH)
+        mask = load_tif(IMAGE_DEPTH, mask=True)
+        field = load_field_data()
+
+        # Standardize arrays
+        volume, mask, field = standardize_arrays(volume, mask, field)
+
+    if(FIELD_ENCODING is not None): # Quantized field, decoded as it is sampled
+        field = load_compact_field(field)
+
+    # Downsampled data for previews (level 0 is full resolution)
+    pyr_volume, pyr_mask, pyr_field = load_pyramid_level(PYRAMID_LEVEL, volume, mask, field)
 
     if(FULL_STREAMLINES): # Streamlining in entire field (not subvolume)
 
-        bi_streamlining(field, mask, label=FILE+'_all_'+SUPP_DESC)
+        label = FILE+'_all_'+SUPP_DESC
+
+        if(TRACED_STREAMLINES): # Traced by headless_trace.py
+            bi_streamlining(pyr_field, pyr_mask, label=label, streams=Streamlines(streamline_path(label)))
+
+        else:
+            tissue = load_tissue_index(pyr_field, level=PYRAMID_LEVEL)
+            cont = load_continuation_mask(pyr_field, pyr_mask, level=PYRAMID_LEVEL)
+            streams = load_streamlines(pyr_field, pyr_mask, level=PYRAMID_LEVEL, tissue=tissue, cont=cont)
+            bi_streamlining(pyr_field, pyr_mask, label=label, streams=streams)
 
     # Define the subvolume
     cube_dims = (x,y,z,window_x, window_y, depth)
     subfield, cube = get_subvolume(field,cube_dims)
 
-   if(VOLUMETRIC): # Create a volumetric representation of the tissue using shader nodes
-       make_volumetric_cube(volume, cube_dims)
-       make_volumetric_cube(field,cube_dims, isfield=True)
+    if(VOLUMETRIC): # Create a volumetric representation of the tissue using shader nodes
+        make_volumetric_cube(pyr_volume, cube_dims, level=PYRAMID_LEVEL)
+        make_volumetric_cube(pyr_field,cube_dims, isfield=True, level=PYRAMID_LEVEL)
+
+    # Create a 3D grid of glyphs that fills the volume of the specified cube (subvolume)
+    glyph_level = select_level(cube_dims, N_GLYPHS) if GLYPH_LEVEL == 'auto' else GLYPH_LEVEL
+    glyph_volume, glyph_mask, glyph_field = load_pyramid_level(glyph_level, volume, mask, field)
+    glyph_cont = load_continuation_mask(glyph_field, glyph_mask, level=glyph_level)
+    dense_glyph_volume(glyph_field, cube, glyph_mask,dims=cube_dims, downsample=True,label='glyphs', level=glyph_level, cont=glyph_cont)
+
+    if(SUBVOL_STREAMLINES): # Create streamlines originating in the subvolume
+        label = str(cube_dims)+SUPP_DESC
 
-   # Create a 3D grid of glyphs that fills the volume of the specified cube (subvolume)
-   dense_glyph_volume(field, cube, mask,dims=cube_dims, downsample=True,label='glyphs')
+        if(TRACED_STREAMLINES): # Traced by headless_trace.py
+            bi_streamlining(field,mask, cube, label=label, streams=Streamlines(streamline_path(label)))
 
-   if(SUBVOL_STREAMLINES): # Create streamlines originating in the subvolume
-       bi_streamlining(field,mask, cube, label=str(cube_dims)+SUPP_DESC)
+        else:
+            streams = load_streamlines(field, mask, cube, cont=load_continuation_mask(field, mask))
+            bi_streamlining(field,mask, cube, label=label, streams=streams)
 
-   bpy.ops.wm.save_mainfile(filepath=BLEND_FILEPATH+'.blend')
+    bpy.ops.wm.save_mainfile(filepath=BLEND_FILEPATH+'.blend')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+#occupancy.py
+import numpy as np
+
+'''
+Coarse occupancy grid for evenly spaced streamlines (after Jobard and Lefer,
+"Creating evenly-spaced streamlines of arbitrary density", 1997).
+
+The field is divided into cubic cells of half the streamline spacing, and each
+cell records the seed whose streamlines passed through it first (-1 if none).
+A streamline stops when it enters a cell next to one owned by another seed (its
+cell or one of the 26 neighbours), and new seeds are only placed where the cell
+and its 26 neighbours are all empty. Points of different seeds in cells that
+are not neighbours are at least one cell apart, so streamlines stay at least
+half the spacing apart (the separating distance of Jobard and Lefer).
+'''
+
+class OccupancyGrid:
+
+    '''
+    Input:
+        shape: (m,n,p) shape of the traced field
+        spacing: float; distance between streamlines, in field voxels
+    '''
+
+    def __init__(self, shape, spacing):
+
+        self.cell = spacing / 2
+        self.grid_shape = tuple(int(np.ceil(s / self.cell)) for s in shape[:3])
+        self.owners = np.full(self.grid_shape, -1, dtype=np.int32)
+
+    def cells(self, points):
+
+        '''
+        (n,3) grid cells of (n,3) points, clipped to the grid.
+        '''
+
+        with np.errstate(invalid='ignore'):
+            cells = np.floor(np.asarray(points) / self.cell).astype(np.int64)
+
+        return np.clip(cells, 0, np.asarray(self.grid_shape) - 1)
+
+    def neighbour_cells(self, cells):
+
+        '''
+        (27,n,3) cells of the 3x3x3 neighbourhoods of (n,3) cells, clipped to the grid.
+        '''
+
+        upper = np.asarray(self.grid_shape) - 1
+        offsets = np.array(list(np.ndindex(3, 3, 3))) - 1
+
+        return np.clip(cells[None] + offsets[:, None], 0, upper)
+
+    def blocked(self, points, owners):
+
+        '''
+        Check whether (n,3) points are next to cells owned by other seeds than
+        owners, or next to an earlier point (in order) of another seed, as the
+        points of one step are marked together.
+        '''
+
+        owners = np.asarray(owners)
+        cells = self.cells(points)
+        near = self.neighbour_cells(cells)
+
+        cell_owners = self.owners[near[..., 0], near[..., 1], near[..., 2]]
+        blocked = np.any((cell_owners >= 0) & (cell_owners != owners), axis=0)
+
+        return blocked | self.clashes(cells, owners)
+
+    def clashes(self, cells, owners):
+
+        '''
+        Check whether (n,3) cells are next to the cell of an earlier point (in
+        order) of another owner, for points that are claimed together.
+
+        A later point with another owner in the same cell as the first point of
+        the cell clashes with it, so the points left in a cell all have the first
+        point's owner, and it's enough to compare with the first point of each
+        neighbouring cell. (A point next to a clashing point is also dropped.)
+        '''
+
+        if len(cells) < 2:
+            return np.zeros(len(cells), dtype=bool)
+
+        owners = np.asarray(owners)
+        flat = np.ravel_multi_index(cells.T, self.grid_shape)
+        claimed, first = np.unique(flat, return_index=True)
+
+        near = self.neighbour_cells(cells)
+        near_flat = np.ravel_multi_index(near.transpose(2, 0, 1), self.grid_shape)
+        pos = np.clip(np.searchsorted(claimed, near_flat), 0, len(claimed) - 1)
+        earlier = first[pos]
+        clash = (claimed[pos] == near_flat) & (earlier < np.arange(len(cells))) & (owners[earlier] != owners)
+
+        return np.any(clash, axis=0)
+
+    def mark(self, points, owners):
+
+        '''
+        Mark the empty cells of (n,3) points as owned by owners.
+        '''
+
+        cells = self.cells(points)
+        free = self.owners[cells[:, 0], cells[:, 1], cells[:, 2]] < 0
+        cells = cells[free]
+        self.owners[cells[:, 0], cells[:, 1], cells[:, 2]] = np.asarray(owners)[free]
+
+    def empty(self, points):
+
+        '''
+        Check whether the cells of (n,3) points and their neighbours are all empty.
+        '''
+
+        near = self.neighbour_cells(self.cells(points))
+
+        return np.all(self.owners[near[..., 0], near[..., 1], near[..., 2]] < 0, axis=0)
+
+    def spaced(self, points):
+
+        '''
+        Indices of the points (in order) whose neighbourhoods are empty, and that
+        are not next to an earlier one of them, so that new seeds are also
+        spaced from each other.
+        '''
+
+        inds = np.flatnonzero(self.empty(points))
+        cells = self.cells(np.asarray(points)[inds])
+
+        return inds[~self.clashes(cells, np.arange(len(inds)))]
@@ -0,0 +1,283 @@
+#orientation.py
+import numpy as np
+
+from heart_vis.config import *
+
+'''
+Zero-copy orientation of the loaded volume, mask and field arrays.
+
+An Orientation records how a loaded array (as returned by load_tif and
+load_field_data) maps to the standardized array used for drawing:
+    crop: (lo, hi) voxel range of each loaded axis that is kept
+    axes: loaded axis used for each standardized axis (a permutation of 0,1,2)
+    flips: whether each standardized axis is reversed
+    components: loaded field component used for each standardized component
+
+The standardized arrays are numpy views of the loaded ones. For the field,
+the component swizzle is applied as voxels are indexed (OrientedField), so the
+field is never copied.
+'''
+
+class Orientation:
+
+    '''
+    Input:
+        crop: ((lo, hi), (lo, hi), (lo, hi)) kept range of each loaded axis
+        axes: tuple; loaded axis for each standardized axis
+        flips: tuple of Booleans; reversed standardized axes
+        components: tuple; loaded field component for each standardized component
+    '''
+
+    def __init__(self, crop, axes=(0, 1, 2), flips=(False, False, False), components=(0, 1, 2)):
+
+        self.crop = tuple((int(lo), int(hi)) for lo, hi in crop)
+        self.axes = tuple(axes)
+        self.flips = tuple(bool(f) for f in flips)
+        self.components = tuple(components)
+
+    def __repr__(self):
+
+        return ('Orientation(crop=' + str(self.crop) + ', axes=' + str(self.axes) +
+                ', flips=' + str(self.flips) + ', components=' + str(self.components) + ')')
+
+    @property
+    def shape(self):
+
+        '''
+        Shape of the standardized (x,y,z) axes.
+        '''
+
+        return tuple(self.crop[a][1] - self.crop[a][0] for a in self.axes)
+
+    def rotate90(self, axes=(1, 2)):
+
+        '''
+        Orientation after np.rot90(array, 1, axes) of the standardized array.
+        '''
+
+        a0, a1 = axes
+        new_axes = list(self.axes)
+        new_flips = list(self.flips)
+
+        # rot90: out[.., i, .., j, ..] = in[.., j, .., n - 1 - i, ..] for axes (a0, a1)
+        new_axes[a0], new_axes[a1] = self.axes[a1], self.axes[a0]
+        new_flips[a0], new_flips[a1] = not self.flips[a1], self.flips[a0]
+
+        return Orientation(self.crop, new_axes, new_flips, self.components)
+
+    def swizzle(self, components):
+
+        '''
+        Orientation after reordering the standardized field components.
+        '''
+
+        return Orientation(self.crop, self.axes, self.flips,
+                           tuple(self.components[c] for c in components))
+
+    def view(self, array):
+
+        '''
+        Standardized view of a loaded [m,n,p] or [m,n,p,q] array (no component swizzle).
+        '''
+
+        crop = tuple(slice(lo, hi) for lo, hi in self.crop)
+        out = array[crop].transpose(self.axes + tuple(range(3, array.ndim)))
+        flip = tuple(slice(None, None, -1) if f else slice(None) for f in self.flips)
+
+        return out[flip]
+
+    def field_view(self, field):
+
+        '''
+        Standardized field: a view if the components are not reordered,
+        otherwise an OrientedField applying the reordering as it is indexed.
+        '''
+
+        out = self.view(field)
+
+        if self.components == tuple(range(len(self.components))):
+            return out
+
+        return OrientedField(out, self.components)
+
+    def to_loaded(self, inds):
+
+        '''
+        Map (n,3) standardized voxel indices (or coordinates) to loaded array indices.
+        '''
+
+        inds = np.asarray(inds)
+        out = np.empty(inds.shape, dtype=np.result_type(inds, np.int64))
+        shape = self.shape
+
+        for d, a in enumerate(self.axes):
+            i = inds[..., d]
+            if self.flips[d]:
+                i = shape[d] - 1 - i
+            out[..., a] = i + self.crop[a][0]
+
+        return out
+
+    def from_loaded(self, inds):
+
+        '''
+        Map (n,3) loaded array indices (or coordinates) to standardized indices.
+        '''
+
+        inds = np.asarray(inds)
+        out = np.empty(inds.shape, dtype=np.result_type(inds, np.int64))
+        shape = self.shape
+
+        for d, a in enumerate(self.axes):
+            i = inds[..., a] - self.crop[a][0]
+            if self.flips[d]:
+                i = shape[d] - 1 - i
+            out[..., d] = i
+
+        return out
+
+    def to_loaded_vectors(self, vects):
+
+        '''
+        Map (n,3) standardized field vectors to the loaded component order.
+        '''
+
+        vects = np.asarray(vects)
+        out = np.empty_like(vects)
+        out[..., list(self.components)] = vects
+
+        return out
+
+    def from_loaded_vectors(self, vects):
+
+        '''
+        Map (n,3) loaded field vectors to the standardized component order.
+        '''
+
+        return np.asarray(vects)[..., list(self.components)]
+
+
+class OrientedField:
+
+    '''
+    Read-only, array-like field with reordered components.
+
+    Indexing a voxel or window returns a numpy array with the components in the
+    standardized order, copying only the indexed values.
+
+    Input:
+        base: [m,n,p,3] array (view) with the components in the loaded order
+        components: tuple; base component for each standardized component
+    '''
+
+    def __init__(self, base, components):
+
+        self.base = base
+        self.components = tuple(components)
+        self.shape = base.shape
+        self.ndim = base.ndim
+        self.dtype = base.dtype
+
+    def __len__(self):
+
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+
+        # Explicit conversion copies the whole field.
+        arr = self.base[..., list(self.components)]
+
+        return arr if dtype is None else arr.astype(dtype)
+
+    def sum(self, axis=None, dtype=None, out=None, **kwargs):
+
+        # Sum over the components in the standardized order (as the rounding of
+        # the tissue test depends on it), without copying the field.
+        if axis in (3, -1) and out is None and not kwargs:
+            total = self.base[..., self.components[0]].astype(dtype or self.dtype)
+            for c in self.components[1:]:
+                total = total + self.base[..., c]
+            return total
+
+        return np.asarray(self).sum(axis=axis, dtype=dtype, out=out, **kwargs)
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        assert not any(k is Ellipsis for k in key), 'Ellipsis indexing not supported by OrientedField'
+
+        if len(key) > 3 and isinstance(key[3], (int, np.integer)):
+            return self.base[key[:3] + (self.components[key[3]],)]
+
+        vects = self.base[key[:3]][..., list(self.components)]
+
+        if len(key) > 3:
+            vects = vects[..., key[3]]
+
+        return vects
+
+
+def standardize_arrays(volume, mask, field):
+
+    '''
+    Standardize the input arrays so their dimensions are aligned.
+
+    The standardized arrays are views of the input arrays (see Orientation),
+    when rotating, the field is an OrientedField swapping the y and z components
+    as it is indexed.
+
+    Input:
+        volume: ndarray; reprenting intensity values of the tissue volume
+        mask: ndarray; representing the mask to be used to constrain the streamlines
+        field: ndarray; containing the orientation values for each dimension
+
+    Returns:
+        crop_volume
+        crop_mask
+        crop_field
+    '''
+
+    orient = get_orientation(volume, mask, field)
+
+    if(ROTATE):
+        print('Shape of cropped arrays (before rotation): ', orient.crop)
+        print('Shape of cropped arrays (after rotation): ')
+
+    crop_volume = orient.view(volume)
+    crop_mask = orient.view(mask)
+    crop_field = orient.field_view(field)
+
+    print('Shape of cropped arrays: ')
+    print(crop_volume.shape)
+    print(crop_mask.shape)
+    print(crop_field.shape)
+
+    return crop_volume, crop_mask, crop_field
+
+
+def get_orientation(volume, mask, field):
+
+    '''
+    Get the Orientation mapping the loaded arrays to the standardized ones:
+    cropped to their common size and, if ROTATE, rotated 90 degrees in the y-z
+    plane with the y and z field components swapped.
+    '''
+
+    min_x = np.min([volume.shape[0], mask.shape[0], field.shape[0]])
+    min_y = np.min([volume.shape[1], mask.shape[1], field.shape[1]])
+    min_z = np.min([volume.shape[2], mask.shape[2], field.shape[2]])
+    print('Minimum dimensions: ',min_x,min_y,min_z)
+
+    assert volume.shape[1] == mask.shape[1], 'Mismatch between size of y axis'
+    assert volume.shape[1] == field.shape[1], 'Mismatch between size of y axis'
+    assert field.shape[1] == mask.shape[1], 'Mismatch between size of y axis'
+
+    orient = Orientation(((0, min_x), (0, min_y), (0, min_z)))
+
+    if(ROTATE):
+        orient = orient.rotate90((1, 2))
+        orient = orient.swizzle((0, 2, 1))  # When rotating, also need to swap field values for y and z components
+
+    return orient
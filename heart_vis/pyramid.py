@@ -0,0 +1,128 @@
+#pyramid.py
+import numpy as np
+
+from heart_vis.config import *
+
+'''
+Multi-resolution pyramid of the standardized volume, mask and field.
+
+Level 0 is the full resolution data, and each level is downsampled 2x from the
+one below it, so level L has a voxel size of 2**L. Voxel i of level L covers the
+voxels [i * 2**L, (i + 1) * 2**L) of level 0.
+
+    volume: averaged
+    mask: max-pooled (a coarse voxel is in the mask if any of its voxels are)
+    field: tissue vectors sign-aligned, averaged and renormalized. Coarse voxels
+        without tissue keep their background vector, so the tissue test
+        (components don't sum to 1) and FILT_VECT still apply.
+'''
+
+def level_factor(level):
+
+    return 2 ** int(level)
+
+
+def select_level(cube_dims, n_samples, max_level=PYRAMID_MAX_LEVEL):
+
+    '''
+    Choose the coarsest level that still has at least n_samples voxels in the cube.
+    '''
+
+    xpos,ypos,zpos,window_x, window_y, depth = cube_dims
+    n_voxels = window_x * window_y * depth
+
+    level = 0
+    while level < max_level and n_voxels / level_factor(level + 1) ** 3 >= n_samples:
+        level += 1
+
+    print('Selected pyramid level ', level, ' for ', n_samples, ' samples of ', n_voxels, ' voxels')
+
+    return level
+
+
+def coarse_to_fine(coords, level):
+
+    '''
+    Convert (n,3) coordinates of a pyramid level to level 0 coordinates,
+    placing them at the center of the voxels they cover.
+    '''
+
+    f = level_factor(level)
+
+    return np.asarray(coords) * f + (f - 1) / 2
+
+
+def block_view(slab, f, fill):
+
+    '''
+    Pad the first three axes of slab to multiples of f and reshape it so that each
+    f*f*f block is along axis 3: (m/f, n/f, p/f, f**3, ...)
+    '''
+
+    pad = [(0, -s % f) for s in slab.shape[:3]] + [(0, 0)] * (slab.ndim - 3)
+    slab = np.pad(slab, pad, mode='constant', constant_values=fill)
+
+    m, n, p = [s // f for s in slab.shape[:3]]
+    rest = slab.shape[3:]
+    blocks = slab.reshape((m, f, n, f, p, f) + rest)
+    blocks = blocks.transpose((0, 2, 4, 1, 3, 5) + tuple(range(6, 6 + len(rest))))
+
+    return blocks.reshape((m, n, p, f ** 3) + rest)
+
+
+def downsample_volume(slab, f=2):
+
+    blocks = block_view(slab.astype(np.float64), f, np.nan)
+    mean = np.nanmean(blocks, axis=3)
+
+    if np.issubdtype(slab.dtype, np.integer):
+        mean = np.round(mean)
+
+    return mean.astype(slab.dtype)
+
+
+def downsample_mask(slab, f=2):
+
+    return np.max(block_view(slab, f, 0), axis=3)
+
+
+def downsample_field(slab, f=2):
+
+    blocks = block_view(slab, f, np.nan)
+    finite = np.all(np.isfinite(blocks), axis=-1)
+    tissue = finite & (np.sum(blocks, axis=-1) != 1) # Tissue test in the field's own precision
+    blocks = blocks.astype(np.float64)
+
+    # Align the signs to the first tissue vector of each block before averaging
+    first = np.argmax(tissue, axis=3)[..., None, None]
+    ref = np.take_along_axis(blocks, first, axis=3)
+    sign = np.where(np.sum(blocks * ref, axis=-1, keepdims=True) < 0, -1, 1)
+    vects = np.where(tissue[..., None], blocks * sign, 0)
+
+    mean = np.sum(vects, axis=3)
+    norm = np.linalg.norm(mean, axis=-1, keepdims=True)
+    mean = mean / np.where(norm > 0, norm, 1)
+
+    # Blocks without tissue keep their (first) background vector
+    first_bg = np.argmax(finite, axis=3)[..., None, None]
+    background = np.take_along_axis(blocks, first_bg, axis=3)[:, :, :, 0]
+    has_tissue = np.any(tissue, axis=3)[..., None]
+
+    return np.where(has_tissue, mean, background).astype(slab.dtype)
+
+
+def downsample(array, func, out, f=2, slab=32):
+
+    '''
+    Downsample array into out (e.g. a memory map), slab * f x-slices at a time.
+    '''
+
+    for x0 in range(0, out.shape[0], slab):
+        out[x0:x0 + slab] = func(np.asarray(array[x0 * f:(x0 + slab) * f]), f)
+
+    return out
+
+
+def coarse_shape(shape, f=2):
+
+    return tuple(int(np.ceil(s / f)) for s in shape[:3]) + tuple(shape[3:])
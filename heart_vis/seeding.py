@@ -0,0 +1,303 @@
+#seeding.py
+import numpy as np
+import os
+
+from heart_vis.config import *
+
+'''
+Streamline seed sampling.
+
+The tissue voxels (field components not summing to 1, as in sample_field_vals)
+are stored as a packed bitmask, one bit per voxel packed along z, together with
+the number of tissue voxels in each x-slice. Seeds are drawn as random ranks
+among the tissue voxels and converted to voxel indices one x-slice at a time,
+so the (N,3) array of all tissue voxels is never created.
+'''
+
+def build_tissue_index(field, path=None, slab=16):
+
+    '''
+    Compute the packed tissue bitmask of a field, slab x-slices at a time.
+
+    Input:
+        field: [m,n,p,3] array (or array-like field)
+        path: (optional) str; folder to save bits.npy and counts.npy into
+
+    Returns:
+        TissueIndex
+    '''
+
+    shape = tuple(field.shape[:3])
+    packed_shape = shape[:2] + (int(np.ceil(shape[2] / 8)),)
+
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+        bits = np.lib.format.open_memmap(os.path.join(path, 'bits.npy'), mode='w+',
+                                         dtype=np.uint8, shape=packed_shape)
+    else:
+        bits = np.empty(packed_shape, dtype=np.uint8)
+
+    counts = np.zeros(shape[0], dtype=np.int64)
+
+    for x0 in range(0, shape[0], slab):
+        tissue = np.sum(np.asarray(field[x0:x0 + slab]), axis=3) != 1
+        bits[x0:x0 + slab] = np.packbits(tissue, axis=-1)
+        counts[x0:x0 + slab] = np.sum(tissue, axis=(1, 2))
+
+    print('Tissue index: ', np.sum(counts), ' tissue voxels')
+
+    if path is not None:
+        bits.flush()
+        np.save(os.path.join(path, 'counts.npy'), counts)
+        del bits
+        return TissueIndex(path)
+
+    return TissueIndex(bits=bits, counts=counts)
+
+
+class TissueIndex:
+
+    '''
+    Packed bitmask of the tissue voxels of a field.
+
+    Input:
+        path: (optional) str; folder written by build_tissue_index(), the bitmask
+            is memory mapped and only the x-slices seeds are drawn from are read.
+        bits, counts: in-memory bitmask and per x-slice counts, if no path is given.
+    '''
+
+    def __init__(self, path=None, bits=None, counts=None):
+
+        if path is not None:
+            bits = np.load(os.path.join(path, 'bits.npy'), mmap_mode='r')
+            counts = np.load(os.path.join(path, 'counts.npy'))
+
+        self.bits = bits
+        self.counts = counts
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.count = int(self.offsets[-1])
+
+    def slice_tissue(self, x):
+
+        '''
+        (y,z) indices of the tissue voxels in x-slice x, in C order.
+        '''
+
+        # The padding bits of the last byte are zero, so don't need removing
+        return np.nonzero(np.unpackbits(self.bits[x], axis=-1))
+
+    def contains(self, inds):
+
+        '''
+        Check whether (n,3) voxel indices are tissue voxels.
+        '''
+
+        inds = np.asarray(inds, dtype=np.int64)
+        byte = self.bits[inds[:, 0], inds[:, 1], inds[:, 2] // 8]
+
+        return ((byte >> (7 - inds[:, 2] % 8)) & 1).astype(bool)
+
+    def rank_to_index(self, ranks):
+
+        '''
+        Convert ranks (0 <= rank < count) among the tissue voxels, in C order,
+        to (n,3) voxel indices.
+        '''
+
+        ranks = np.asarray(ranks, dtype=np.int64)
+        order = np.argsort(ranks, kind='stable')
+        sorted_ranks = ranks[order]
+
+        xs = np.searchsorted(self.offsets, sorted_ranks, side='right') - 1
+        inds = np.empty((len(ranks), 3), dtype=np.int64)
+
+        # Unpack each x-slice that seeds are drawn from once
+        bounds = np.flatnonzero(np.diff(np.concatenate([[-1], xs, [-1]])))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            x = xs[start]
+            ys, zs = self.slice_tissue(x)
+            local = sorted_ranks[start:stop] - self.offsets[x]
+            inds[order[start:stop]] = np.stack([np.full(stop - start, x), ys[local], zs[local]], axis=1)
+
+        return inds
+
+    def sample(self, n, rng=None):
+
+        '''
+        Draw n distinct tissue voxels uniformly at random.
+
+        Input:
+            n: int; number of seeds
+            rng: (optional) numpy Generator
+
+        Returns:
+            pos: (n,3) array of voxel indices, in random order
+        '''
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        assert n <= self.count, 'Not enough tissue voxels to draw ' + str(n) + ' seeds'
+
+        # Generator.choice draws a small sample of a large range without a permutation of it
+        ranks = rng.choice(self.count, n, replace=False)
+
+        return self.rank_to_index(ranks)
+
+
+def region_bounds(shape, region=None):
+
+    '''
+    Get the bounding box of a seeding region.
+
+    Input:
+        shape: (m,n,p) shape of the field
+        region: None for the whole field, an (xx,yy,zz) meshcube from get_subvolume(),
+            a ((x_lo,x_hi),(y_lo,y_hi),(z_lo,z_hi)) box, or an [m,n,p] boolean array
+
+    Returns:
+        lo, hi: (x,y,z) lower and upper (exclusive) voxel bounds
+    '''
+
+    if region is None or (isinstance(region, np.ndarray) and region.dtype == bool):
+        return np.zeros(3, dtype=np.int64), np.asarray(shape[:3], dtype=np.int64)
+
+    if len(region) == 3 and np.ndim(region[0]) == 3: # Meshcube
+        lo = np.array([np.min(region[d]) for d in range(3)], dtype=np.int64)
+        hi = np.array([np.max(region[d]) for d in range(3)], dtype=np.int64) + 1
+    else:
+        lo = np.array([region[d][0] for d in range(3)], dtype=np.int64)
+        hi = np.array([region[d][1] for d in range(3)], dtype=np.int64)
+
+    return np.maximum(lo, 0), np.minimum(hi, shape[:3])
+
+
+def valid_seeds(field, mask, inds, region=None):
+
+    '''
+    Check whether (n,3) voxel indices are valid seeds: in the mask, in the tissue
+    (field components don't sum to 1) and, for a boolean region, in the region.
+    '''
+
+    xs, ys, zs = inds[:, 0], inds[:, 1], inds[:, 2]
+    valid = np.asarray(mask[xs, ys, zs]) > 0
+    valid &= np.sum(np.asarray(field[xs, ys, zs]), axis=-1) != 1
+
+    if isinstance(region, np.ndarray) and region.dtype == bool:
+        valid &= region[xs, ys, zs]
+
+    return valid
+
+
+def sample_seeds(field, mask, n, region=None, rng=None, tissue=None, batch=65536, max_rounds=32):
+
+    '''
+    Draw n distinct streamline seeds uniformly from the valid voxels of a region,
+    without creating the coordinates of every candidate voxel.
+
+    Candidates are drawn in batches, uniformly from the region's bounding box (or
+    from the tissue index, if given), and rejected if they are not valid seeds
+    (see valid_seeds()). If that doesn't find enough seeds, because valid voxels
+    are sparse, the region is scanned slab by slab, keeping the n valid voxels
+    with the smallest random keys (reservoir sampling).
+    Memory use depends on n and batch, not on the size of the region.
+
+    Input:
+        field: [m,n,p,3] array (or array-like field)
+        mask: [m,n,p] array
+        n: int; number of seeds
+        region: None for the whole field, an (xx,yy,zz) meshcube from get_subvolume(),
+            a ((x_lo,x_hi),(y_lo,y_hi),(z_lo,z_hi)) box, or an [m,n,p] boolean array
+        rng: None, int seed or numpy Generator
+        tissue: (optional) TissueIndex of field, to draw whole-field candidates from
+
+    Returns:
+        pos: (n,3) int array of voxel indices in random order (fewer if the region
+            doesn't contain n valid voxels)
+    '''
+
+    rng = np.random.default_rng(rng)
+    shape = tuple(field.shape[:3])
+    lo, hi = region_bounds(shape, region)
+    strides = np.array([shape[1] * shape[2], shape[2], 1], dtype=np.int64)
+
+    if np.any(hi <= lo):
+        print('Empty seeding region, no seeds drawn')
+        return np.zeros((0, 3), dtype=np.int64)
+
+    # Small regions are cheaper to scan than to sample
+    if np.prod(hi - lo) <= batch:
+        return reservoir_seeds(field, mask, n, lo, hi, region, rng)
+
+    seeds = np.zeros((0, 3), dtype=np.int64)
+    use_tissue = tissue is not None and region is None
+    n_drawn = 0
+    n_accepted = 0
+
+    for r in range(max_rounds):
+
+        n_needed = n - len(seeds)
+        if n_needed <= 0:
+            break
+
+        # Size the batch from the acceptance rate so far
+        rate = max(n_accepted / n_drawn, 1e-3) if n_drawn > 0 else 0.5
+        n_draw = int(min(batch, max(n_needed / rate * 1.2, 256)))
+
+        if use_tissue:
+            cand = tissue.rank_to_index(rng.integers(0, tissue.count, n_draw))
+        else:
+            cand = rng.integers(lo, hi, size=(n_draw, 3))
+
+        valid = valid_seeds(field, mask, cand, region)
+        n_drawn += n_draw
+        n_accepted += int(np.sum(valid))
+
+        # Keep the first occurrence of each new voxel, in draw order
+        seeds = np.concatenate([seeds, cand[valid]])
+        _, first = np.unique(seeds @ strides, return_index=True)
+        seeds = seeds[np.sort(first)]
+
+    if len(seeds) >= n:
+        return seeds[:n]
+
+    print('Rejection sampling found ', len(seeds), ' of ', n, ' seeds, scanning the region instead')
+
+    return reservoir_seeds(field, mask, n, lo, hi, region, rng)
+
+
+def reservoir_seeds(field, mask, n, lo, hi, region=None, rng=None, slab=8):
+
+    '''
+    Draw n distinct valid seeds from the box [lo, hi), scanning it slab x-slices
+    at a time and keeping the n valid voxels with the smallest random keys.
+    '''
+
+    rng = np.random.default_rng(rng)
+    keys = np.zeros(0)
+    seeds = np.zeros((0, 3), dtype=np.int64)
+
+    for x0 in range(lo[0], hi[0], slab):
+
+        x1 = min(x0 + slab, hi[0])
+        box = (slice(x0, x1), slice(lo[1], hi[1]), slice(lo[2], hi[2]))
+
+        valid = np.asarray(mask[box]) > 0
+        valid &= np.sum(np.asarray(field[box]), axis=3) != 1
+        if isinstance(region, np.ndarray) and region.dtype == bool:
+            valid &= region[box]
+
+        inds = np.argwhere(valid) + np.array([x0, lo[1], lo[2]])
+
+        keys = np.concatenate([keys, rng.random(len(inds))])
+        seeds = np.concatenate([seeds, inds])
+
+        if len(keys) > n:
+            keep = np.argpartition(keys, n)[:n]
+            keys = keys[keep]
+            seeds = seeds[keep]
+
+    if len(seeds) < n:
+        print('WARNING: only ', len(seeds), ' valid seeds in the region, fewer than ', n)
+
+    return seeds[np.argsort(keys)]
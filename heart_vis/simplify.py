@@ -0,0 +1,126 @@
+#simplify.py
+import numpy as np
+
+from heart_vis.config import *
+from heart_vis.tracing import Streamlines
+
+'''
+Streamline simplification before drawing.
+
+Every traced point would otherwise become a control point of the curve drawn
+for the streamline (stream2curve), although most of the unit steps lie on a
+nearly straight path. simplify_streamlines() removes the points that lie within
+a tolerance (in voxels) of the simplified polyline, with the Ramer-Douglas-Peucker
+algorithm: a segment between two kept points is split at its farthest point
+while that point is farther than the tolerance from it.
+
+All the streamlines are simplified together, on the packed points: each round
+splits every segment of every streamline that still needs it, so the number of
+rounds is the depth of the subdivision, not the number of segments.
+'''
+
+def segment_distances(points, a, b):
+
+    '''
+    Distance of (n,3) points to the (n,3) segments from a to b.
+    '''
+
+    ab = b - a
+    ab_len2 = np.sum(ab * ab, axis=1)
+
+    # Position of the closest point along the segment (a for zero length segments)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.clip(np.sum((points - a) * ab, axis=1) / ab_len2, 0, 1)
+    t = np.where(ab_len2 > 0, t, 0)
+
+    diff = points - (a + t[:, None] * ab)
+
+    return np.sqrt(np.sum(diff * diff, axis=1))
+
+
+def simplify_lines(points, offsets, tol=SIMPLIFY_TOL):
+
+    '''
+    Ramer-Douglas-Peucker simplification of packed polylines.
+
+    Input:
+        points: [P,3] array; the points of all the lines, concatenated
+        offsets: [n+1] array; start of each line in points
+        tol: float; maximum distance (voxels) of a removed point to the simplified line
+
+    Returns:
+        keep: [P] Boolean array; the points kept (always the first and last of each line)
+        max_dev: float; largest distance of a removed point to the simplified line
+    '''
+
+    points = np.asarray(points, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    keep = np.zeros(len(points), dtype=bool)
+    lengths = np.diff(offsets)
+    keep[offsets[:-1][lengths > 0]] = True
+    keep[offsets[1:][lengths > 0] - 1] = True
+
+    # Segments (start and end point) that may have points to remove
+    starts = offsets[:-1][lengths > 2]
+    ends = offsets[1:][lengths > 2] - 1
+    max_dev = 0.0
+
+    while len(starts) > 0:
+
+        # Interior points of each segment, with the segment they belong to
+        n_inner = ends - starts - 1
+        seg = np.repeat(np.arange(len(starts)), n_inner)
+        first = np.cumsum(n_inner) - n_inner
+        inds = starts[seg] + 1 + np.arange(len(seg)) - first[seg]
+
+        dist = segment_distances(points[inds], points[starts[seg]], points[ends[seg]])
+
+        # Farthest interior point of each segment (the first one, if several)
+        seg_max = np.maximum.reduceat(dist, first)
+        farthest = np.flatnonzero(dist == seg_max[seg])
+        farthest = farthest[np.unique(seg[farthest], return_index=True)[1]]
+
+        split = seg_max > tol
+        if np.any(~split):
+            max_dev = max(max_dev, float(np.max(seg_max[~split])))
+
+        # Keep the farthest points of the split segments, and split those in two
+        mid = inds[farthest[split]]
+        keep[mid] = True
+
+        starts, ends = np.concatenate([starts[split], mid]), np.concatenate([mid, ends[split]])
+        inner = ends - starts > 1
+        starts, ends = starts[inner], ends[inner]
+
+    return keep, max_dev
+
+
+def simplify_streamlines(streams, tol=SIMPLIFY_TOL):
+
+    '''
+    Simplify the lines of a Streamlines object for drawing, printing the point
+    count reduction and the largest deviation from the traced lines.
+
+    Input:
+        streams: Streamlines (see tracing.py)
+        tol: float; maximum deviation (voxels) of the simplified lines, None to
+            keep every point
+
+    Returns:
+        Streamlines with the simplified lines
+    '''
+
+    if tol is None or len(streams.points) == 0:
+        return streams
+
+    keep, max_dev = simplify_lines(streams.points, streams.offsets, tol)
+
+    # Kept points before the start of each line
+    offsets = np.concatenate([[0], np.cumsum(keep)])[streams.offsets]
+
+    print('Simplified streamlines: ', len(streams.points), ' to ', int(np.sum(keep)), ' points (',
+          round(100 * np.sum(keep) / len(streams.points), 1), '%), max deviation ', round(max_dev, 3), ' voxels')
+
+    return Streamlines(points=streams.points[keep], offsets=offsets, cmap_vals=streams.cmap_vals,
+                       signs=streams.signs, seeds=streams.seeds, stops=streams.stops, state=streams.state)
@@ -0,0 +1,85 @@
+#subvolume.py
+import numpy as np
+
+from heart_vis.config import *
+
+'''
+Subvolumes (cubes) of the standardized arrays, described by their cube
+dimensions (xpos, ypos, zpos, window_x, window_y, depth) in voxels.
+'''
+
+def get_subvolume(field, cube_dims, isfield=True):
+
+    '''
+    Process a subvolume of the field for a given position and window.
+
+    Input:
+        field: ndarray
+        cube_dims: tuple; (xpos, ypos, zpos,window, depth)
+        isfield: boolean;determine whether to expect one or 3 values
+
+    Returns:
+        subfield: [3,m,n,p] array
+        (xx,yy,zz): tuple, 3D meshgrid coordinates
+
+    '''
+    # Unpack the cube dimensions
+    xpos,ypos,zpos,window_x, window_y, depth = cube_dims
+
+
+    if(window_x * window_y * depth > 10000):
+
+        print(' Warning, subvolume contains: ',str(window_x * window_y * depth),' voxels, may be difficult to draw them all.' )
+
+    x_hi = int(xpos + window_x / 2)
+    x_lo = int(xpos - window_x / 2)
+    y_hi = int(ypos + window_y / 2)
+    y_lo = int(ypos - window_y / 2)
+    z_hi = int(zpos + depth / 2)
+    z_lo = int(zpos - depth / 2)
+
+    if(isfield):
+        sub_field = field[x_lo:x_hi, y_lo:y_hi,z_lo:z_hi, :] # updated to transposed array
+    else:
+        sub_field = field[x_lo:x_hi, y_lo:y_hi,z_lo:z_hi]
+
+    # Get the index positions for each of the Glyphs.
+    xs = np.arange(x_lo,x_hi)
+    ys = np.arange(y_lo,y_hi)
+    zs = np.arange(z_lo,z_hi)
+
+    xx,yy,zz = np.meshgrid(xs,ys,zs)
+
+    print('Created subvolume of field, shape: ', np.shape(sub_field))
+
+    return sub_field, (xx,yy,zz)
+
+
+def scale_cube_dims(cube_dims, factor):
+
+    '''
+    Convert the cube dimensions to a level of the pyramid downsampled by factor,
+    covering all of the coarse voxels that overlap the original cube.
+
+    Input:
+        cube_dims: tuple; (xpos, ypos, zpos, window_x, window_y, depth)
+        factor: int; downsampling factor of the level
+
+    Returns:
+        coarse_dims: tuple; (xpos, ypos, zpos, window_x, window_y, depth) in coarse voxels
+    '''
+
+    if(factor == 1):
+        return cube_dims
+
+    xpos,ypos,zpos,window_x, window_y, depth = cube_dims
+
+    coarse_dims = []
+    for pos, window in zip((xpos, ypos, zpos), (window_x, window_y, depth)):
+        lo = int(pos - window / 2) // factor
+        hi = -(-int(pos + window / 2) // factor) # ceil
+        coarse_dims.append(((lo + hi) / 2, hi - lo))
+
+    (xpos, window_x), (ypos, window_y), (zpos, depth) = coarse_dims
+
+    return (xpos, ypos, zpos, window_x, window_y, depth)
@@ -0,0 +1,85 @@
+#tif_decode.py
+import numpy as np
+import time
+from PIL import Image # For importing a tiff
+
+'''
+Decoding of tif pages into a preallocated stack (see read_tif_stack in load_data.py).
+
+The pool workers of read_tif_stack run decode_tif_pages_to_file(). This module
+only imports numpy and PIL, so that worker processes started with spawn (the
+default on Windows and macOS) can import it without Blender or the other
+dependencies of load_data.py.
+'''
+
+EOF = 'EOF' # Timing of the page where the file ended (compared with ==, as it is sent back by the workers)
+
+def decode_tif_pages(img, imstack, slots):
+
+    '''
+    Decode tif pages into slices of a preallocated stack.
+
+    Pages whose data can't be decoded are skipped, and decoding stops at the end
+    of the file (a truncated tif), as when the pages were read one at a time.
+    Their slices are left as they are, see stacked_slices().
+
+    parameters:
+        img: PIL Image of the multi-page tif
+        imstack: (height, width, depth) array or memmap to write into
+        slots: list of (k, i) tuples; page i of the tif is written to imstack[:,:,k]
+
+    Returns:
+        timings: list of (k, i, seconds) tuples, seconds is None if the page
+            could not be decoded, and EOF for the page where the file ended.
+    '''
+
+    timings = []
+
+    for k, i in slots:
+        t_slice = time.time()
+        try:
+            img.seek(i)
+            imstack[:,:,k] = np.asarray(img)
+        except EOFError:
+            # The file ends before this page, don't read any further
+            timings.append((k, i, EOF))
+            break
+        except (ValueError, OSError):
+            # Page header was readable but its data was not (e.g. "image file is truncated")
+            timings.append((k, i, None))
+            continue
+
+        timings.append((k, i, time.time() - t_slice))
+
+    return timings
+
+
+def stacked_slices(timings, n_slots):
+
+    '''
+    Slices of the stack that hold decoded pages: those before the end of the
+    file, without the pages that could not be decoded.
+
+    Input:
+        timings: combined timings of decode_tif_pages() for all n_slots slots
+
+    Returns:
+        keep: sorted list of slice indices k
+    '''
+
+    end = min([k for k, i, dt in timings if dt == EOF], default=n_slots)
+
+    return sorted(k for k, i, dt in timings if dt is not None and dt != EOF and k < end)
+
+
+def decode_tif_pages_to_file(tif_path, out_file, slots):
+
+    '''
+    Worker process version of decode_tif_pages(), writing into the .npy file out_file.
+    '''
+
+    imstack = np.load(out_file, mmap_mode='r+')
+    timings = decode_tif_pages(Image.open(tif_path), imstack, slots)
+    imstack.flush()
+
+    return timings
@@ -0,0 +1,961 @@
+#tracing.py
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from heart_vis.config import *
+from heart_vis.pyramid import coarse_to_fine, level_factor
+from heart_vis.seeding import build_tissue_index, sample_seeds
+from heart_vis.chunk_store import ChunkedVolume
+from heart_vis.field_codec import QuantizedField
+from heart_vis.orientation import OrientedField
+from heart_vis.continuation import ContinuationMask
+from heart_vis.occupancy import OccupancyGrid
+
+'''
+Streamline tracing, independent of Blender.
+
+compute_streamlines() draws the seeds and traces the bidirectional streamlines,
+returning them as a Streamlines object (polylines and colormap values) that can
+be saved, e.g. on a compute node without Blender (see headless_trace.py), and
+loaded and drawn in Blender afterwards (blender_draw.bi_streamlining()).
+
+All the streamlines are traced together: the position of every active streamline
+is kept in an (N,3) array and all of them take a step at once, with the field
+and mask values gathered for the whole array. Streamlines that stop are retired
+from the active arrays.
+
+The stepping follows the original per-seed algorithm of stream_curves:
+    - The vector at the current point is field[floor(x), floor(y), floor(z)]
+    - The first two steps go in the sign direction, after that the direction
+        (+ or - the vector) making the smallest angle with the previous segment
+    - A streamline stops when that angle reaches angle_thresh, or the next point
+        is out of bounds, outside the mask or has the filtered vector (FILT_VECT).
+        With a continuation mask (see continuation.py) these three checks are a
+        single lookup.
+
+The angles are compared as cosines (the smallest angle has the largest cosine),
+so no arccos is needed. Unlike calc_angle, this doesn't give a nan angle (and
+stop the streamline) when two steps in the same voxel are collinear and their
+cosine rounds to just above 1.
+
+The 'rk2' and 'rk4' integrators (trace_adaptive) instead interpolate the field
+trilinearly, with the vectors sign-aligned to the current direction, and adapt
+the step length to the local error estimate: long steps where the field is
+smooth, short ones where it curves. They give fewer points per streamline than
+the unit Euler steps for the same length (see benchmark_integrators()).
+
+The tracers also return why each streamline stopped (STOP_REASONS) and its end
+state (last two points, steps or length taken, step length), so streamlines that
+only stopped at the length or angle limit can be resumed when STREAM_LENGTH or
+ANGLE_THRESH is raised (extend_streamlines()), instead of being traced again.
+'''
+
+# Why a streamline stopped, stored as the index in STOP_REASONS
+STOP_REASONS = ('length', 'bounds', 'mask', 'filter', 'angle', 'spacing', 'field')
+STOP_LENGTH, STOP_BOUNDS, STOP_MASK, STOP_FILTER, STOP_ANGLE, STOP_SPACING, STOP_FIELD = range(len(STOP_REASONS))
+
+def unit_vectors(vects):
+
+    norm = np.sqrt(np.sum(vects * vects, axis=1, keepdims=True))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return vects / norm # Zero length vectors give nan, as in calc_angle
+
+
+def in_bounds(points, shape):
+
+    return np.all((points >= 0) & (points < np.asarray(shape[:3])), axis=1)
+
+
+def gather(array, inds):
+
+    '''
+    Values of array at (n,3) integer voxel indices.
+    '''
+
+    return np.asarray(array[inds[:, 0], inds[:, 1], inds[:, 2]])
+
+
+def floor_inds(points):
+
+    with np.errstate(invalid='ignore'): # nan points give out of bounds indices
+        return np.floor(points).astype(np.int64)
+
+
+def trace_streamlines(field, mask, positions, sign, n_points=STREAM_LENGTH,
+                      angle_thresh=ANGLE_THRESH, filt_vect=FILT_VECT, cont=None, integrator=INTEGRATOR,
+                      occupancy=None, owners=None, state=None):
+
+    '''
+    Trace a streamline from each starting position, all in lockstep.
+
+    Input:
+        field: [m,n,p,3] array (or array-like field) with x,y,z vector components
+        mask: [m,n,p] array
+        positions: [n,3] array of starting points (field indexes)
+        sign: +-1, multiplier for the field vector for the first steps.
+        n_points: Maximum number of steps along each streamline
+        angle_thresh: Maximum angle (degrees) between consecutive segments
+        filt_vect: Field vector at which streamlines stop (None to disable)
+        cont: (optional) ContinuationMask of field, mask and filt_vect, replacing
+            the bounds, mask and filt_vect checks.
+        integrator: 'euler' (unit steps), or 'rk2' / 'rk4' (adaptive steps, see
+            trace_adaptive(), n_points is then the maximum length in voxels)
+        occupancy: (optional) OccupancyGrid, streamlines stop when they enter a
+            cell of another seed's streamlines, and mark the cells they pass through
+        owners: [n] array; seed number of each position in the occupancy grid
+        state: (optional) [n,8] array; end state of streamlines to resume (see
+            Returns), positions are then their last points.
+
+    Returns:
+        lines: list of [k,3] arrays, the points of each streamline (in the
+            order of positions), starting with its starting position
+        cmap_vals: [n] array, colormap value of each streamline (the angle of
+            the starting vector to the z axis, radians)
+        stops: [n] int8 array, why each streamline stopped (index in STOP_REASONS)
+        state: [n,8] array, end state of each streamline: its previous and
+            current (last) point, the number of steps (length for rk2 / rk4)
+            and the step length
+    '''
+
+    if integrator != 'euler':
+        return trace_adaptive(field, mask, positions, sign, n_points=n_points, angle_thresh=angle_thresh,
+                              filt_vect=filt_vect, cont=cont, order=int(integrator[-1]),
+                              occupancy=occupancy, owners=owners, state=state)
+
+    positions = np.asarray(positions)
+    n_lines = len(positions)
+    cos_thresh = np.cos(np.radians(angle_thresh))
+
+    seeds = np.floor(positions).astype(np.int64)
+    cmap_vals = np.arccos(np.abs(gather(field, seeds)[:, 2]))
+
+    # Active streamlines: index, current and previous point, steps taken
+    ids = np.arange(n_lines)
+
+    if state is None:
+        cur = positions.astype(np.float64)
+        prev = np.zeros_like(cur)
+        steps = np.zeros(n_lines, dtype=np.int64)
+    else:
+        prev = state[:, 0:3].astype(np.float64)
+        cur = state[:, 3:6].astype(np.float64)
+        steps = state[:, 6].astype(np.int64)
+
+    stops = np.full(n_lines, STOP_LENGTH, dtype=np.int8)
+    end_state = np.zeros((n_lines, 8))
+
+    # Points of each step, with the streamline they belong to
+    step_ids = [ids]
+    step_points = [cur]
+
+    if occupancy is not None:
+        owners = np.arange(n_lines) if owners is None else np.asarray(owners)
+        occupancy.mark(cur, owners)
+
+    while len(ids) > 0:
+
+        # (The current points are in bounds: the seeds are, and the next points are checked)
+        # Get the vector at the current positions
+        d = gather(field, np.floor(cur).astype(np.int64)).astype(np.float64)
+
+        # Both potential next points, choose the one making the smallest angle
+        nxt_pos = cur + d
+        nxt_neg = cur - d
+
+        uv1 = unit_vectors(cur - prev)
+        cos_pos = np.sum(uv1 * unit_vectors(nxt_pos - cur), axis=1)
+        cos_neg = np.sum(uv1 * unit_vectors(nxt_neg - cur), axis=1)
+
+        # (nan cosines go to the - direction and stop the streamline)
+        use_pos = cos_pos > cos_neg
+        nxt = np.where(use_pos[:, None], nxt_pos, nxt_neg)
+        cond_angle = np.where(use_pos, cos_pos, cos_neg) > cos_thresh
+
+        # For the first two points, can't calculate angle, so go in the sign direction
+        first = steps <= 1
+        nxt[first] = cur[first] + d[first] * sign
+        cond_angle |= first
+
+        # Check the next point is in bounds, in the mask and doesn't have the filtered vector
+        reason = np.where(cond_angle, -1, STOP_ANGLE).astype(np.int8)
+        cont_ok = voxel_valid(field, mask, floor_inds(nxt[cond_angle]), filt_vect, cont)
+        reason[np.flatnonzero(cond_angle)[~cont_ok]] = stop_reason(field, mask, nxt[cond_angle][~cont_ok])
+        reason[steps >= n_points] = STOP_LENGTH
+
+        keep = reason < 0
+
+        if occupancy is not None:
+            blocked = occupancy.blocked(nxt[keep], owners[ids[keep]])
+            reason[np.flatnonzero(keep)[blocked]] = STOP_SPACING
+            keep = reason < 0
+            occupancy.mark(nxt[keep], owners[ids[keep]])
+
+        # Record why the others stopped, and where
+        done = ~keep
+        stops[ids[done]] = reason[done]
+        end_state[ids[done]] = np.column_stack([prev[done], cur[done], steps[done], np.ones(np.sum(done))])
+
+        # Advance the streamlines that continue, retire the others
+        ids, prev, cur, steps = ids[keep], cur[keep], nxt[keep], steps[keep] + 1
+        step_ids.append(ids)
+        step_points.append(cur)
+
+    return group_points(step_ids, step_points, n_lines), cmap_vals, stops, end_state
+
+
+def group_points(step_ids, step_points, n_lines):
+
+    '''
+    Group the points of each step by streamline, keeping the step order.
+    '''
+
+    all_ids = np.concatenate(step_ids)
+    order = np.argsort(all_ids, kind='stable')
+    points = np.concatenate(step_points)[order]
+    lengths = np.bincount(all_ids, minlength=n_lines)
+
+    return np.split(points, np.cumsum(lengths)[:-1])
+
+
+def voxel_valid(field, mask, inds, filt_vect=FILT_VECT, cont=None):
+
+    '''
+    Check whether (n,3) integer voxel indices can be continued into
+    (in bounds, in the mask and not filt_vect).
+    '''
+
+    if cont is not None:
+        return cont.contains(inds)
+
+    valid = in_bounds(inds, field.shape)
+    ok = inds[valid]
+    cond = gather(mask, ok) > 0
+
+    if filt_vect is not None:
+        cond &= ~np.all(gather(field, ok) == np.asarray(filt_vect), axis=1)
+
+    valid[valid] = cond
+
+    return valid
+
+
+def stop_reason(field, mask, points):
+
+    '''
+    Why (n,3) points that can't be continued into can't be: STOP_BOUNDS,
+    STOP_MASK or (in bounds and in the mask) STOP_FILTER.
+    '''
+
+    inds = floor_inds(points)
+    valid = in_bounds(inds, field.shape)
+    reason = np.full(len(inds), STOP_BOUNDS, dtype=np.int8)
+    reason[valid] = np.where(gather(mask, inds[valid]) > 0, STOP_FILTER, STOP_MASK)
+
+    return reason
+
+
+def interp_field(field, mask, points, ref, filt_vect=FILT_VECT, cont=None):
+
+    '''
+    Trilinear interpolation of the field at (n,3) points (voxel i spans [i, i+1)).
+
+    The vectors of the 8 surrounding voxels are sign-aligned to the (n,3)
+    reference directions before averaging, and voxels that can't be continued
+    into are left out.
+
+    Returns:
+        vects: (n,3) unit vectors
+        ok: (n,) Booleans, False where none of the surrounding voxels are valid
+    '''
+
+    q = points - 0.5
+    with np.errstate(invalid='ignore'):
+        i0 = np.floor(q).astype(np.int64)
+    t = q - i0
+
+    acc = np.zeros(points.shape)
+    w_sum = np.zeros(len(points))
+    upper = np.asarray(field.shape[:3]) - 1
+
+    for corner in np.ndindex(2, 2, 2):
+
+        inds = i0 + corner
+        w = np.prod(np.where(corner, t, 1 - t), axis=1) * voxel_valid(field, mask, inds, filt_vect, cont)
+
+        v = gather(field, np.clip(inds, 0, upper)).astype(np.float64)
+        v = np.where((np.sum(v * ref, axis=1) < 0)[:, None], -v, v)
+
+        acc += w[:, None] * v
+        w_sum += w
+
+    norm = np.sqrt(np.sum(acc * acc, axis=1))
+    ok = (w_sum > 0) & (norm > 0)
+
+    return acc / np.where(ok, norm, 1)[:, None], ok
+
+
+def trace_adaptive(field, mask, positions, sign, n_points=STREAM_LENGTH, angle_thresh=ANGLE_THRESH,
+                   filt_vect=FILT_VECT, cont=None, order=4, tol=STEP_TOL, h_min=STEP_MIN, h_max=STEP_MAX,
+                   occupancy=None, owners=None, state=None):
+
+    '''
+    Trace a streamline from each starting position with an adaptive Runge-Kutta
+    integrator, all in lockstep.
+
+    Each step is taken with the RK2 (midpoint) or RK4 scheme on the interpolated
+    field (interp_field()), and its error estimated as the distance to the
+    lower-order (Euler for RK2, midpoint for RK4) result. Steps with an error
+    above tol are retried shorter, and the next step length is adjusted to the
+    error, within [h_min, h_max] voxels.
+
+    A streamline stops when the angle between consecutive steps reaches
+    angle_thresh, the next point can't be continued into, the field around it
+    is invalid, or it is n_points voxels long.
+
+    Input:
+        as trace_streamlines(), and
+        order: 2 or 4
+        tol: maximum error per step (voxels)
+        h_min, h_max: step length range (voxels)
+
+    Returns:
+        lines, cmap_vals, stops, state: as trace_streamlines()
+    '''
+
+    assert order in (2, 4), 'Unknown integrator order: ' + str(order)
+
+    positions = np.asarray(positions)
+    n_lines = len(positions)
+    cos_thresh = np.cos(np.radians(angle_thresh))
+
+    seeds = np.floor(positions).astype(np.int64)
+    seed_vects = gather(field, seeds).astype(np.float64)
+    cmap_vals = np.arccos(np.abs(seed_vects[:, 2]))
+
+    # Active streamlines: index, current and previous point, direction, step length and length so far
+    ids = np.arange(n_lines)
+
+    if state is None:
+        cur = positions.astype(np.float64)
+        prev = cur.copy()
+        dirs = unit_vectors(seed_vects * sign)
+        h = np.full(n_lines, 1.0)
+        length = np.zeros(n_lines)
+    else:
+        prev = state[:, 0:3].astype(np.float64)
+        cur = state[:, 3:6].astype(np.float64)
+        dirs = unit_vectors(cur - prev)
+        # Streamlines that stopped before their first step are still at their seed
+        unmoved = np.all(cur == prev, axis=1)
+        dirs[unmoved] = unit_vectors(seed_vects[unmoved] * sign)
+        length = state[:, 6].astype(np.float64)
+        h = state[:, 7].astype(np.float64)
+
+    stops = np.full(n_lines, STOP_LENGTH, dtype=np.int8)
+    end_state = np.zeros((n_lines, 8))
+
+    step_ids = [ids]
+    step_points = [cur]
+
+    if occupancy is not None:
+        owners = np.arange(n_lines) if owners is None else np.asarray(owners)
+        occupancy.mark(cur, owners)
+
+    for it in range(4 * n_points):
+
+        # Retire the streamlines that reached the length limit
+        capped = length >= n_points
+        if np.any(capped):
+            end_state[ids[capped]] = np.column_stack([prev[capped], cur[capped], length[capped], h[capped]])
+            keep = ~capped
+            ids, prev, cur, dirs, h, length = ids[keep], prev[keep], cur[keep], dirs[keep], h[keep], length[keep]
+
+        if len(ids) == 0:
+            break
+
+        hh = h[:, None]
+        k1, ok = interp_field(field, mask, cur, dirs, filt_vect, cont)
+        k2, ok2 = interp_field(field, mask, cur + hh / 2 * k1, k1, filt_vect, cont)
+
+        if(order == 2):
+            high = cur + hh * k2
+            low = cur + hh * k1
+            ok &= ok2
+
+        else:
+            k3, ok3 = interp_field(field, mask, cur + hh / 2 * k2, k1, filt_vect, cont)
+            k4, ok4 = interp_field(field, mask, cur + hh * k3, k1, filt_vect, cont)
+            high = cur + hh / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            low = cur + hh * k2
+            ok &= ok2 & ok3 & ok4
+
+        # Error control: accept the step, or retry it shorter
+        err = np.sqrt(np.sum((high - low) ** 2, axis=1))
+        accept = ok & ((err <= tol) | (h <= h_min))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factor = np.clip(0.9 * np.sqrt(tol / err), 0.25, 2)
+        factor = np.where(ok, factor, 0.25) # Invalid field within the step: retry shorter
+        h_next = np.clip(h * factor, h_min, h_max)
+        retry = ~accept & (ok | (h > h_min))
+
+        # Stop rules of the accepted steps
+        step = high - cur
+        step_len = np.sqrt(np.sum(step * step, axis=1))
+        step_dir = unit_vectors(step)
+
+        reason = np.where(accept | retry, -1, STOP_FIELD).astype(np.int8)
+        cont_ok = voxel_valid(field, mask, floor_inds(high[accept]), filt_vect, cont)
+        reason[np.flatnonzero(accept)[~cont_ok]] = stop_reason(field, mask, high[accept][~cont_ok])
+        reason[accept & (reason < 0) & ~(np.sum(step_dir * dirs, axis=1) > cos_thresh)] = STOP_ANGLE
+        advance = accept & (reason < 0)
+
+        if occupancy is not None:
+            blocked = occupancy.blocked(high[advance], owners[ids[advance]])
+            reason[np.flatnonzero(advance)[blocked]] = STOP_SPACING
+            advance = accept & (reason < 0)
+            occupancy.mark(high[advance], owners[ids[advance]])
+
+        step_ids.append(ids[advance])
+        step_points.append(high[advance])
+
+        # Record why the others stopped, and where (with the step length they stopped at)
+        done = reason >= 0
+        stops[ids[done]] = reason[done]
+        end_state[ids[done]] = np.column_stack([prev[done], cur[done], length[done], h[done]])
+
+        # Keep the streamlines that advanced or retry a shorter step, retire the others
+        length = length + np.where(advance, step_len, 0)
+        keep = ~done
+
+        prev = np.where(advance[:, None], cur, prev)[keep]
+        cur = np.where(advance[:, None], high, cur)[keep]
+        dirs = np.where(advance[:, None], step_dir, dirs)[keep]
+        ids, h, length = ids[keep], h_next[keep], length[keep]
+
+    # Streamlines still active after the iteration limit
+    end_state[ids] = np.column_stack([prev, cur, length, h])
+
+    return group_points(step_ids, step_points, n_lines), cmap_vals, stops, end_state
+
+
+def benchmark_integrators(field, mask, positions, sign=1, integrators=('euler', 'rk2', 'rk4'), cont=None):
+
+    '''
+    Trace the same seeds with each integrator and print the tracing speed and
+    the number of points per streamline.
+
+    Returns:
+        results: dict; integrator: (seconds, points per streamline, length per streamline)
+    '''
+
+    results = {}
+
+    for integrator in integrators:
+
+        t_start = time.time()
+        lines = trace_streamlines(field, mask, positions, sign, cont=cont, integrator=integrator)[0]
+        dt = max(time.time() - t_start, 1e-9)
+
+        n_steps = sum(len(line) - 1 for line in lines)
+        length = sum(np.sum(np.sqrt(np.sum(np.diff(line, axis=0) ** 2, axis=1))) for line in lines)
+        results[integrator] = (dt, (n_steps + len(lines)) / len(lines), length / len(lines))
+
+        print(integrator, ': %.2f s, %.0f steps/s, %.1f points and %.1f voxels per streamline' %
+              (dt, n_steps / dt, results[integrator][1], results[integrator][2]))
+
+    return results
+
+
+class Streamlines:
+
+    '''
+    Set of polylines, packed into one array of points.
+
+    Line i is points[offsets[i]:offsets[i+1]], in full resolution field coordinates.
+
+    Input:
+        path: (optional) str; .npz file written by save(), to load
+        points: [P,3] array; the points of all the lines, concatenated
+        offsets: [n+1] array; start of each line in points
+        cmap_vals: [n] array; colormap value of each line
+        signs: [n] array; +-1, direction of each line from its seed
+        seeds: [n,3] array; starting point of each line
+        stops: (optional) [n] array; why each line stopped (index in STOP_REASONS)
+        state: (optional) [n,8] array; end state of each line, in the coordinates
+            it was traced in (see trace_streamlines()), to resume it
+    '''
+
+    def __init__(self, path=None, points=None, offsets=None, cmap_vals=None, signs=None, seeds=None,
+                 stops=None, state=None):
+
+        if path is not None:
+            with np.load(path) as data:
+                points, offsets, cmap_vals, signs, seeds = [data[k] for k in
+                    ('points', 'offsets', 'cmap_vals', 'signs', 'seeds')]
+
+                # (Files saved before stop reasons were recorded can't be extended)
+                if 'stops' in data:
+                    stops, state = data['stops'], data['state']
+
+        self.points = points
+        self.offsets = offsets
+        self.cmap_vals = cmap_vals
+        self.signs = signs
+        self.seeds = seeds
+        self.stops = stops
+        self.state = state
+
+    def __len__(self):
+
+        return len(self.cmap_vals)
+
+    def line(self, i):
+
+        return self.points[self.offsets[i]:self.offsets[i + 1]]
+
+    def lengths(self):
+
+        return np.diff(self.offsets)
+
+    def save(self, path):
+
+        # Compact: float32 points, float32 colormap values and int8 signs.
+        # The end state stays float64, so resumed lines continue exactly.
+        arrays = {'points': self.points.astype(np.float32), 'offsets': self.offsets.astype(np.int64),
+                  'cmap_vals': self.cmap_vals.astype(np.float32), 'signs': self.signs.astype(np.int8),
+                  'seeds': self.seeds.astype(np.float32)}
+
+        if self.stops is not None:
+            arrays['stops'] = self.stops.astype(np.int8)
+            arrays['state'] = self.state.astype(np.float64)
+
+        np.savez(path, **arrays)
+
+        print('Saved ', len(self), ' streamlines: ', path)
+
+
+def pack_lines(lines, cmap_vals, signs, seeds, stops=None, state=None):
+
+    '''
+    Pack a list of [k,3] polylines into a Streamlines object.
+    '''
+
+    lengths = [len(line) for line in lines]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    points = np.concatenate(lines) if len(lines) else np.zeros((0, 3))
+
+    if stops is not None:
+        stops = np.asarray(stops, dtype=np.int8)
+        state = np.asarray(state).reshape(-1, 8)
+
+    return Streamlines(points=points, offsets=offsets, cmap_vals=np.asarray(cmap_vals),
+                       signs=np.asarray(signs), seeds=np.asarray(seeds), stops=stops, state=state)
+
+
+def bi_trace(field, mask, positions, level=0, n_points=STREAM_LENGTH, angle_thresh=ANGLE_THRESH,
+             n_workers=TRACE_WORKERS, cont=None, integrator=INTEGRATOR, occupancy=None, owners=None):
+
+    '''
+    Trace the streamlines from each position in the + (1) and - (1) direction.
+
+    Input:
+        field, mask: arrays of a pyramid level (see pyramid.py)
+        positions: [n,3] array of starting points, in level coordinates
+        level: int; pyramid level of field, mask and positions. The streamlines
+            are returned in full resolution coordinates.
+        n_workers: int; number of tracing processes, 1 traces in this process
+        cont: (optional) ContinuationMask of field and mask
+        integrator: 'euler', 'rk2' or 'rk4', see trace_streamlines()
+        occupancy, owners: (optional) OccupancyGrid and seed numbers, see
+            trace_streamlines(). The grid is updated as the streamlines are
+            traced, so this is done in this process.
+
+    Returns:
+        Streamlines: the + lines of all positions, then the - lines
+    '''
+
+    lines = []
+    cmap_vals = []
+    signs = []
+    stops = []
+    state = []
+
+    for sign in (1, -1):
+
+        if(n_workers > 1 and occupancy is None):
+            traced = trace_parallel(field, mask, positions, sign, n_points=n_points, angle_thresh=angle_thresh,
+                                    n_workers=n_workers, cont=cont, integrator=integrator)
+        else:
+            traced = trace_streamlines(field, mask, positions, sign, n_points=n_points, angle_thresh=angle_thresh,
+                                       cont=cont, integrator=integrator, occupancy=occupancy, owners=owners)
+
+        sign_lines, sign_cmap_vals, sign_stops, sign_state = traced
+
+        lines += [coarse_to_fine(line, level) for line in sign_lines]
+        cmap_vals.append(sign_cmap_vals)
+        signs += [sign] * len(sign_lines)
+        stops.append(sign_stops)
+        state.append(sign_state)
+
+    seeds = coarse_to_fine(np.tile(np.asarray(positions), (2, 1)), level)
+
+    return pack_lines(lines, np.concatenate(cmap_vals), signs, seeds, np.concatenate(stops), np.concatenate(state))
+
+
+def extend_streamlines(field, mask, streams, level=0, n_points=STREAM_LENGTH, angle_thresh=ANGLE_THRESH,
+                       n_workers=TRACE_WORKERS, cont=None, integrator=INTEGRATOR, reasons=('length', 'angle')):
+
+    '''
+    Continue streamlines traced with a smaller n_points or angle_thresh, instead
+    of tracing them again from their seeds.
+
+    Only the streamlines that stopped for one of reasons are resumed from their
+    end state, the others are kept as they are. Tracing is deterministic and a
+    larger n_points or angle_thresh doesn't change the steps already taken, so
+    the result is the same as tracing the seeds with the new parameters.
+
+    Input:
+        field, mask, level, n_workers, cont, integrator: as bi_trace(), the
+            same as streams was traced with
+        streams: Streamlines with stop reasons and end states
+        reasons: tuple of STOP_REASONS to resume
+
+    Returns:
+        Streamlines
+    '''
+
+    assert streams.stops is not None, 'Streamlines have no end state to resume from'
+
+    resume = np.isin(streams.stops, [STOP_REASONS.index(r) for r in reasons])
+    lines = [streams.line(i) for i in range(len(streams))]
+    stops = streams.stops.copy()
+    state = streams.state.copy()
+
+    for sign in (1, -1):
+
+        inds = np.flatnonzero(resume & (streams.signs == sign))
+        if len(inds) == 0:
+            continue
+
+        positions = streams.state[inds, 3:6]
+
+        if(n_workers > 1):
+            traced = trace_parallel(field, mask, positions, sign, n_points=n_points, angle_thresh=angle_thresh,
+                                    n_workers=n_workers, cont=cont, integrator=integrator, state=streams.state[inds])
+        else:
+            traced = trace_streamlines(field, mask, positions, sign, n_points=n_points, angle_thresh=angle_thresh,
+                                       cont=cont, integrator=integrator, state=streams.state[inds])
+
+        sign_lines, _, stops[inds], state[inds] = traced
+
+        # The resumed lines start with their last point
+        for i, line in zip(inds, sign_lines):
+            lines[i] = np.concatenate([lines[i], coarse_to_fine(line[1:], level)])
+
+    print('Extended ', np.sum(resume), ' of ', len(streams), ' streamlines')
+
+    return pack_lines(lines, streams.cmap_vals, streams.signs, streams.seeds, stops, state)
+
+
+def compute_streamlines(field, mask, orig=None, level=0, tissue=None, n_seeds=N_STREAMLINES, rng=SEED, cont=None,
+                        spacing=STREAM_SPACING):
+
+    '''
+    Draw the seeds and trace bidirectional streamlines, without Blender.
+
+    Input:
+        field, mask: arrays (or array-like) of a pyramid level
+        orig: (xx,yy,zz) tuple (meshcube) Origin of the streamlines, defaults to a random sample of the entire field,
+            But otherwise a sub-volume can be provided.
+        level: int; pyramid level of field and mask, only for the entire field (orig is None).
+        tissue: (optional) TissueIndex of field to draw the seeds from, otherwise
+            it is computed from the field.
+        n_seeds: int; number of seeds
+        rng: None, int seed or numpy Generator for the seeds
+        cont: (optional) ContinuationMask of field and mask, see load_continuation_mask()
+        spacing: (optional) float; distance between streamlines (full resolution
+            voxels) for evenly spaced streamlines (see trace_spaced()), at most
+            n_seeds of them.
+
+    Returns:
+        Streamlines
+    '''
+
+    assert orig is None or level == 0, 'Subvolume streamlines are drawn at full resolution'
+
+    rng = np.random.default_rng(rng)
+
+    # Standard way of visualizing start positions: random tissue voxels
+    if orig is None and tissue is None:
+        tissue = build_tissue_index(field)
+
+    if spacing is not None:
+        streams = trace_spaced(field, mask, n_seeds, spacing / level_factor(level), orig=orig,
+                               level=level, tissue=tissue, rng=rng, cont=cont)
+
+    else:
+        pos = draw_seeds(field, mask, n_seeds, orig=orig, tissue=tissue, rng=rng)
+        streams = bi_trace(field, mask, pos, level=level, cont=cont)
+
+    print('Traced ', np.sum(streams.signs == 1), ' bidirectional streamlines, ', len(streams.points), ' points')
+
+    return streams
+
+
+def draw_seeds(field, mask, n_seeds, orig=None, tissue=None, rng=None):
+
+    '''
+    Random seeds of compute_streamlines(): valid voxels of the entire field
+    (drawn from its tissue index, computed if not given), or of the sub-volume orig.
+    '''
+
+    if orig is None: # If no subvolume os provided, use the whole one.
+
+        if tissue is None:
+            tissue = build_tissue_index(field)
+
+        return sample_seeds(field, mask, n_seeds, rng=rng, tissue=tissue)
+
+    # Random valid voxels of the sub-volume, without listing all of its voxels
+    return sample_seeds(field, mask, n_seeds, region=orig, rng=rng)
+
+
+def trace_spaced(field, mask, n_seeds, spacing, orig=None, level=0, tissue=None, rng=None, cont=None,
+                 batch=256, max_misses=3):
+
+    '''
+    Trace evenly spaced bidirectional streamlines (see occupancy.py).
+
+    Seeds are traced in batches. The candidates of each batch are random valid
+    voxels (as in compute_streamlines()), of which only those in empty regions
+    of the occupancy grid are kept. Streamlines stop when they come within
+    about the spacing of another seed's streamlines. Tracing ends after n_seeds
+    seeds, or when max_misses batches in a row find no empty region.
+
+    Input:
+        field, mask, orig, level, tissue, rng, cont: as compute_streamlines()
+        n_seeds: int; maximum number of seeds
+        spacing: float; distance between streamlines, in field (level) voxels
+        batch: int; seeds traced together
+
+    Returns:
+        Streamlines
+    '''
+
+    occupancy = OccupancyGrid(field.shape, spacing)
+    parts = []
+    n_traced = 0
+    n_misses = 0
+
+    while n_traced < n_seeds and n_misses < max_misses:
+
+        cand = draw_seeds(field, mask, 4 * batch, orig=orig, tissue=tissue, rng=rng)
+
+        pos = cand[occupancy.spaced(cand)][:min(batch, n_seeds - n_traced)]
+
+        if len(pos) == 0:
+            n_misses += 1
+            continue
+
+        n_misses = 0
+        owners = n_traced + np.arange(len(pos))
+        parts.append(bi_trace(field, mask, pos, level=level, cont=cont, occupancy=occupancy, owners=owners))
+        n_traced += len(pos)
+
+    print('Evenly spaced streamlines: ', n_traced, ' seeds, spacing ', spacing, ' voxels')
+
+    return concat_streamlines(parts)
+
+
+def concat_streamlines(parts):
+
+    '''
+    Join a list of Streamlines into one.
+    '''
+
+    if len(parts) == 0:
+        return pack_lines([], [], [], np.zeros((0, 3)), [], np.zeros((0, 8)))
+
+    starts = np.cumsum([0] + [len(part.points) for part in parts[:-1]])
+    offsets = np.concatenate([[0]] + [part.offsets[1:] + start for part, start in zip(parts, starts)])
+
+    return Streamlines(points=np.concatenate([part.points for part in parts]), offsets=offsets,
+                       cmap_vals=np.concatenate([part.cmap_vals for part in parts]),
+                       signs=np.concatenate([part.signs for part in parts]),
+                       seeds=np.concatenate([part.seeds for part in parts]),
+                       stops=np.concatenate([part.stops for part in parts]),
+                       state=np.concatenate([part.state for part in parts]))
+
+
+def streamline_path(label, load_path=LOAD_PATH):
+
+    '''
+    File of the streamlines traced for a bi_streamlining() label.
+    '''
+
+    return os.path.join(load_path, 'streamlines_' + label + '.npz')
+
+
+def share_array(array, tmp_dir):
+
+    '''
+    Describe an array so that worker processes can open it without it being
+    pickled: memory maps (and views of them) by their file, stores by their
+    folder, other arrays are first written to a .npy file in tmp_dir.
+
+    Returns:
+        spec: tuple to pass to open_shared()
+    '''
+
+    if isinstance(array, (ChunkedVolume, QuantizedField)):
+        return ('store', type(array), array.path)
+
+    if isinstance(array, ContinuationMask):
+        return ('continuation', share_array(array.bits, tmp_dir))
+
+    if isinstance(array, OrientedField):
+        return ('oriented', share_array(array.base, tmp_dir), array.components)
+
+    # Find the memory map the array is a view of (views of a memmap are also
+    # memmaps, the one mapping the file is the one without an array base)
+    base = array
+    while isinstance(getattr(base, 'base', None), np.ndarray):
+        base = base.base
+
+    if not (isinstance(base, np.memmap) and base.filename is not None):
+        base = None
+
+    if base is not None:
+        # Byte offset of the first element in the file, the view keeps its strides
+        start = array.__array_interface__['data'][0] - base.__array_interface__['data'][0]
+        return ('memmap', base.filename, base.offset + start, array.shape, array.strides, array.dtype.str)
+
+    path = os.path.join(tmp_dir, str(len(os.listdir(tmp_dir))) + '.npy')
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+    for x0 in range(0, array.shape[0], 16):
+        out[x0:x0 + 16] = np.asarray(array[x0:x0 + 16])
+    out.flush()
+    del out
+
+    return share_array(np.load(path, mmap_mode='r'), tmp_dir)
+
+
+def open_shared(spec):
+
+    '''
+    Open an array described by share_array(), read-only.
+    '''
+
+    if spec[0] == 'store':
+        return spec[1](spec[2])
+
+    if spec[0] == 'oriented':
+        return OrientedField(open_shared(spec[1]), spec[2])
+
+    if spec[0] == 'continuation':
+        return ContinuationMask(bits=open_shared(spec[1]))
+
+    filename, offset, shape, strides, dtype = spec[1:]
+
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+
+    # Build the view with positive strides from its lowest address, then flip
+    # the axes that had negative strides
+    flips = tuple(slice(None, None, -1) if st < 0 else slice(None) for st in strides)
+    low = offset + sum((n - 1) * st for n, st in zip(shape, strides) if st < 0)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=data, offset=low,
+                       strides=tuple(abs(st) for st in strides))
+
+    return array[flips]
+
+
+# Field and mask opened by each tracing process
+worker_arrays = {}
+
+
+def init_trace_worker(field_spec, mask_spec, cont_spec):
+
+    worker_arrays['field'] = open_shared(field_spec)
+    worker_arrays['mask'] = open_shared(mask_spec)
+    worker_arrays['cont'] = open_shared(cont_spec) if cont_spec is not None else None
+
+
+def trace_task(positions, sign, n_points, angle_thresh, filt_vect, integrator, state=None):
+
+    '''
+    Trace a chunk of seeds in a worker process, returning the packed points.
+    '''
+
+    lines, cmap_vals, stops, end_state = trace_streamlines(worker_arrays['field'], worker_arrays['mask'], positions,
+                                                           sign, n_points=n_points, angle_thresh=angle_thresh,
+                                                           filt_vect=filt_vect, cont=worker_arrays['cont'],
+                                                           integrator=integrator, state=state)
+
+    return np.concatenate(lines), np.array([len(line) for line in lines]), cmap_vals, stops, end_state
+
+
+def trace_parallel(field, mask, positions, sign, n_points=STREAM_LENGTH, angle_thresh=ANGLE_THRESH,
+                   filt_vect=FILT_VECT, n_workers=TRACE_WORKERS, chunk_size=TRACE_CHUNK, cont=None,
+                   integrator=INTEGRATOR, state=None):
+
+    '''
+    trace_streamlines() in a pool of worker processes.
+
+    The seeds are split into chunks of chunk_size, handed out to the workers as
+    they become free, since some streamlines stop after a few points and others
+    run for n_points. The field and mask are opened by each worker from their
+    files (see share_array()), not sent to it. The tracing is deterministic and
+    the chunks are collected in seed order, so the result is the same as
+    trace_streamlines() for any number of workers.
+
+    Inside Blender, multiprocessing.set_executable() must point to the bundled
+    Python interpreter for the workers to start.
+
+    Returns:
+        lines, cmap_vals, stops, state: as trace_streamlines()
+    '''
+
+    positions = np.asarray(positions)
+    starts = range(0, len(positions), chunk_size)
+    chunks = [positions[c:c + chunk_size] for c in starts]
+    state_chunks = [None if state is None else state[c:c + chunk_size] for c in starts]
+    tmp_dir = tempfile.mkdtemp()
+
+    lines = []
+    cmap_vals = []
+    stops = []
+    end_state = []
+
+    try:
+        field_spec = share_array(field, tmp_dir)
+        mask_spec = share_array(mask, tmp_dir)
+        cont_spec = share_array(cont, tmp_dir) if cont is not None else None
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_trace_worker,
+                                 initargs=(field_spec, mask_spec, cont_spec)) as pool:
+
+            results = pool.map(trace_task, chunks, [sign] * len(chunks), [n_points] * len(chunks),
+                               [angle_thresh] * len(chunks), [filt_vect] * len(chunks),
+                               [integrator] * len(chunks), state_chunks)
+
+            for points, lengths, chunk_cmap_vals, chunk_stops, chunk_state in results:
+                lines += np.split(points, np.cumsum(lengths)[:-1])
+                cmap_vals.append(chunk_cmap_vals)
+                stops.append(chunk_stops)
+                end_state.append(chunk_state)
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('Traced ', len(positions), ' streamlines in ', len(chunks), ' chunks with ', n_workers, ' processes')
+
+    if len(chunks) == 0:
+        return lines, np.zeros(0), np.zeros(0, dtype=np.int8), np.zeros((0, 8))
+
+    return lines, np.concatenate(cmap_vals), np.concatenate(stops), np.concatenate(end_state)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope='session')
+def swirl():
+
+    '''
+    Synthetic field and mask: a noisy swirl around the z axis in a ring-shaped
+    mask, with a block of FILT_VECT ([0,0,1]) voxels inside the ring.
+    '''
+
+    shape = (60, 60, 20)
+    grid = np.stack(np.meshgrid(*[np.arange(s) + 0.5 for s in shape], indexing='ij'), -1)
+    dx = grid[..., 0] - 30
+    dy = grid[..., 1] - 30
+    r = np.hypot(dx, dy) + 1e-9
+
+    rng = np.random.default_rng(0)
+    vects = np.stack([-dy / r, dx / r, 0.1 * np.ones(shape)], -1) + 0.2 * rng.normal(size=shape + (3,))
+    field = (vects / np.linalg.norm(vects, axis=-1, keepdims=True)).astype(np.float32)
+    mask = ((r > 5) & (r < 27)).astype(np.uint8)
+    field[25:28, 8:14, 5:10] = [0, 0, 1]
+
+    seeds = np.argwhere(mask > 0)
+    seeds = seeds[rng.choice(len(seeds), 200, replace=False)]
+
+    return field, mask, seeds
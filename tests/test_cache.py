@@ -0,0 +1,133 @@
+import os
+import json
+import numpy as np
+
+from heart_vis.cache import (cache_key, cache_entry_path, write_manifest, read_manifest, is_fresh,
+                             list_cache_entries, prune_cache)
+
+
+def make_entry(load_path, source, name, params, value=1):
+
+    key = cache_key([source], params)
+    path = cache_entry_path(name, key, '.npy', str(load_path))
+    np.save(path, np.full(4, value))
+    write_manifest(path, name, key, [source], params)
+
+    return path, key
+
+
+def touch(path, mtime_ns):
+
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_key_depends_on_sources_and_params(tmp_path):
+
+    source = str(tmp_path / 'source.npy')
+    np.save(source, np.zeros(3))
+    touch(source, 10**18)
+
+    key = cache_key([source], {'rotate': True})
+
+    assert cache_key([source], {'rotate': True}) == key
+    assert cache_key([source], {'rotate': False}) != key
+
+    touch(source, 2 * 10**18)
+    assert cache_key([source], {'rotate': True}) != key
+
+
+def test_is_fresh(tmp_path):
+
+    source = str(tmp_path / 'source.npy')
+    np.save(source, np.zeros(3))
+    path, key = make_entry(tmp_path, source, 'entry', {'level': 1})
+
+    assert is_fresh(path, key)
+    assert read_manifest(path)['shape'] == [4]
+    assert not is_fresh(path, cache_key([source], {'level': 2}))
+
+    # The stored array no longer matches its manifest
+    np.save(path, np.zeros(5))
+    assert not is_fresh(path, key)
+
+    os.remove(path)
+    assert not is_fresh(path, key)
+
+
+def test_list_marks_stale_entries(tmp_path):
+
+    source = str(tmp_path / 'source.npy')
+    np.save(source, np.zeros(3))
+    touch(source, 10**18)
+    path, key = make_entry(tmp_path, source, 'entry', {'level': 1})
+
+    assert [m['stale'] for m in list_cache_entries(str(tmp_path))] == [False]
+
+    touch(source, 2 * 10**18)
+    entries = list_cache_entries(str(tmp_path), 'entry')
+    assert [(m['path'], m['stale']) for m in entries] == [(path, True)]
+    assert list_cache_entries(str(tmp_path), 'other') == []
+
+
+def test_prune_keeps_fresh_entries_of_each_params(tmp_path):
+
+    source = str(tmp_path / 'source.npy')
+    np.save(source, np.zeros(3))
+    touch(source, 10**18)
+
+    stale, _ = make_entry(tmp_path, source, 'cont', {'level': 0})
+    touch(source, 2 * 10**18)
+
+    # Same name, different parameters: all fresh and kept
+    fresh = [make_entry(tmp_path, source, 'cont', {'level': level})[0] for level in (0, 1, 2)]
+    streams = make_entry(tmp_path, source, 'streams', {'seeds': 'abc'})[0]
+
+    assert prune_cache(str(tmp_path), dry_run=True) == [stale]
+    assert os.path.exists(stale)
+
+    assert prune_cache(str(tmp_path)) == [stale]
+    assert not os.path.exists(stale) and not os.path.exists(stale + '.json')
+    assert all(os.path.exists(path) for path in fresh + [streams])
+    assert prune_cache(str(tmp_path)) == []
+
+
+def test_prune_keeps_latest_of_a_group(tmp_path):
+
+    sources = []
+    for n in range(3):
+        sources.append(str(tmp_path / ('source' + str(n) + '.npy')))
+        np.save(sources[-1], np.zeros(3))
+
+    # Fresh entries with the same name and parameters, built from other sources
+    paths = [make_entry(tmp_path, source, 'imstack', {'mask': False})[0] for source in sources]
+    for n, path in enumerate(paths):
+        manifest = read_manifest(path)
+        manifest['created'] = 1000.0 + n
+        with open(path + '.json', 'w') as f:
+            json.dump(manifest, f)
+
+    assert prune_cache(str(tmp_path), keep_latest=2) == [paths[0]]
+    assert prune_cache(str(tmp_path), keep_latest=1) == [paths[1]]
+    assert os.path.exists(paths[2])
+
+
+def test_folder_entries(tmp_path):
+
+    source = str(tmp_path / 'source.npy')
+    np.save(source, np.zeros(3))
+    touch(source, 10**18)
+
+    params = {'chunks': [8, 8, 8]}
+    key = cache_key([source], params)
+    path = cache_entry_path('store', key, '.chunks', str(tmp_path))
+    os.makedirs(path)
+    with open(os.path.join(path, 'data.bin'), 'wb') as f:
+        f.write(bytes(100))
+    write_manifest(path, 'store', key, [source], params)
+
+    assert is_fresh(path, key)
+    assert [m['nbytes'] for m in list_cache_entries(str(tmp_path))] == [100]
+
+    touch(source, 2 * 10**18)
+    assert prune_cache(str(tmp_path)) == [path]
+    assert not os.path.exists(path)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from heart_vis.chunk_store import write_chunked, ChunkedVolume
+
+
+@pytest.fixture(params=[None, 'zlib'])
+def stores(tmp_path, request):
+
+    rng = np.random.default_rng(0)
+    field = rng.normal(size=(21, 18, 11, 3)).astype(np.float32)
+    mask = (rng.random((21, 18, 11)) > 0.5).astype(np.uint8)
+
+    write_chunked(field, str(tmp_path / 'field.chunks'), chunk_shape=(8, 8, 4), compression=request.param)
+    write_chunked(mask, str(tmp_path / 'mask.chunks'), chunk_shape=(8, 8, 4), compression=request.param)
+
+    return (field, ChunkedVolume(str(tmp_path / 'field.chunks'))), (mask, ChunkedVolume(str(tmp_path / 'mask.chunks')))
+
+
+def test_round_trip(stores):
+
+    for array, store in stores:
+        assert store.shape == array.shape and store.dtype == array.dtype
+        np.testing.assert_array_equal(np.asarray(store), array)
+
+
+@pytest.mark.parametrize('key', [
+    (3, 4, 5),
+    (-1, 0, -2, 1),
+    (slice(2, 19), slice(None), slice(3, 9)),
+    (slice(None, None, -2), slice(1, 17, 3), 7),
+    (slice(15, 2, -1), 4, slice(None), slice(0, 2)),
+    (20,),
+])
+def test_window_indexing(stores, key):
+
+    (field, store), (mask, mask_store) = stores
+
+    np.testing.assert_array_equal(store[key], field[key])
+    np.testing.assert_array_equal(mask_store[key[:3]], mask[key[:3]])
+
+
+def test_array_indexing(stores):
+
+    (field, store), (mask, mask_store) = stores
+
+    rng = np.random.default_rng(1)
+    xs, ys, zs = [rng.integers(-s, s, (4, 5)) for s in field.shape[:3]]
+
+    for key in [(xs, ys, zs), (xs, ys, zs, 1), (xs, ys, zs, slice(0, 2)), (xs, 3, zs),
+                (7, ys[0], -1, 0), (xs[0], ys[0], zs[0], 2)]:
+        np.testing.assert_array_equal(store[key], field[key])
+
+    np.testing.assert_array_equal(mask_store[xs, ys, zs], mask[xs, ys, zs])
+
+
+def test_unsupported_keys(stores):
+
+    (field, store), _ = stores
+    xs = np.array([1, 2])
+
+    with pytest.raises(IndexError):
+        store[xs, slice(None), xs]
+    with pytest.raises(IndexError):
+        store[xs, xs, xs, np.array([0, 1])]
+    with pytest.raises(IndexError):
+        store[xs, xs, np.array([11, 0])]
+    with pytest.raises(IndexError):
+        store[21, 0, 0]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from heart_vis.continuation import build_continuation_mask, ContinuationMask
+from heart_vis.tracing import trace_streamlines
+
+FILT_VECT = [0, 0, 1]
+
+
+def reference(field, mask, inds, filt_vect):
+
+    inside = np.all((inds >= 0) & (inds < np.array(mask.shape)), axis=1)
+    valid = np.zeros(len(inds), bool)
+    xs, ys, zs = inds[inside].T
+    valid[inside] = (mask[xs, ys, zs] > 0) & ~np.all(field[xs, ys, zs] == filt_vect, axis=1)
+
+    return valid
+
+
+@pytest.mark.parametrize('filt_vect', [FILT_VECT, None])
+def test_contains(tmp_path, swirl, filt_vect):
+
+    field, mask, seeds = swirl
+    rng = np.random.default_rng(0)
+    inds = np.concatenate([rng.integers(-3, np.array(mask.shape) + 3, (5000, 3)),
+                           np.argwhere(np.all(field == FILT_VECT, axis=3)),
+                           [[-10**9, 0, 0], [0, 10**9, 0], [59, 59, 19], [60, 0, 0]]])
+    expected = reference(field, mask, inds, np.array(FILT_VECT) if filt_vect is not None else [np.nan] * 3)
+
+    for cont in (build_continuation_mask(field, mask, filt_vect, slab=7),
+                 build_continuation_mask(field, mask, filt_vect, path=str(tmp_path / 'cont'))):
+        np.testing.assert_array_equal(cont.contains(inds), expected)
+
+    assert isinstance(ContinuationMask(str(tmp_path / 'cont')).bits, np.memmap)
+
+
+def test_lookup_points(swirl):
+
+    field, mask, seeds = swirl
+    cont = build_continuation_mask(field, mask, FILT_VECT)
+
+    points = np.array([[-0.5, 3, 3], [59.99, 30.2, 10.7], [60.0, 30, 10], [np.nan, 1, 1], [np.inf, 1, 1]])
+    expected = [False, bool(mask[59, 30, 10]), False, False, False]
+
+    np.testing.assert_array_equal(cont.lookup(points), expected)
+
+
+@pytest.mark.parametrize('integrator', ['euler', 'rk2'])
+def test_tracing_with_continuation_mask(swirl, integrator):
+
+    field, mask, seeds = swirl
+    cont = build_continuation_mask(field, mask, FILT_VECT)
+
+    with_cont = trace_streamlines(field, mask, seeds, 1, n_points=40, angle_thresh=40, filt_vect=FILT_VECT,
+                                  cont=cont, integrator=integrator)
+    without = trace_streamlines(field, mask, seeds, 1, n_points=40, angle_thresh=40, filt_vect=FILT_VECT,
+                                integrator=integrator)
+
+    for a, b in zip(with_cont[0], without[0]):
+        np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(with_cont[2], without[2])
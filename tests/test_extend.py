@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from heart_vis.tracing import bi_trace, extend_streamlines, Streamlines
+from heart_vis.continuation import build_continuation_mask
+
+FILT_VECT = [0, 0, 1]
+ANGLE_THRESH = 40
+
+
+@pytest.mark.parametrize('integrator', ['euler', 'rk2', 'rk4'])
+def test_extend_matches_fresh_trace(swirl, tmp_path, integrator):
+
+    field, mask, seeds = swirl
+    cont = build_continuation_mask(field, mask, FILT_VECT)
+
+    short = bi_trace(field, mask, seeds, n_points=15, angle_thresh=30, n_workers=1, cont=cont,
+                     integrator=integrator)
+    short.save(str(tmp_path / 'short.npz'))
+    short = Streamlines(str(tmp_path / 'short.npz'))
+
+    full = bi_trace(field, mask, seeds, n_points=40, angle_thresh=ANGLE_THRESH, n_workers=1, cont=cont,
+                    integrator=integrator)
+    extended = extend_streamlines(field, mask, short, n_points=40, angle_thresh=ANGLE_THRESH, n_workers=1,
+                                  cont=cont, integrator=integrator)
+
+    assert np.any(np.diff(extended.offsets) > np.diff(short.offsets))
+    np.testing.assert_array_equal(extended.offsets, full.offsets)
+    np.testing.assert_allclose(extended.points, full.points, atol=1e-4)
+    np.testing.assert_array_equal(extended.stops, full.stops)
+    np.testing.assert_allclose(extended.state, full.state, atol=1e-4)
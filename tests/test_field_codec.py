@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from heart_vis.field_codec import (ENCODINGS, encode_vectors, decode_vectors, encode_field, QuantizedField,
+                                   streamline_drift)
+
+# Worst case angular error (degrees) of a decoded unit vector, see field_codec.py
+MAX_ERROR = {'int8': 0.4, 'oct8': 0.95, 'int16': 0.002, 'oct16': 0.004}
+
+
+def random_unit_vectors(n, seed=0):
+
+    vects = np.random.default_rng(seed).normal(size=(n, 3))
+
+    return vects / np.linalg.norm(vects, axis=1, keepdims=True)
+
+
+def angle_errors(vects, decoded):
+
+    cos = np.sum(vects * decoded, axis=1) / np.linalg.norm(decoded, axis=1)
+
+    return np.degrees(np.arccos(np.clip(cos, -1, 1)))
+
+
+@pytest.mark.parametrize('encoding', sorted(ENCODINGS))
+def test_round_trip_error_bound(encoding):
+
+    vects = random_unit_vectors(200000)
+    # Include the octahedron corners and edges, and the axes
+    vects = np.concatenate([vects, np.eye(3), -np.eye(3), [[1, 1, 0], [0, -1, 1], [-1, 0, -1]] / np.sqrt(2)])
+
+    decoded = decode_vectors(encode_vectors(vects, encoding), encoding, np.float64)
+
+    assert np.max(angle_errors(vects, decoded)) < MAX_ERROR[encoding]
+    np.testing.assert_allclose(np.linalg.norm(decoded, axis=1), 1, atol=1e-12)
+
+
+@pytest.mark.parametrize('encoding', sorted(ENCODINGS))
+def test_field_store_round_trip(tmp_path, encoding):
+
+    shape = (20, 12, 6)
+    field = random_unit_vectors(np.prod(shape), seed=1).reshape(shape + (3,)).astype(np.float32)
+
+    # Background and degenerate voxels are stored exactly
+    field[0:5, 0:3] = [1, 0, 0]
+    field[5:8, 0:3] = [0.2, 0.3, 0.5]
+    field[8, 0] = 0
+    field[9, 0] = np.nan
+
+    index = encode_field(field, str(tmp_path / encoding), encoding, slab=6)
+    encoded = QuantizedField(str(tmp_path / encoding))
+    decoded = np.asarray(encoded)
+
+    assert decoded.shape == field.shape and decoded.dtype == field.dtype
+    assert index['max_angle_error'] < MAX_ERROR[encoding] + 0.02 # float32 rounding
+
+    special = (np.sum(field, axis=-1) == 1) | ~np.all(np.isfinite(field), axis=-1) | np.all(field == 0, axis=-1)
+    np.testing.assert_array_equal(decoded[special], field[special])
+
+    # No tissue vector decodes as background
+    assert not np.any(np.sum(decoded[~special], axis=-1) == 1)
+
+    # Indexing decodes the same vectors
+    xs, ys, zs = np.array([3, 11, 19]), np.array([0, 5, 11]), np.array([2, 0, 5])
+    np.testing.assert_array_equal(encoded[xs, ys, zs], decoded[xs, ys, zs])
+    np.testing.assert_array_equal(encoded[4, 2:9, 1, 2], decoded[4, 2:9, 1, 2])
+
+
+def test_streamline_drift(swirl):
+
+    field, mask, seeds = swirl
+
+    drift16 = streamline_drift(field, mask, 'int16', n_seeds=100, n_points=40, integrator='euler')
+    drift8 = streamline_drift(field, mask, 'int8', n_seeds=100, n_points=40, integrator='euler')
+
+    assert drift16['n_lines'] == 200
+    assert drift16['mean'] <= drift8['mean']
+    assert drift16['median'] < 0.01
+
+
+@pytest.mark.parametrize('encoding', sorted(ENCODINGS))
+def test_store_size_and_slabs(tmp_path, encoding):
+
+    shape = (17, 9, 5)
+    field = random_unit_vectors(np.prod(shape), seed=2).reshape(shape + (3,)).astype(np.float32)
+    field[3:6] = [0, 1, 0]
+
+    encode_field(field, str(tmp_path / 'a'), encoding, slab=4)
+    encode_field(field, str(tmp_path / 'b'), encoding, slab=17)
+    a = QuantizedField(str(tmp_path / 'a'))
+    b = QuantizedField(str(tmp_path / 'b'))
+
+    # The slab size doesn't change the codes, or the palette
+    np.testing.assert_array_equal(a.codes, b.codes)
+    assert a.palette == b.palette == [(0.0, 1.0, 0.0)]
+
+    code_type, n_codes = ENCODINGS[encoding]
+    assert a.codes.nbytes / field.nbytes == np.dtype(code_type).itemsize * n_codes / 12
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from heart_vis.glyph_layout import glyph_fraction, glyph_grid_steps, sample_mask
+
+FILT_VECT = [0, 0, 1]
+
+
+def loop_grid_steps(window_x, window_y, depth, n_points):
+
+    # The original loop, shrinking x_steps one at a time from window_x
+    x_y_ratio = window_x / window_y
+    x_z_ratio = window_x / depth
+    x_steps = int(window_x)
+    n_voxels = window_x * window_y * depth
+
+    while n_voxels > n_points:
+        x_steps = x_steps - 1
+        y_steps = int(round(x_steps / x_y_ratio))
+        z_steps = int(round(x_steps / x_z_ratio))
+        n_voxels = x_steps * y_steps * z_steps
+
+    return x_steps, y_steps, z_steps
+
+
+@pytest.mark.parametrize('window', [(100, 100, 100), (400, 300, 50), (64, 200, 17), (37, 37, 120), (1000, 800, 600)])
+@pytest.mark.parametrize('n_points', [500, 5000, 20000, 75000])
+def test_grid_steps_match_loop(window, n_points):
+
+    if np.prod(window) <= n_points:
+        pytest.skip('no downsampling')
+
+    steps = glyph_grid_steps(*window, n_points)
+
+    assert steps == loop_grid_steps(*window, n_points)
+    assert np.prod(steps) <= n_points
+
+
+def test_grid_steps_random_windows():
+
+    rng = np.random.default_rng(0)
+
+    for window in rng.integers(5, 600, (300, 3)):
+        n_points = int(rng.integers(100, 100000))
+        if np.prod(window) > n_points:
+            assert glyph_grid_steps(*window, n_points) == loop_grid_steps(*window, n_points)
+
+
+def test_glyph_fraction(swirl):
+
+    field, mask, seeds = swirl
+    dims = (30, 30, 10, 40, 40, 10)
+
+    frac = glyph_fraction(field, mask, dims)
+
+    # Fraction of the cube in the mask and without FILT_VECT: the points are
+    # uniform in [10, 50] x [10, 50] x [5, 15] and rounded, so the voxels at the
+    # edges of the cube get half the weight of the others
+    inside = ((mask > 0) & ~np.all(field == FILT_VECT, axis=3))[10:51, 10:51, 5:16]
+    weights = [np.r_[0.5, np.ones(n - 2), 0.5] for n in inside.shape]
+    weight = weights[0][:, None, None] * weights[1][None, :, None] * weights[2][None, None, :]
+
+    assert frac == pytest.approx(np.sum(inside * weight) / np.sum(weight), abs=0.01)
+    assert glyph_fraction(field, mask, dims) == frac
+
+
+def test_sample_mask(swirl):
+
+    field, mask, seeds = swirl
+    n_mask = np.count_nonzero(mask)
+
+    points = sample_mask(mask, 3000, rng=0, slab=7)
+
+    assert points.shape == (3000, 3)
+    assert np.all(mask[tuple(points.T)] > 0)
+    assert len(np.unique(points, axis=0)) == 3000
+    assert np.all(np.diff(points[:, 0]) >= 0)
+
+    # Fewer mask voxels than points: all of them
+    points = sample_mask(mask, n_mask + 10, rng=0, slab=7)
+    np.testing.assert_array_equal(points, np.argwhere(mask > 0))
+
+    assert sample_mask(np.zeros((10, 10, 10), np.uint8), 100).shape == (0, 3)
+
+
+def test_sample_mask_uniform():
+
+    # A mask filling the left half of the slabs, and a sparse right half
+    mask = np.zeros((40, 20, 10), np.uint8)
+    mask[:20] = 1
+    mask[20:, ::4, ::2] = 1
+    n_mask = np.count_nonzero(mask)
+
+    counts = np.zeros(mask.shape)
+    n_runs, n_points = 200, 400
+    for i in range(n_runs):
+        np.add.at(counts, tuple(sample_mask(mask, n_points, rng=i, slab=16).T), 1)
+
+    # Each mask voxel is drawn with probability n_points / n_mask
+    expected = n_runs * n_points / n_mask
+    assert np.all(counts[mask == 0] == 0)
+    assert np.mean(counts[:20][mask[:20] > 0]) == pytest.approx(expected, rel=0.02)
+    assert np.mean(counts[20:][mask[20:] > 0]) == pytest.approx(expected, rel=0.05)
+
+    per_x = counts.sum(axis=(1, 2)) / mask.sum(axis=(1, 2))
+    assert np.all(np.abs(per_x - expected) < 5 * np.sqrt(expected / mask.sum(axis=(1, 2))))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import heart_vis.load_data as load_data
+from heart_vis.config import SEED
+from heart_vis.tracing import bi_trace
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+
+    source = tmp_path / 'source.npy'
+    np.save(source, np.zeros(3))
+
+    monkeypatch.setattr(load_data, 'LOAD_PATH', str(tmp_path) + '/')
+    monkeypatch.setattr(load_data, 'standardized_sources', lambda image_depth=0: [str(source)])
+    monkeypatch.setattr(load_data, 'N_STREAMLINES', 100)
+    monkeypatch.setattr(load_data, 'STREAM_LENGTH', 10)
+    monkeypatch.setattr(load_data, 'STREAM_SPACING', None)
+
+    return tmp_path
+
+
+def test_default_seed_is_cached(swirl, cache_dir, capsys):
+
+    field, mask, seeds = swirl
+    assert SEED is not None
+
+    first = load_data.load_streamlines(field, mask, image_depth=0)
+    assert 'Loading cached' not in capsys.readouterr().out
+
+    second = load_data.load_streamlines(field, mask, image_depth=0)
+    assert 'Loading cached streamlines' in capsys.readouterr().out
+
+    assert np.array_equal(first.offsets, second.offsets)
+    assert np.allclose(first.points, second.points, atol=1e-4)  # (saved as float32)
+
+
+def test_no_seed_is_not_cached(swirl, cache_dir, monkeypatch):
+
+    field, mask, seeds = swirl
+    monkeypatch.setattr(load_data, 'SEED', None)
+
+    load_data.load_streamlines(field, mask, image_depth=0)
+
+    assert not list(cache_dir.glob('*_streamlines*'))
+
+
+def test_default_seed_extends_cached(swirl, cache_dir, monkeypatch, capsys):
+
+    field, mask, seeds = swirl
+
+    short = load_data.load_streamlines(field, mask, image_depth=0)
+
+    # Raising the length extends the cached streamlines of the same seeds
+    monkeypatch.setattr(load_data, 'STREAM_LENGTH', 30)
+    capsys.readouterr()
+    extended = load_data.load_streamlines(field, mask, image_depth=0)
+    assert 'Extending' in capsys.readouterr().out
+    assert np.any(np.diff(extended.offsets) > np.diff(short.offsets))
+
+    pos = load_data.draw_seeds(field, mask, 100, rng=SEED)
+    full = bi_trace(field, mask, pos, n_points=30, angle_thresh=load_data.ANGLE_THRESH,
+                    integrator=load_data.INTEGRATOR)
+
+    np.testing.assert_array_equal(extended.offsets, full.offsets)
+    np.testing.assert_allclose(extended.points, full.points, atol=1e-4)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from heart_vis.occupancy import OccupancyGrid
+from heart_vis.tracing import trace_spaced
+
+
+def test_blocked_by_neighbouring_cells():
+
+    occ = OccupancyGrid((20, 20, 20), 4)  # cells of 2 voxels
+    occ.mark(np.array([[9.0, 9.0, 9.0]]), [0])  # cell (4,4,4)
+
+    points = np.array([[9.5, 9.5, 9.5],    # same cell
+                       [11.5, 9.0, 9.0],   # next cell in x
+                       [7.5, 7.5, 11.5],   # diagonal neighbour
+                       [13.0, 9.0, 9.0],   # two cells away
+                       [9.0, 9.0, 3.0]])   # three cells away
+
+    assert occ.blocked(points, np.full(5, 1)).tolist() == [True, True, True, False, False]
+    assert not np.any(occ.blocked(points, np.zeros(5, int)))
+
+
+def test_blocked_within_one_step():
+
+    occ = OccupancyGrid((20, 20, 20), 4)
+    points = np.array([[9.0, 9.0, 9.0],
+                       [11.0, 9.0, 9.0],   # next to the first, another seed
+                       [7.0, 7.0, 9.0],    # next to the first, same seed
+                       [17.0, 17.0, 17.0],
+                       [17.5, 17.0, 17.0]])  # same cell as the one before, another seed
+
+    blocked = occ.blocked(points, [0, 1, 0, 2, 3])
+
+    assert blocked.tolist() == [False, True, False, False, True]
+
+
+def test_spaced_seeds():
+
+    occ = OccupancyGrid((20, 20, 20), 4)
+    occ.mark(np.array([[1.0, 1.0, 1.0]]), [0])
+
+    points = np.array([[3.0, 1.0, 1.0],    # next to the marked cell
+                       [9.0, 9.0, 9.0],
+                       [10.5, 9.0, 9.0],   # next to the one before
+                       [15.0, 9.0, 9.0]])
+
+    assert occ.spaced(points).tolist() == [1, 3]
+
+
+def point_owners(streams):
+
+    _, owners = np.unique(streams.seeds, axis=0, return_inverse=True)
+
+    return np.repeat(owners.ravel(), np.diff(streams.offsets))
+
+
+@pytest.mark.parametrize('spacing', [2.0, 4.0])
+def test_minimum_spacing(swirl, spacing):
+
+    field, mask, seeds = swirl
+    streams = trace_spaced(field, mask, 500, spacing, rng=np.random.default_rng(1), batch=64)
+
+    points = streams.points
+    owners = point_owners(streams)
+    assert len(np.unique(owners)) > 50
+
+    # Points of different seeds are at least half the spacing apart
+    closest = np.inf
+    for i in range(0, len(points), 500):
+        dist = np.linalg.norm(points[i:i + 500, None] - points[None], axis=-1)
+        dist[owners[i:i + 500, None] == owners[None]] = np.inf
+        closest = min(closest, dist.min())
+
+    assert closest >= spacing / 2
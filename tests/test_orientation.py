@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import heart_vis.orientation as orientation
+from heart_vis.orientation import Orientation, OrientedField, standardize_arrays
+
+
+def loaded_arrays():
+
+    rng = np.random.default_rng(0)
+    volume = rng.integers(0, 4096, (9, 7, 6)).astype(np.uint16)
+    mask = (rng.random((10, 7, 5)) > 0.5).astype(np.uint8)
+    field = rng.normal(size=(9, 7, 8, 3)).astype(np.float32)
+
+    return volume, mask, field
+
+
+def baseline_standardize(volume, mask, field, rotate):
+
+    # The copying implementation that the Orientation views replace
+    shape = [min(a.shape[d] for a in (volume, mask, field)) for d in range(3)]
+    crop = tuple(slice(0, s) for s in shape)
+    volume, mask, field = volume[crop], mask[crop], field[crop].copy()
+
+    if(rotate):
+        volume = np.rot90(volume, 1, (1, 2))
+        mask = np.rot90(mask, 1, (1, 2))
+        field = np.rot90(field, 1, (1, 2)).copy()
+        field[:, :, :, [1, 2]] = field[:, :, :, [2, 1]]
+
+    return volume, mask, field
+
+
+@pytest.mark.parametrize('rotate', [False, True])
+def test_standardize_matches_baseline(monkeypatch, rotate):
+
+    monkeypatch.setattr(orientation, 'ROTATE', rotate)
+    volume, mask, field = loaded_arrays()
+
+    std = standardize_arrays(volume, mask, field)
+    ref = baseline_standardize(volume, mask, field, rotate)
+
+    for out, expected in zip(std, ref):
+        np.testing.assert_array_equal(np.asarray(out), expected)
+
+    # Views, not copies
+    assert np.shares_memory(std[0], volume) and np.shares_memory(std[1], mask)
+    assert isinstance(std[2], OrientedField) == rotate
+
+    # Voxels, windows and single components of the oriented field
+    np.testing.assert_array_equal(std[2][2, 3, 1], ref[2][2, 3, 1])
+    np.testing.assert_array_equal(std[2][1:4, :, 2:4, 1], ref[2][1:4, :, 2:4, 1])
+    np.testing.assert_array_equal(std[2][[0, 4], [1, 2], [3, 0]], ref[2][[0, 4], [1, 2], [3, 0]])
+    np.testing.assert_allclose(std[2].sum(axis=3), ref[2].sum(axis=3))
+
+
+def test_index_and_vector_mapping():
+
+    orient = Orientation(((1, 8), (0, 7), (2, 6))).rotate90((1, 2)).swizzle((0, 2, 1))
+    rng = np.random.default_rng(1)
+    field = rng.normal(size=(9, 7, 8, 3))
+    std = np.asarray(orient.field_view(field))
+
+    inds = np.stack([rng.integers(0, s, 20) for s in orient.shape], axis=1)
+    loaded = orient.to_loaded(inds)
+
+    np.testing.assert_array_equal(orient.from_loaded(loaded), inds)
+    np.testing.assert_array_equal(orient.to_loaded_vectors(std[tuple(inds.T)]), field[tuple(loaded.T)])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from heart_vis.pyramid import (level_factor, select_level, coarse_to_fine, downsample, downsample_volume,
+                               downsample_mask, downsample_field, coarse_shape)
+
+
+def test_coarse_to_fine():
+
+    assert level_factor(0) == 1 and level_factor(3) == 8
+    np.testing.assert_array_equal(coarse_to_fine([[0, 1, 2]], 0), [[0, 1, 2]])
+    # Level 1 voxel i covers voxels 2i and 2i+1
+    np.testing.assert_array_equal(coarse_to_fine([[0, 1, 2]], 1), [[0.5, 2.5, 4.5]])
+
+
+def test_select_level():
+
+    cube = (0, 0, 0, 64, 64, 32)
+    assert select_level(cube, 64 * 64 * 32, max_level=4) == 0
+    assert select_level(cube, 64 * 64 * 32 // 8, max_level=4) == 1
+    assert select_level(cube, 64 * 64 * 32 // 8 + 1, max_level=4) == 0
+    assert select_level(cube, 1, max_level=2) == 2
+
+
+def test_downsample_volume_and_mask():
+
+    volume = np.arange(5 * 4 * 3, dtype=np.uint16).reshape(5, 4, 3)
+    mask = np.zeros((5, 4, 3), np.uint8)
+    mask[4, 3, 2] = 1
+
+    coarse = downsample_volume(volume)
+    assert coarse.shape == coarse_shape(volume.shape) == (3, 2, 2) and coarse.dtype == volume.dtype
+    assert coarse[0, 0, 0] == np.round(np.mean(volume[:2, :2, :2]))
+    # Partial blocks at the edges average only the voxels they contain
+    assert coarse[2, 1, 1] == np.round(volume[4, 2:4, 2].mean())
+
+    assert np.array_equal(np.argwhere(downsample_mask(mask)), [[2, 1, 1]])
+
+
+def test_downsample_field():
+
+    field = np.zeros((4, 2, 2, 3), np.float32)
+    field[:] = [0.2, 0.3, 0.5] # Background (components sum to 1)
+    field[0, 0, 0] = [0.6, 0.8, 0]
+    field[1, 1, 1] = [-0.6, -0.8, 0] # Opposite sign, same orientation
+    field[0, 1, 0] = [0.8, -0.6, 0]
+
+    coarse = downsample_field(field)
+
+    assert coarse.shape == (2, 1, 1, 3) and coarse.dtype == field.dtype
+    # Signs are aligned to the first tissue vector before averaging, background vectors are ignored
+    mean = 2 * np.array([0.6, 0.8, 0]) + [0.8, -0.6, 0]
+    np.testing.assert_allclose(coarse[0, 0, 0], mean / np.linalg.norm(mean), atol=1e-6)
+    # A block without tissue keeps its background vector
+    np.testing.assert_array_equal(coarse[1, 0, 0], field[2, 0, 0])
+
+
+@pytest.mark.parametrize('slab', [1, 3, 32])
+def test_downsample_in_slabs(slab):
+
+    volume = np.random.default_rng(0).random((13, 6, 5)).astype(np.float32)
+    out = np.empty(coarse_shape(volume.shape), np.float32)
+
+    np.testing.assert_array_equal(downsample(volume, downsample_volume, out, slab=slab), downsample_volume(volume))
@@ -0,0 +1,124 @@
+import numpy as np
+
+from heart_vis.convenience_funcs import (rotation_matrix_from_vectors, rotation_matrices_from_vectors,
+                                         rotation_quaternions_from_vectors, rot2eul, rot2euls)
+
+DEF_VECT = [0, 0, 1]
+
+
+def reference_matrix(vec1, vec2):
+
+    # The original one-vector rotation_matrix_from_vectors()
+    a, b = (vec1 / np.linalg.norm(vec1)).reshape(3), (vec2 / np.linalg.norm(vec2)).reshape(3)
+    v = np.cross(a, b)
+    c = np.dot(a, b)
+    s = np.linalg.norm(v)
+    kmat = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
+
+    return np.eye(3) + kmat + kmat.dot(kmat) * ((1 - c) / (s ** 2))
+
+
+def reference_euler(R):
+
+    # The original one-matrix rot2eul()
+    beta = -np.arcsin(R[2, 0])
+    alpha = np.arctan2(R[2, 1] / np.cos(beta), R[2, 2] / np.cos(beta))
+    gamma = np.arctan2(R[1, 0] / np.cos(beta), R[0, 0] / np.cos(beta))
+
+    return np.array((alpha, beta, gamma))
+
+
+def euler_matrix(eul):
+
+    # XYZ euler angles (as Blender applies them) to a rotation matrix
+    a, b, g = eul
+    rx = np.array([[1, 0, 0], [0, np.cos(a), -np.sin(a)], [0, np.sin(a), np.cos(a)]])
+    ry = np.array([[np.cos(b), 0, np.sin(b)], [0, 1, 0], [-np.sin(b), 0, np.cos(b)]])
+    rz = np.array([[np.cos(g), -np.sin(g), 0], [np.sin(g), np.cos(g), 0], [0, 0, 1]])
+
+    return rz @ ry @ rx
+
+
+def quaternion_matrix(q):
+
+    w, x, y, z = q
+
+    return np.array([[1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+                     [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+                     [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)]])
+
+
+def assert_rotations(mats):
+
+    assert np.all(np.isfinite(mats))
+    np.testing.assert_allclose(mats @ mats.transpose(0, 2, 1), np.broadcast_to(np.eye(3), mats.shape), atol=1e-9)
+    np.testing.assert_allclose(np.linalg.det(mats), 1, atol=1e-9)
+
+
+def test_matrices_match_single_vector():
+
+    vecs = np.random.default_rng(0).normal(size=(500, 3)) * [1, 1, 3]
+    mats = rotation_matrices_from_vectors(vecs, DEF_VECT)
+
+    assert_rotations(mats)
+    for vec, mat in zip(vecs, mats):
+        np.testing.assert_allclose(mat, reference_matrix(vec, np.array(DEF_VECT)), atol=1e-9)
+        np.testing.assert_allclose(rotation_matrix_from_vectors(vec, DEF_VECT), mat, atol=1e-12)
+
+    # Each vector's direction is rotated onto vec2
+    units = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    np.testing.assert_allclose(np.einsum('nij,nj->ni', mats, units), np.tile(DEF_VECT, (500, 1)), atol=1e-9)
+
+
+def test_degenerate_vectors():
+
+    vecs = np.array([[0, 0, 2], [0, 0, -1], [0, 0, 0], [1e-9, 0, 1], [1e-9, 0, -1], [0, 1e-12, -3]])
+    mats = rotation_matrices_from_vectors(vecs, DEF_VECT)
+
+    assert_rotations(mats)
+    np.testing.assert_allclose(mats[0], np.eye(3))
+    np.testing.assert_allclose(mats[2], np.eye(3))
+
+    units = vecs[[0, 1, 3, 4, 5]] / np.linalg.norm(vecs[[0, 1, 3, 4, 5]], axis=1, keepdims=True)
+    np.testing.assert_allclose(np.einsum('nij,nj->ni', mats[[0, 1, 3, 4, 5]], units),
+                               np.tile(DEF_VECT, (5, 1)), atol=1e-9)
+
+
+def test_quaternions_match_matrices():
+
+    vecs = np.concatenate([np.random.default_rng(1).normal(size=(200, 3)), [[0, 0, 1], [0, 0, -1], [0, 0, 0]]])
+    mats = rotation_matrices_from_vectors(vecs, DEF_VECT)
+    quats = rotation_quaternions_from_vectors(vecs, DEF_VECT)
+
+    np.testing.assert_allclose(np.linalg.norm(quats, axis=1), 1)
+
+    # Antiparallel vectors may use another half turn, that also maps the vector onto vec2
+    for mat, quat in zip(mats[:201], quats[:201]):
+        np.testing.assert_allclose(quaternion_matrix(quat), mat, atol=1e-9)
+    np.testing.assert_allclose(quaternion_matrix(quats[201]) @ [0, 0, -1], DEF_VECT, atol=1e-9)
+    np.testing.assert_allclose(quaternion_matrix(quats[202]), np.eye(3))
+
+
+def test_euler_angles_match_single_matrix():
+
+    vecs = np.random.default_rng(2).normal(size=(500, 3))
+    mats = rotation_matrices_from_vectors(vecs, DEF_VECT)
+    euls = rot2euls(mats)
+
+    for mat, eul in zip(mats, euls):
+        np.testing.assert_allclose(eul, reference_euler(mat), atol=1e-9)
+        np.testing.assert_allclose(rot2eul(mat), eul, atol=1e-12)
+        np.testing.assert_allclose(euler_matrix(eul), mat, atol=1e-9)
+
+
+def test_euler_angles_at_gimbal_lock():
+
+    # beta = +-90 degrees, where the original rot2eul() divided by cos(beta) = 0
+    mats = np.array([euler_matrix((a, s * np.pi / 2, g)) for a, g in [(0.3, 0.5), (-1.2, 2.0), (0, 0)]
+                     for s in (1, -1)])
+    euls = rot2euls(mats)
+
+    assert np.all(np.isfinite(euls))
+    np.testing.assert_allclose(euls[:, 2], 0)
+    for mat, eul in zip(mats, euls):
+        np.testing.assert_allclose(euler_matrix(eul), mat, atol=1e-7)
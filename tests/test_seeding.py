@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from heart_vis.seeding import build_tissue_index, TissueIndex, region_bounds, sample_seeds, reservoir_seeds
+
+
+def field_and_mask(shape=(40, 30, 21), seed=0):
+
+    rng = np.random.default_rng(seed)
+    field = rng.normal(size=shape + (3,)).astype(np.float32)
+    background = rng.random(shape) < 0.4
+    field[background] = [0.2, 0.3, 0.5] # Components sum to 1
+    mask = (rng.random(shape) < 0.7).astype(np.uint8)
+
+    return field, mask
+
+
+def valid_voxels(field, mask, region=None):
+
+    valid = (mask > 0) & (np.sum(field, axis=3) != 1)
+    if region is not None:
+        valid &= region
+
+    return valid
+
+
+def test_tissue_index(tmp_path):
+
+    field, mask = field_and_mask()
+    tissue = np.argwhere(np.sum(field, axis=3) != 1)
+
+    for index in (build_tissue_index(field, slab=7), build_tissue_index(field, str(tmp_path / 'tissue'))):
+
+        assert index.count == len(tissue)
+        ranks = np.array([0, 5, len(tissue) - 1, 17, 5])
+        np.testing.assert_array_equal(index.rank_to_index(ranks), tissue[ranks])
+        assert np.all(index.contains(tissue))
+
+        pos = index.sample(500, np.random.default_rng(1))
+        assert len(np.unique(pos, axis=0)) == 500 and np.all(index.contains(pos))
+
+    assert isinstance(TissueIndex(str(tmp_path / 'tissue')).bits, np.memmap)
+
+
+def test_region_bounds():
+
+    shape = (40, 30, 21)
+    xx, yy, zz = np.meshgrid(np.arange(5, 9), np.arange(-2, 4), np.arange(18, 25))
+
+    assert [b.tolist() for b in region_bounds(shape)] == [[0, 0, 0], [40, 30, 21]]
+    assert [b.tolist() for b in region_bounds(shape, (xx, yy, zz))] == [[5, 0, 18], [9, 4, 21]]
+    assert [b.tolist() for b in region_bounds(shape, ((1, 3), (2, 50), (0, 4)))] == [[1, 2, 0], [3, 30, 4]]
+
+
+@pytest.mark.parametrize('batch', [64, 65536])
+def test_sample_seeds_valid_and_distinct(batch):
+
+    field, mask = field_and_mask()
+    tissue = build_tissue_index(field)
+    region = np.zeros(mask.shape, bool)
+    region[10:30, 5:20] = True
+
+    for reg, kw in [(None, {}), (None, {'tissue': tissue}), (((3, 17), (0, 30), (4, 9)), {}), (region, {})]:
+
+        pos = sample_seeds(field, mask, 300, region=reg, rng=2, batch=batch, **kw)
+
+        assert pos.shape == (300, 3) and len(np.unique(pos, axis=0)) == 300
+        valid = valid_voxels(field, mask, region if reg is region else None)
+        assert np.all(valid[tuple(pos.T)])
+
+        lo, hi = region_bounds(mask.shape, reg)
+        assert np.all((pos >= lo) & (pos < hi))
+
+
+def test_sparse_region_falls_back_to_scan():
+
+    field, mask = field_and_mask()
+    mask[:] = 0
+    mask[::7, ::5, ::4] = 1
+    field[::7, ::5, ::4] = [0, 0.6, 0.8]
+    n_valid = int(np.sum(valid_voxels(field, mask)))
+
+    # Too few accepted candidates in max_rounds, then the region is scanned
+    pos = sample_seeds(field, mask, 100, rng=3, batch=256, max_rounds=1)
+    assert len(np.unique(pos, axis=0)) == 100 and np.all(valid_voxels(field, mask)[tuple(pos.T)])
+
+    # All the valid voxels, if there are fewer than requested
+    pos = sample_seeds(field, mask, n_valid + 10, rng=3, batch=256)
+    assert len(np.unique(pos, axis=0)) == n_valid
+
+
+def test_seeds_are_uniform():
+
+    field, mask = field_and_mask((12, 10, 9))
+    valid = np.argwhere(valid_voxels(field, mask))
+    counts = np.zeros(mask.shape)
+
+    n_draws = 400
+    for r in range(n_draws):
+        lo, hi = np.zeros(3, int), np.array(mask.shape)
+        pos = reservoir_seeds(field, mask, 50, lo, hi, rng=r)
+        counts[tuple(pos.T)] += 1
+
+    # Each valid voxel is drawn with probability 50 / len(valid)
+    expected = n_draws * 50 / len(valid)
+    freq = counts[tuple(valid.T)]
+    assert np.sum(counts) == n_draws * 50
+    assert np.max(np.abs(freq - expected)) < 6 * np.sqrt(expected)
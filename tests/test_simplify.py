@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from heart_vis.simplify import simplify_lines, simplify_streamlines, segment_distances
+from heart_vis.tracing import bi_trace
+
+
+def rdp(line, tol):
+
+    '''
+    Recursive Ramer-Douglas-Peucker on one line, as the reference: indices of
+    the kept points.
+    '''
+
+    if len(line) < 3:
+        return list(range(len(line)))
+
+    n = len(line) - 1
+    dist = segment_distances(line[1:-1], np.repeat(line[:1], n - 1, 0), np.repeat(line[-1:], n - 1, 0))
+    i = int(np.argmax(dist)) + 1
+
+    if dist[i - 1] <= tol:
+        return [0, n]
+
+    return rdp(line[:i + 1], tol)[:-1] + [i + j for j in rdp(line[i:], tol)]
+
+
+def random_walks(rng, lengths):
+
+    lines = [np.cumsum(rng.normal(size=(n, 3)) * [1, 1, 0.2] + [0.5, 0, 0], axis=0) for n in lengths]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    return lines, np.concatenate(lines), offsets
+
+
+def removed_deviations(lines, keep, offsets):
+
+    devs = [0.0]
+
+    for i, line in enumerate(lines):
+        kept = np.flatnonzero(keep[offsets[i]:offsets[i + 1]])
+        for a, b in zip(kept[:-1], kept[1:]):
+            if b - a > 1:
+                devs.extend(segment_distances(line[a + 1:b], np.repeat(line[a:a + 1], b - a - 1, 0),
+                                              np.repeat(line[b:b + 1], b - a - 1, 0)))
+
+    return np.array(devs)
+
+
+@pytest.mark.parametrize('tol', [0.1, 0.5, 2.0])
+def test_matches_recursive_rdp(tol):
+
+    rng = np.random.default_rng(0)
+    lines, points, offsets = random_walks(rng, [0, 1, 2, 3, 5, 40, 200] + list(rng.integers(1, 60, 50)))
+
+    keep, max_dev = simplify_lines(points, offsets, tol)
+
+    for i, line in enumerate(lines):
+        expected = np.zeros(len(line), bool)
+        expected[rdp(line, tol)] = True
+        np.testing.assert_array_equal(keep[offsets[i]:offsets[i + 1]], expected)
+
+    # The endpoints are kept, and the removed points are within the tolerance
+    lengths = np.diff(offsets)
+    assert np.all(keep[offsets[:-1][lengths > 0]]) and np.all(keep[offsets[1:][lengths > 0] - 1])
+
+    devs = removed_deviations(lines, keep, offsets)
+    assert np.all(devs <= tol)
+    assert max_dev == pytest.approx(devs.max())
+
+
+def test_straight_line():
+
+    line = np.arange(10)[:, None] * np.array([[1.0, 2.0, 0.5]])
+    keep, max_dev = simplify_lines(line, [0, 10], 1e-6)
+
+    assert np.flatnonzero(keep).tolist() == [0, 9]
+    assert max_dev < 1e-9
+
+
+def test_simplify_streamlines(swirl):
+
+    field, mask, seeds = swirl
+    streams = bi_trace(field, mask, seeds, n_points=40, angle_thresh=40, n_workers=1)
+
+    simple = simplify_streamlines(streams, 0.5)
+    keep, max_dev = simplify_lines(streams.points, streams.offsets, 0.5)
+
+    assert len(simple) == len(streams)
+    assert len(simple.points) == np.sum(keep) < len(streams.points)
+
+    for i in range(len(streams)):
+        line = streams.points[streams.offsets[i]:streams.offsets[i + 1]]
+        kept = keep[streams.offsets[i]:streams.offsets[i + 1]]
+        np.testing.assert_array_equal(simple.points[simple.offsets[i]:simple.offsets[i + 1]], line[kept])
+
+    np.testing.assert_array_equal(simple.cmap_vals, streams.cmap_vals)
+    np.testing.assert_array_equal(simple.seeds, streams.seeds)
+
+    assert simplify_streamlines(streams, None) is streams
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+
+import heart_vis.load_data as load_data
+from heart_vis.load_data import read_tif_stack
+from heart_vis.tif_decode import decode_tif_pages, stacked_slices, EOF
+
+
+def write_tif(path, n_pages, shape=(30, 20)):
+
+    pages = [Image.fromarray(np.full(shape, i + 1, dtype=np.uint16)) for i in range(n_pages)]
+    pages[0].save(str(path), save_all=True, append_images=pages[1:])
+
+
+def assert_page_values(imstack):
+
+    # Slice k holds page k (value k + 1), without empty slices
+    assert np.array_equal(imstack[0, 0, :], np.arange(1, imstack.shape[2] + 1))
+    assert np.all(imstack == imstack[:1, :1, :])
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_read_tif_stack(tmp_path, n_workers):
+
+    write_tif(tmp_path / 'stack.tif', 8)
+
+    imstack = read_tif_stack(str(tmp_path / 'stack.tif'), 6, n_workers=n_workers)
+
+    assert imstack.shape == (30, 20, 6) and imstack.flags['F_CONTIGUOUS']
+    assert_page_values(imstack)
+
+
+@pytest.mark.filterwarnings('ignore:Corrupt EXIF')
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_truncated_tif_stops_at_end(tmp_path, n_workers):
+
+    write_tif(tmp_path / 'stack.tif', 8)
+    data = (tmp_path / 'stack.tif').read_bytes()
+
+    for cut in (0.55, 0.8, 0.95):
+        (tmp_path / 'cut.tif').write_bytes(data[:int(len(data) * cut)])
+        out_file = str(tmp_path / 'cut.npy')
+
+        imstack = read_tif_stack(str(tmp_path / 'cut.tif'), 8, out_file=out_file, n_workers=n_workers)
+
+        assert 0 < imstack.shape[2] < 8
+        assert_page_values(imstack)
+        assert np.array_equal(np.load(out_file), imstack)
+        assert sorted(os.listdir(tmp_path)) == ['cut.npy', 'cut.tif', 'stack.tif']
+        del imstack
+
+
+def test_decode_skips_unreadable_pages():
+
+    class Pages:
+
+        # Page 2 can't be decoded, the file ends at page 4
+        def seek(self, i):
+            if i >= 4:
+                raise EOFError
+            self.i = i
+
+        def __array__(self, dtype=None, copy=None):
+            if self.i == 2:
+                raise OSError('image file is truncated')
+            return np.full((3, 2), self.i + 1)
+
+    imstack = np.zeros((3, 2, 6))
+    timings = decode_tif_pages(Pages(), imstack, list(enumerate(range(6))))
+
+    assert [k for k, i, dt in timings] == [0, 1, 2, 3, 4]
+    assert timings[2][2] is None and timings[4][2] == EOF
+    assert stacked_slices(timings, 6) == [0, 1, 3]
+
+
+def test_interrupted_read_leaves_no_cache_file(tmp_path, monkeypatch):
+
+    write_tif(tmp_path / 'stack.tif', 4)
+    out_file = str(tmp_path / 'stack.npy')
+
+    def interrupted(img, imstack, slots):
+        imstack[:, :, 0] = 1
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(load_data, 'decode_tif_pages', interrupted)
+
+    with pytest.raises(KeyboardInterrupt):
+        read_tif_stack(str(tmp_path / 'stack.tif'), 4, out_file=out_file, n_workers=1)
+
+    assert not os.path.exists(out_file)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from heart_vis.tracing import trace_streamlines, trace_parallel, bi_trace
+from heart_vis.continuation import build_continuation_mask
+
+FILT_VECT = [0, 0, 1]
+ANGLE_THRESH = 40
+
+
+def assert_same_lines(lines, ref_lines):
+
+    assert len(lines) == len(ref_lines)
+
+    for line, ref in zip(lines, ref_lines):
+        np.testing.assert_array_equal(line, ref)
+
+
+@pytest.mark.parametrize('integrator', ['euler', 'rk4'])
+def test_trace_parallel_matches_serial(swirl, integrator):
+
+    field, mask, seeds = swirl
+    cont = build_continuation_mask(field, mask, FILT_VECT)
+
+    serial = trace_streamlines(field, mask, seeds, 1, n_points=40, angle_thresh=ANGLE_THRESH,
+                               cont=cont, integrator=integrator)
+    parallel = trace_parallel(field, mask, seeds, 1, n_points=40, angle_thresh=ANGLE_THRESH,
+                              n_workers=2, chunk_size=32, cont=cont, integrator=integrator)
+
+    assert_same_lines(parallel[0], serial[0])
+    np.testing.assert_array_equal(parallel[1], serial[1])
+    np.testing.assert_array_equal(parallel[2], serial[2])
+    np.testing.assert_array_equal(parallel[3], serial[3])
+
+
+def test_bi_trace_workers(swirl):
+
+    field, mask, seeds = swirl
+
+    serial = bi_trace(field, mask, seeds, n_points=30, angle_thresh=ANGLE_THRESH, n_workers=1)
+    parallel = bi_trace(field, mask, seeds, n_points=30, angle_thresh=ANGLE_THRESH, n_workers=3)
+
+    for name in ('points', 'offsets', 'cmap_vals', 'signs', 'seeds', 'stops', 'state'):
+        np.testing.assert_array_equal(getattr(parallel, name), getattr(serial, name))
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from heart_vis.tracing import trace_streamlines, STOP_REASONS
+
+FILT_VECT = [0, 0, 1]
+ANGLE_THRESH = 40
+
+
+def calc_angle(point1, point2, point3):
+
+    '''
+    convenience_funcs.calc_angle(), with the cosine clipped to [-1, 1]: for
+    collinear segments (consecutive steps in one voxel) it can round to just
+    above 1, where the original loop got a nan angle and stopped.
+    '''
+
+    vec1 = np.subtract(point2, point1)
+    vec2 = np.subtract(point3, point2)
+    cos = np.dot(vec1 / np.linalg.norm(vec1), vec2 / np.linalg.norm(vec2))
+
+    return np.degrees(np.arccos(np.clip(cos, -1, 1)))
+
+
+def per_seed_streamline(field, mask, seed, sign, n_points, angle_thresh, filt_vect):
+
+    '''
+    The original streamline loop (one seed at a time), as the reference for the
+    batched Euler tracer.
+    '''
+
+    x, y, z = seed
+    coord_list = [[x, y, z]]
+
+    for i in range(n_points):
+
+        if not ((0 <= x < field.shape[0]) and (0 <= y < field.shape[1]) and (0 <= z < field.shape[2])):
+            break
+
+        dx, dy, dz = field[int(np.floor(x)), int(np.floor(y)), int(np.floor(z))]
+
+        if(i > 1):
+            # Choose the direction making the smallest angle with the last segment
+            pos = (x + dx, y + dy, z + dz)
+            neg = (x - dx, y - dy, z - dz)
+            angle_pos = calc_angle(coord_list[-2], coord_list[-1], pos)
+            angle_neg = calc_angle(coord_list[-2], coord_list[-1], neg)
+
+            if abs(angle_neg) > abs(angle_pos):
+                (xi, yi, zi), seg_angle = pos, angle_pos
+            else:
+                (xi, yi, zi), seg_angle = neg, angle_neg
+
+            cond_angle = abs(seg_angle) < angle_thresh
+
+        else:
+            cond_angle = True
+            xi, yi, zi = x + dx * sign, y + dy * sign, z + dz * sign
+
+        if (0 <= xi < field.shape[0]) and (0 <= yi < field.shape[1]) and (0 <= zi < field.shape[2]):
+            cond_mask = mask[int(xi), int(yi), int(zi)] > 0
+            cond_filt = not np.array_equal(field[int(xi), int(yi), int(zi)], filt_vect)
+        else:
+            cond_mask = cond_filt = False
+
+        if not (cond_mask and cond_angle and cond_filt):
+            break
+
+        coord_list.append([xi, yi, zi])
+        x, y, z = xi, yi, zi
+
+    return np.asarray(coord_list, dtype=np.float64)
+
+
+def assert_same_lines(lines, ref_lines, atol=1e-4):
+
+    assert len(lines) == len(ref_lines)
+
+    for line, ref in zip(lines, ref_lines):
+        assert line.shape == ref.shape
+        np.testing.assert_allclose(line, ref, atol=atol)
+
+
+@pytest.mark.parametrize('sign', [1, -1])
+def test_euler_matches_per_seed_loop(swirl, sign):
+
+    field, mask, seeds = swirl
+
+    lines, cmap_vals, stops, state = trace_streamlines(field, mask, seeds, sign, n_points=40,
+                                                       angle_thresh=ANGLE_THRESH, filt_vect=FILT_VECT,
+                                                       integrator='euler')
+
+    ref = [per_seed_streamline(field, mask, seed, sign, 40, ANGLE_THRESH, FILT_VECT) for seed in seeds]
+
+    assert_same_lines(lines, ref)
+    np.testing.assert_allclose(cmap_vals, np.arccos(np.abs(field[tuple(seeds.T)][:, 2])), atol=1e-6)
+
+    # The streamlines that stopped early stopped for a reason other than their length
+    lengths = np.array([len(line) for line in lines])
+    assert np.all((stops == STOP_REASONS.index('length')) == (lengths == 41))